@@ -5,8 +5,8 @@ import numpy as np
 from PIL import Image, ImageOps
 import onnxruntime as ort
 
-print(f"Current Working Directory: {os.getcwd()}")
-print(f"File exists check: {os.path.exists('app/models/model.onnx')}")
+from instrumentation import metrics
+
 # ==========================================
 # 1. 配置参数
 # ==========================================
@@ -14,19 +14,112 @@ print(f"File exists check: {os.path.exists('app/models/model.onnx')}")
 MODEL_INPUT_SIZE = 448 
 THRESHOLD_DEFAULT = 0.35 # 默认置信度阈值
 
+# 缩放方式：直接拉伸 / 保持长宽比并填充 (Letterbox)
+RESIZE_STRETCH = 'stretch'
+RESIZE_LETTERBOX = 'letterbox'
+LETTERBOX_FILL = (255, 255, 255) # WD14 系列训练时使用白色填充
+
+class Preprocessor:
+    """
+    图片预处理，直接写入预分配的输入张量 (B, 3, S, S) 或 (B, S, S, 3)：
+    - 缓冲区只分配一次，重复使用，不再每张图产生多个整图大小的临时数组
+    - 归一化 (/255) 与 HWC->CHW 转置在一次 ufunc 中完成 (转置只是视图)
+    - 支持 float16 输入
+    """
+    def __init__(self, size: int = MODEL_INPUT_SIZE, resize_mode: str = RESIZE_STRETCH,
+                 dtype=np.float32, channels_last: bool = False, batch_size: int = 1):
+        self.size = size
+        self.resize_mode = resize_mode
+        self.dtype = np.dtype(dtype)
+        self.channels_last = channels_last
+        self.batch_size = max(1, batch_size)
+        self._buffer = None
+        self._scale = self.dtype.type(1.0 / 255.0)
+
+    def buffer(self, n: int = None) -> np.ndarray:
+        """返回前 n 个槽位的视图 (注意：下次写入会覆盖内容)"""
+        if self._buffer is None:
+            if self.channels_last:
+                shape = (self.batch_size, self.size, self.size, 3)
+            else:
+                shape = (self.batch_size, 3, self.size, self.size)
+            self._buffer = np.empty(shape, dtype=self.dtype)
+        return self._buffer if n is None else self._buffer[:n]
+
+    def load_image(self, image_path: str) -> Image.Image:
+        """加载并缩放到模型输入尺寸 (RGB, S x S)"""
+        with metrics.timer('tagger.decode'):
+            image = Image.open(image_path)
+            image.load()
+            # 处理 Exif 旋转
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+
+        with metrics.timer('tagger.resize'):
+            return self._resize(image)
+
+    def _resize(self, image: Image.Image) -> Image.Image:
+        if self.resize_mode == RESIZE_LETTERBOX:
+            image.thumbnail((self.size, self.size), Image.Resampling.LANCZOS)
+            if image.size != (self.size, self.size):
+                canvas = Image.new('RGB', (self.size, self.size), LETTERBOX_FILL)
+                canvas.paste(image, ((self.size - image.width) // 2, (self.size - image.height) // 2))
+                image = canvas
+        else:
+            image = image.resize((self.size, self.size), Image.Resampling.LANCZOS)
+        return image
+
+    def write(self, image: Image.Image, index: int = 0):
+        """把已缩放的 RGB 图片写入缓冲区第 index 个槽位"""
+        with metrics.timer('tagger.normalize'):
+            arr = np.asarray(image, dtype=np.uint8)
+            src = arr if self.channels_last else arr.transpose(2, 0, 1)
+            np.multiply(src, self._scale, out=self.buffer()[index], dtype=self.dtype, casting='unsafe')
+
+    def process(self, image_path: str, index: int = 0) -> bool:
+        try:
+            self.write(self.load_image(image_path), index)
+            return True
+        except Exception as e:
+            print(f"Error preprocessing image {image_path}: {e}")
+            metrics.count('tagger.preprocess_errors')
+            return False
+
 class TaggerEngine:
-    def __init__(self, model_path: str, tags_path: str):
+    def __init__(self, model_path: str, tags_path: str, resize_mode: str = RESIZE_STRETCH,
+                 input_dtype=None, batch_size: int = 1, providers=None, pre_optimized: bool = False):
+        """
+        resize_mode: RESIZE_STRETCH / RESIZE_LETTERBOX，按模型选择
+        input_dtype: None 表示按模型输入类型自动选择 (float16 / float32)
+        batch_size: predict_batch 每次推理的图片数 (模型 batch 维固定为 1 时强制为 1)
+        providers: 执行提供者列表，None 表示优先 DirectML 再 CPU (int8 量化模型应只用 CPU)
+        pre_optimized: 模型已经是序列化的优化图 (model_tools.optimize_graph)，加载时跳过图优化
+        """
         self.model_path = model_path
         self.tags_path = tags_path
         self.tags_list = []
+        self.tag_names = []
         self.session = None
         self.input_name = None
+        self.resize_mode = resize_mode
+        self.input_dtype = input_dtype
+        self.batch_size = batch_size
+        self.providers = providers
+        self.pre_optimized = pre_optimized
+        self.preprocessor = None
+        self.dynamic_batch = False
+        self.threshold = THRESHOLD_DEFAULT
+        # 由 ModelRegistry 填写，用于记录标签来自哪个模型
+        self.model_name = os.path.splitext(os.path.basename(model_path))[0]
+        self.file_hash = None
         
         # 1. 加载标签列表
         self.load_tags()
         
         # 2. 初始化 ONNX Runtime Session (DirectML)
-        self.init_session()
+        with metrics.timer('tagger.session_init'):
+            self.init_session()
 
     def load_tags(self):
         """加载 JSON 格式的标签映射文件"""
@@ -49,111 +142,102 @@ class TaggerEngine:
             else:
                 raise ValueError("Unexpected JSON format for tags mapping.")
 
+        # 预先解析出纯标签名，推理后直接按下标取
+        self.tag_names = [
+            tag_info.get('tag', 'unknown') if isinstance(tag_info, dict) else str(tag_info)
+            for tag_info in self.tags_list
+        ]
+
     def init_session(self):
         """初始化推理引擎，优先使用 DirectML (GPU)"""
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
 
         # 指定执行提供者顺序：优先 DirectML，其次 CPU
-        providers = ['DmlExecutionProvider', 'CPUExecutionProvider']
+        providers = self.providers or ['DmlExecutionProvider', 'CPUExecutionProvider']
+
+        options = ort.SessionOptions()
+        if self.pre_optimized:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
         
         try:
-            self.session = ort.InferenceSession(self.model_path, providers=providers)
+            self.session = ort.InferenceSession(self.model_path, options, providers=providers)
         except Exception as e:
             print(f"Failed to load DirectML provider, falling back to CPU. Error: {e}")
-            self.session = ort.InferenceSession(self.model_path, providers=['CPUExecutionProvider'])
+            self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
             
-        self.input_name = self.session.get_inputs()[0].name
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
         # 输出节点名通常不需要显式获取，run() 第一个参数传 None 即可获取所有输出
 
+        # 根据模型输入推断布局 / 精度 / batch 是否可变
+        shape = model_input.shape
+        channels_last = len(shape) == 4 and shape[-1] == 3
+        if self.input_dtype is None:
+            self.input_dtype = np.float16 if model_input.type == 'tensor(float16)' else np.float32
+        self.dynamic_batch = not isinstance(shape[0], int)
+        if not self.dynamic_batch:
+            self.batch_size = shape[0]
+        self.preprocessor = Preprocessor(MODEL_INPUT_SIZE, self.resize_mode, self.input_dtype,
+                                         channels_last, self.batch_size)
+
     def preprocess_image(self, image_path: str) -> np.ndarray:
         """
-        图片预处理:
-        1. 加载图片，转为 RGB
-        2. Resize 到模型输入尺寸 (448x448)，保持长宽比并填充白边/黑边 (Letterbox)
-           或者简单的 Resize (这里采用简单的 Resize + Center Crop 或直接 Resize)
-           为了简化，我们使用 Resize (LANCZOS)
-        3. 归一化 (Normalize)
-        4. Transpose (HWC -> CHW)
-        5. Add Batch Dimension (CHW -> NCHW)
+        图片预处理，返回 (1, 3, 448, 448) 输入 (复用的缓冲区视图，下次调用会被覆盖)
+        具体步骤见 Preprocessor
         """
-        try:
-            image = Image.open(image_path).convert('RGB')
-            # 处理 Exif 旋转
-            image = ImageOps.exif_transpose(image)
-            
-            # 1. Resize (简单的双线性插值)
-            # 注意：高质量模型通常需要保持长宽比填充，这里简化为直接缩放
-            # 如果效果不好，我们可以改为 Letterbox Pad
-            image = image.resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), Image.Resampling.LANCZOS)
-            
-            # 2. 转为 Numpy 数组
-            img_np = np.array(image).astype(np.float32)
-            
-            # 3. 归一化 (RGB 0-255 -> BGR? RGB? 0-1?)
-            # 大多数 Tag 模型 (如 WD14) 使用 BGR 顺序且像素值在 0-255 或 0-1 之间
-            # WD14 v2 模型通常是 RGB, 0-1, Mean/Std 无需特殊处理或简单归一化
-            # 这里假设模型需要 0-1 输入
-            img_np = img_np / 255.0
-            
-            # 有些模型需要标准化 (Mean=[0.485, ...], Std=[0.229, ...])
-            # 但 WD14 ConvNextV2 不需要，只需 0-1
-            
-            # 4. HWC -> CHW (Height, Width, Channel -> Channel, Height, Width)
-            img_np = img_np.transpose((2, 0, 1))
-            
-            # 5. 增加 Batch 维度 -> (1, 3, 448, 448)
-            img_np = np.expand_dims(img_np, axis=0)
-            
-            return img_np
-            
-        except Exception as e:
-            print(f"Error preprocessing image {image_path}: {e}")
+        if not self.preprocessor.process(image_path, 0):
             return None
+        return self.preprocessor.buffer(1)
 
-    def predict(self, image_path: str, threshold: float = THRESHOLD_DEFAULT):
-        """
-        执行推理
-        返回: list of (tag_name, confidence)
-        """
-        input_data = self.preprocess_image(image_path)
-        if input_data is None:
-            return []
-
-        # 运行推理
-        # onnx run(output_names, input_feed)
-        # output_names=None 表示获取所有输出
-        outputs = self.session.run(None, {self.input_name: input_data})
-        
-        # outputs[0] 是概率分布数组 (1, Num_Tags)
-        probs = outputs[0][0] 
-        
-        # 过滤结果
-        result_tags = []
-        
+    def postprocess(self, probs: np.ndarray, threshold: float):
+        """把单张图的概率向量转为 [(tag_name, confidence)]，按置信度降序"""
         # 某些模型前 4 个 tag 是 ratings (general, sensitive, questionable, explicit)
         # 我们通常只需要后面的 content tags
         # 假设从 index 4 开始 (具体看 tags.csv)
         start_index = 4 
-        
-        for i in range(start_index, len(probs)):
-            confidence = float(probs[i])
-            if confidence > threshold:
-                if i < len(self.tags_list):
-                    tag_info = self.tags_list[i]
-                    
-                    # 处理 tag_info 是字典的情况
-                    if isinstance(tag_info, dict):
-                        tag_name = tag_info.get('tag', 'unknown') # 获取 tag 字段
-                    else:
-                        tag_name = str(tag_info)
-                        
-                    result_tags.append((tag_name, confidence))
-        
+        end_index = min(len(probs), len(self.tag_names))
+        if end_index <= start_index:
+            return []
+        content = probs[start_index:end_index]
+        hits = np.nonzero(content > threshold)[0]
         # 按置信度降序排列
-        result_tags.sort(key=lambda x: x[1], reverse=True)
-        
-        return result_tags
+        hits = hits[np.argsort(-content[hits], kind='stable')]
+        return [(self.tag_names[start_index + i], float(content[i])) for i in hits]
+
+    def predict(self, image_path: str, threshold: float = None):
+        """
+        执行推理
+        返回: list of (tag_name, confidence)
+        """
+        return self.predict_batch([image_path], threshold)[0]
+
+    def predict_batch(self, image_paths, threshold: float = None):
+        """
+        批量推理，每次最多 batch_size 张写入同一个预分配缓冲区
+        返回与 image_paths 等长的列表；预处理失败的图片对应 []
+        """
+        if threshold is None:
+            threshold = self.threshold
+        results = []
+        step = self.preprocessor.batch_size
+        for start in range(0, len(image_paths), step):
+            chunk = image_paths[start:start + step]
+            ok = [self.preprocessor.process(path, i) for i, path in enumerate(chunk)]
+            if not any(ok):
+                results.extend([] for _ in chunk)
+                continue
+            # 固定 batch 维的模型必须喂满整个缓冲区
+            n = len(chunk) if self.dynamic_batch else self.preprocessor.batch_size
+            # onnx run(output_names, input_feed)，output_names=None 表示获取所有输出
+            # outputs[0] 是概率分布数组 (N, Num_Tags)
+            with metrics.timer('tagger.inference'):
+                outputs = self.session.run(None, {self.input_name: self.preprocessor.buffer(n)})
+            metrics.count('tagger.images', sum(ok))
+            with metrics.timer('tagger.postprocess'):
+                for i, good in enumerate(ok):
+                    results.append(self.postprocess(outputs[0][i], threshold) if good else [])
+        return results
 
 # ==========================================
 # 简单测试
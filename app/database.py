@@ -1,10 +1,177 @@
 import sqlite3
 import os
-from typing import List, Tuple, Optional, Dict
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Tuple, Optional, Dict, NamedTuple
+
+from instrumentation import metrics
+from db_writer import get_writer
+
+class ImageRow(NamedTuple):
+    """
+    列表 / 缩略图 / 看图器之间传递的图片行，只含用到的列。
+    命名元组没有实例 __dict__，每行只比普通元组多一个类型指针
+    """
+    id: int
+    file_path: str
+    file_name: str
+
+# 只取 ImageRow 需要的列，顺序与字段一致
+IMAGE_ROW_COLUMNS = "i.id, i.file_path, i.file_name"
+
+# 筛选结果 id 列表缓存的总字节数 (array('q') 每个 id 8 字节)
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+# 单个结果超过总预算的该比例时不缓存，直接走 COUNT + LIMIT/OFFSET
+RESULT_CACHE_MAX_ENTRY_RATIO = 0.25
+
+class QueryResultCache:
+    """
+    筛选结果的有序 id 列表 (id 降序) 的 LRU 缓存，按字节数淘汰，线程安全。
+    每个数据库一个代数 (db_generation 表，由触发器在写入时递增)：
+    发现代数变化时丢弃该库的全部缓存，写入后的第一次查询自然重新计算。
+    """
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()  # (db_path, 筛选键) -> array('q')
+        self._generations = {}       # db_path -> 缓存内容对应的代数
+        self._lock = threading.Lock()
+
+    def max_entry_ids(self) -> int:
+        return int(self.max_bytes * RESULT_CACHE_MAX_ENTRY_RATIO) // 8
+
+    def _sync_generation(self, db_path, generation):
+        if self._generations.get(db_path) != generation:
+            for key in [k for k in self._items if k[0] == db_path]:
+                self.current_bytes -= self._nbytes(self._items.pop(key))
+            self._generations[db_path] = generation
+
+    @staticmethod
+    def _nbytes(ids):
+        return len(ids) * ids.itemsize
+
+    def get(self, db_path, generation, key):
+        with self._lock:
+            self._sync_generation(db_path, generation)
+            ids = self._items.get((db_path, key))
+            if ids is not None:
+                self._items.move_to_end((db_path, key))
+            return ids
+
+    def put(self, db_path, generation, key, ids):
+        with self._lock:
+            self._sync_generation(db_path, generation)
+            old = self._items.pop((db_path, key), None)
+            if old is not None:
+                self.current_bytes -= self._nbytes(old)
+            self._items[(db_path, key)] = ids
+            self.current_bytes += self._nbytes(ids)
+            while self.current_bytes > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self.current_bytes -= self._nbytes(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._generations.clear()
+            self.current_bytes = 0
+
+result_cache = QueryResultCache()
+
+def normalize_filters(filters: dict = None) -> tuple:
+    """把筛选条件转为可哈希的规范形式：忽略空值、标签去重排序，用作缓存键"""
+    if not filters:
+        return ()
+    key = []
+    if filters.get('tags'):
+        key.append(('tags', tuple(sorted(set(filters['tags'])))))
+    if filters.get('path_keyword'):
+        key.append(('path_keyword', filters['path_keyword']))
+    if filters.get('exact_dir'):
+        key.append(('exact_dir', filters['exact_dir']))
+    if filters.get('folder_id'):
+        key.append(('folder_id', filters['folder_id'], bool(filters.get('include_subfolders'))))
+    if filters.get('untagged'):
+        key.append(('untagged',))
+    if filters.get('missing'):
+        key.append(('missing',))
+    if filters.get('tagged_by_other_model'):
+        key.append(('tagged_by_other_model', filters['tagged_by_other_model']))
+    return tuple(key)
+
+# ================= 每张图片的标签打包 (images.tag_blob) =================
+# 每个标签 8 字节: tag_id (uint32) + 置信度 (uint16，0~1 量化到 0~65535)
+# + 来源 (uint16，最高位为 is_prediction，低 15 位为 model_id，0 表示人工 / 无模型)。
+# 按置信度降序存放，与 get_tags_for_image 的显示顺序一致
+TAG_RECORD = struct.Struct('<IHH')
+TAG_RECORD_DTYPE = [('tag_id', '<u4'), ('confidence', '<u2'), ('source', '<u2')]
+TAG_CONF_SCALE = 65535
+TAG_PREDICTION_BIT = 0x8000
+TAG_MODEL_MASK = 0x7FFF
+
+def encode_tag_blob(rows) -> bytes:
+    """rows: [(tag_id, confidence, is_prediction, model_id)]"""
+    rows = sorted(rows, key=lambda r: (-(r[1] or 0.0), r[0]))
+    out = bytearray(TAG_RECORD.size * len(rows))
+    for i, (tag_id, confidence, is_prediction, model_id) in enumerate(rows):
+        q = int(round(min(max(confidence or 0.0, 0.0), 1.0) * TAG_CONF_SCALE))
+        source = (model_id or 0) & TAG_MODEL_MASK
+        if is_prediction:
+            source |= TAG_PREDICTION_BIT
+        TAG_RECORD.pack_into(out, i * TAG_RECORD.size, tag_id, q, source)
+    return bytes(out)
+
+def decode_tag_blob(blob: bytes) -> List[Tuple[int, float, int, Optional[int]]]:
+    """-> [(tag_id, confidence, is_prediction, model_id 或 None)]"""
+    return [(tag_id, q / TAG_CONF_SCALE, source >> 15, (source & TAG_MODEL_MASK) or None)
+            for tag_id, q, source in TAG_RECORD.iter_unpack(blob)]
+
+def decode_tag_blobs(image_ids, blobs) -> dict:
+    """
+    批量解码为 NumPy 数组 (COO 形式，每个 图片-标签 一行):
+    image_id / tag_id (int64)，confidence (float32)，is_prediction (bool)，model_id (int32，0 表示无)
+    """
+    import numpy as np
+    dtype = np.dtype(TAG_RECORD_DTYPE)
+    lengths = np.fromiter((len(b) // dtype.itemsize for b in blobs), dtype=np.int64, count=len(blobs))
+    records = np.frombuffer(b''.join(blobs), dtype=dtype)
+    return {
+        'image_id': np.repeat(np.asarray(image_ids, dtype=np.int64), lengths),
+        'tag_id': records['tag_id'].astype(np.int64),
+        'confidence': records['confidence'].astype(np.float32) / TAG_CONF_SCALE,
+        'is_prediction': (records['source'] & TAG_PREDICTION_BIT) != 0,
+        'model_id': (records['source'] & TAG_MODEL_MASK).astype(np.int32),
+    }
+
+# ================= 结构迁移 (PRAGMA user_version) =================
+# 每个版本对应 ImageDB 中的一个迁移方法，按顺序执行，执行完一个就写入 user_version，旧库只补跑缺少的版本；
+# 已是当前版本的数据库在打开时跳过全部结构检查 (每个工作线程都会创建 ImageDB)。
+# 结构有变化时在末尾追加新迁移，不要修改已发布的迁移；迁移须可重复执行 (中途中断时下次会重跑该版本)
+MIGRATIONS = (
+    '_migrate_1_baseline',
+    '_migrate_2_covering_indexes',
+    '_migrate_3_incremental_vacuum',
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# ANALYZE 时每个索引最多采样的行数 (PRAGMA analysis_limit)，大库上也不必读完整个索引
+ANALYZE_ROW_LIMIT = 1000
+# 一次导入 / 批量写入超过这么多行后重新收集查询规划统计 (ImageDB.optimize)
+OPTIMIZE_AFTER_ROWS = 10000
+# 检查点之后 WAL 文件保留的最大字节数 (PRAGMA journal_size_limit)，超出部分截断
+WAL_SIZE_LIMIT = 64 * 1024 * 1024
+# 迁移到 auto_vacuum=INCREMENTAL 时，不超过这个大小的库直接 VACUUM，更大的库留给用户手动 "完整压缩"
+VACUUM_ON_MIGRATE_BYTES = 256 * 1024 * 1024
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
 
 class ImageDB:
     def __init__(self, db_path: str = "images.db"):
         self.db_path = os.path.abspath(db_path)
+        # 标签 / 模型只增不改名，id -> 名称可以一直缓存
+        self._tag_names = {}
+        self._model_names = {}
         print(f"[DB] Initialized at: {self.db_path}")
         self.init_db()
 
@@ -15,13 +182,30 @@ class ImageDB:
         conn.execute("PRAGMA synchronous=NORMAL")
         conn.execute("PRAGMA mmap_size=30000000000") 
         conn.execute("PRAGMA cache_size=-64000") 
+        conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT}")
         conn.row_factory = sqlite3.Row
         return conn
 
     def init_db(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            print(f"[DB] Schema version {version} is newer than this program ({SCHEMA_VERSION})")
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            name = MIGRATIONS[number - 1]
+            with metrics.timer('db.migrate'):
+                getattr(self, name)(cursor)
+                cursor.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            print(f"[DB] Schema migrated to version {number} ({name})")
+        conn.close()
+
+    def _migrate_1_baseline(self, cursor):
+        """
+        版本 1：引入 user_version 之前的全部结构。
+        更早的库 (user_version 为 0) 可能缺任意一部分，因此这里逐项 IF NOT EXISTS / 检查列后补齐
+        """
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS images (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,69 +240,826 @@ class ImageDB:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_tags_tag_id ON image_tags (tag_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_file_name ON images (file_name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_dir_path ON images (dir_path)')
-        
-        conn.commit()
-        conn.close()
+
+        # 统计表：由触发器增量维护，侧栏和查询规划直接读取，无需扫描 image_tags / images
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='tag_stats'")
+        need_backfill = cursor.fetchone() is None
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tag_stats (
+                tag_id INTEGER PRIMARY KEY,
+                image_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(tag_id) REFERENCES tags(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS folder_stats (
+                dir_path TEXT PRIMARY KEY,
+                image_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._create_stats_triggers(cursor)
+
+        if need_backfill:
+            self._rebuild_stats(cursor)
+
+        # 目录层级：folders 存每一级目录，folder_closure 为闭包表 (祖先, 后代, 深度)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS folders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                parent_id INTEGER,
+                path TEXT UNIQUE NOT NULL,
+                FOREIGN KEY(parent_id) REFERENCES folders(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS folder_closure (
+                ancestor_id INTEGER NOT NULL,
+                descendant_id INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor_id, descendant_id),
+                FOREIGN KEY(ancestor_id) REFERENCES folders(id) ON DELETE CASCADE,
+                FOREIGN KEY(descendant_id) REFERENCES folders(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folder_closure_descendant ON folder_closure (descendant_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent_id ON folders (parent_id)')
+
+        columns = [row['name'] for row in cursor.execute("PRAGMA table_info(images)")]
+        if 'folder_id' not in columns:
+            cursor.execute("ALTER TABLE images ADD COLUMN folder_id INTEGER")
+            self._backfill_folders(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_folder_id ON images (folder_id)')
+
+        # 文件丢失标记：找不到文件时先标记 (不删除，标签保留)，确认后再清理或重定位
+        if 'missing_since' not in columns:
+            cursor.execute("ALTER TABLE images ADD COLUMN missing_since TIMESTAMP")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_missing ON images (missing_since) WHERE missing_since IS NOT NULL')
+
+        # 每张图片的标签打包 (见 encode_tag_blob)：显示 / 导出 / 分析直接解码，不必 JOIN image_tags。
+        # image_tags 变化时触发器把它置为 NULL (待重建)，写入方在同一事务内重建；没有标签为空 BLOB
+        need_tag_blobs = 'tag_blob' not in columns
+        if need_tag_blobs:
+            cursor.execute("ALTER TABLE images ADD COLUMN tag_blob BLOB DEFAULT X''")
+            cursor.execute("UPDATE images SET tag_blob = NULL WHERE id IN (SELECT DISTINCT image_id FROM image_tags)")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_tag_blob_stale ON images (id) WHERE tag_blob IS NULL')
+
+        # 导入任务与待打标队列：导入边写边入队，打标线程分批消费，不在内存里攒 id 列表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL DEFAULT 'running',
+                image_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tag_queue (
+                job_id INTEGER NOT NULL,
+                image_id INTEGER NOT NULL,
+                PRIMARY KEY (job_id, image_id),
+                FOREIGN KEY(job_id) REFERENCES import_jobs(id) ON DELETE CASCADE,
+                FOREIGN KEY(image_id) REFERENCES images(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        # 打标模型：记录每条 image_tags 由哪个模型 (按文件 hash 区分) 产生，人工标签为 NULL
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS models (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                file_hash TEXT UNIQUE NOT NULL,
+                model_path TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        columns = [row['name'] for row in cursor.execute("PRAGMA table_info(image_tags)")]
+        if 'model_id' not in columns:
+            cursor.execute("ALTER TABLE image_tags ADD COLUMN model_id INTEGER REFERENCES models(id) ON DELETE SET NULL")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_tags_model_id ON image_tags (model_id)')
+
+        self._create_tag_blob_triggers(cursor)
+        if need_tag_blobs:
+            built = self._refresh_tag_blobs(cursor)
+            if built:
+                print(f"[DB] Built tag blobs for {built} images")
+
+        # 数据库代数：影响筛选结果的写入都会递增，用于判断结果缓存是否失效
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS db_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO db_generation (id, value) VALUES (1, 0)")
+        # 早期库的 trg_gen_images_update 不监视 missing_since，先删除再按当前定义创建
+        cursor.execute("DROP TRIGGER IF EXISTS trg_gen_images_update")
+        self._create_generation_triggers(cursor)
+
+        # 监视的导入根目录 (watcher.LibraryWatcher)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS watch_roots (
+                path TEXT PRIMARY KEY,
+                recursive INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def _migrate_2_covering_indexes(self, cursor):
+        """
+        版本 2：按实际查询调整索引 (见 benchmarks/check_query_plans.py)。
+        image_tags 是 rowid 表，原 (tag_id) 索引的隐含列是 rowid，按标签找图片还要回表取 image_id；
+        (tag_id, image_id) 覆盖标签筛选子查询与统计重建。
+        images.id 就是 rowid，(dir_path) / (folder_id) 索引本身已按 id 排序，目录分页不需要另建 (dir_path, id)。
+        丢失文件的查询都是 "missing_since IS NOT NULL ORDER BY id"，部分索引改为按 id 建
+        """
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_tags_tag_image ON image_tags (tag_id, image_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_image_tags_tag_id')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_missing_id ON images (id) WHERE missing_since IS NOT NULL')
+        cursor.execute('DROP INDEX IF EXISTS idx_images_missing')
+        self._analyze(cursor)
+
+    def _migrate_3_incremental_vacuum(self, cursor):
+        """
+        版本 3：auto_vacuum=INCREMENTAL，删除大量记录后由维护线程分步把空闲页还给文件系统 (见 maintenance.py)。
+        已有表的库要 VACUUM 一次才能切换；大库不在打开时做 (可能要几分钟)，统计面板会提示手动 "完整压缩"
+        """
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if AUTO_VACUUM_MODES.get(cursor.execute("PRAGMA auto_vacuum").fetchone()[0]) == 'incremental':
+            return
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        if page_size * page_count > VACUUM_ON_MIGRATE_BYTES:
+            print("[DB] auto_vacuum stays off until a full VACUUM (database too large to convert on open)")
+            return
+        try:
+            cursor.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            # 其他连接正在写入时 VACUUM 会失败，不影响使用，下次维护 / 手动压缩时再切换
+            print(f"[DB] VACUUM skipped: {e}")
+
+    def _backfill_folders(self, cursor):
+        """旧库升级：为已有的 dir_path 建立目录树并回填 images.folder_id"""
+        cache = {}
+        dirs = [row['dir_path'] for row in cursor.execute("SELECT dir_path FROM folder_stats").fetchall()]
+        for dir_path in dirs:
+            folder_id = self.ensure_folder(cursor, dir_path, cache)
+            cursor.execute("UPDATE images SET folder_id = ? WHERE dir_path = ?", (folder_id, dir_path))
+
+    def _create_stats_triggers(self, cursor):
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS trg_image_tags_insert AFTER INSERT ON image_tags
+            BEGIN
+                INSERT INTO tag_stats (tag_id, image_count) VALUES (NEW.tag_id, 1)
+                ON CONFLICT(tag_id) DO UPDATE SET image_count = image_count + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_image_tags_delete AFTER DELETE ON image_tags
+            BEGIN
+                UPDATE tag_stats SET image_count = image_count - 1 WHERE tag_id = OLD.tag_id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_images_insert AFTER INSERT ON images
+            BEGIN
+                INSERT INTO folder_stats (dir_path, image_count) VALUES (NEW.dir_path, 1)
+                ON CONFLICT(dir_path) DO UPDATE SET image_count = image_count + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_images_delete AFTER DELETE ON images
+            BEGIN
+                UPDATE folder_stats SET image_count = image_count - 1 WHERE dir_path = OLD.dir_path;
+                DELETE FROM folder_stats WHERE dir_path = OLD.dir_path AND image_count <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_images_move AFTER UPDATE OF dir_path ON images
+            WHEN OLD.dir_path <> NEW.dir_path
+            BEGIN
+                UPDATE folder_stats SET image_count = image_count - 1 WHERE dir_path = OLD.dir_path;
+                DELETE FROM folder_stats WHERE dir_path = OLD.dir_path AND image_count <= 0;
+                INSERT INTO folder_stats (dir_path, image_count) VALUES (NEW.dir_path, 1)
+                ON CONFLICT(dir_path) DO UPDATE SET image_count = image_count + 1;
+            END;
+        ''')
+
+    def _create_generation_triggers(self, cursor):
+        # image_tags 的 UPDATE (追加模式刷新置信度) 不改变筛选结果，不需要递增
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS trg_gen_images_insert AFTER INSERT ON images
+            BEGIN UPDATE db_generation SET value = value + 1 WHERE id = 1; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_gen_images_delete AFTER DELETE ON images
+            BEGIN UPDATE db_generation SET value = value + 1 WHERE id = 1; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_gen_images_update
+            AFTER UPDATE OF file_path, file_name, dir_path, folder_id, missing_since ON images
+            BEGIN UPDATE db_generation SET value = value + 1 WHERE id = 1; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_gen_image_tags_insert AFTER INSERT ON image_tags
+            BEGIN UPDATE db_generation SET value = value + 1 WHERE id = 1; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_gen_image_tags_delete AFTER DELETE ON image_tags
+            BEGIN UPDATE db_generation SET value = value + 1 WHERE id = 1; END;
+        ''')
+
+    def _create_tag_blob_triggers(self, cursor):
+        # 只在第一次变化时写 images 行，同一图片后续的标签写入只是一次索引查找
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS trg_tag_blob_insert AFTER INSERT ON image_tags
+            BEGIN UPDATE images SET tag_blob = NULL WHERE id = NEW.image_id AND tag_blob IS NOT NULL; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_tag_blob_delete AFTER DELETE ON image_tags
+            BEGIN UPDATE images SET tag_blob = NULL WHERE id = OLD.image_id AND tag_blob IS NOT NULL; END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_tag_blob_update
+            AFTER UPDATE OF confidence, is_prediction, model_id ON image_tags
+            BEGIN UPDATE images SET tag_blob = NULL WHERE id = NEW.image_id AND tag_blob IS NOT NULL; END;
+        ''')
+
+    def _generation(self, cursor) -> int:
+        return cursor.execute("SELECT value FROM db_generation WHERE id = 1").fetchone()[0]
+
+    def _rebuild_stats(self, cursor):
+        cursor.execute("DELETE FROM tag_stats")
+        cursor.execute('''
+            INSERT INTO tag_stats (tag_id, image_count)
+            SELECT tag_id, COUNT(*) FROM image_tags GROUP BY tag_id
+        ''')
+        cursor.execute("DELETE FROM folder_stats")
+        cursor.execute('''
+            INSERT INTO folder_stats (dir_path, image_count)
+            SELECT dir_path, COUNT(*) FROM images GROUP BY dir_path
+        ''')
+
+    # ================= 写入 (单写入线程) =================
+
+    def write(self, fn, *args):
+        """在本库的写入线程中执行 fn(cursor, *args) 并提交，返回 fn 的结果 (见 db_writer)"""
+        return get_writer(self.db_path, self.get_connection).call(fn, *args)
+
+    def submit_write(self, fn, *args):
+        """同 write，但不等待提交，返回 concurrent.futures.Future"""
+        return get_writer(self.db_path, self.get_connection).submit(fn, *args)
+
+    def write_exclusive(self, fn, *args):
+        """
+        在写入线程的连接上、事务之外执行 fn(cursor, *args) (VACUUM / 检查点等不能放在事务里的操作)。
+        期间其他写入排队等待，不另开连接争抢写锁；耗时与库大小有关，不设超时
+        """
+        return get_writer(self.db_path, self.get_connection).call(fn, *args, timeout=None, exclusive=True)
+
+    def write_queue_depth(self) -> int:
+        return get_writer(self.db_path, self.get_connection).queue_depth()
+
+    def rebuild_stats(self):
+        """全量重算统计表 (统计异常时的兜底手段)"""
+        self.write(self._rebuild_stats)
+
+    def _analyze(self, cursor):
+        """重新收集查询规划统计 (sqlite_stat1)，标签 / 目录分布变化后规划器才能选对驱动索引"""
+        cursor.execute(f"PRAGMA analysis_limit = {ANALYZE_ROW_LIMIT}")
+        cursor.execute("ANALYZE")
+
+    def optimize(self, changed_rows: Optional[int] = None) -> bool:
+        """
+        大批量导入后的维护：changed_rows 未达到 OPTIMIZE_AFTER_ROWS 时什么都不做。
+        ANALYZE 之后再执行 PRAGMA optimize (由 SQLite 判断是否还有需要处理的表)
+        """
+        if changed_rows is not None and changed_rows < OPTIMIZE_AFTER_ROWS:
+            return False
+        def run(cursor):
+            self._analyze(cursor)
+            cursor.execute("PRAGMA optimize")
+        with metrics.timer('db.optimize'):
+            self.write(run)
+        return True
+
+    # ================= 维护 (WAL / 空间回收 / 完整性) =================
+
+    def checkpoint(self, mode: str = 'PASSIVE') -> Tuple[int, int, int]:
+        """
+        PRAGMA wal_checkpoint(PASSIVE / RESTART / TRUNCATE)，返回 (是否因读写方占用未完成, WAL 帧数, 已写回帧数)。
+        PASSIVE 不等待任何连接；TRUNCATE 等到没有读写方后把 WAL 写回并截断为 0 字节
+        """
+        with metrics.timer(f'db.checkpoint.{mode.lower()}'):
+            return self.write_exclusive(lambda cursor: tuple(cursor.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()))
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """把最多 pages 个空闲页还给文件系统 (auto_vacuum=INCREMENTAL 时才有效)，返回实际归还的页数"""
+        def run(cursor):
+            before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            # 这条 PRAGMA 每执行一步只释放一页，executescript 才会把它执行完
+            cursor.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return before - cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        with metrics.timer('db.incremental_vacuum'):
+            return self.write_exclusive(run)
+
+    def vacuum(self):
+        """完整 VACUUM：重写整个文件并切换到 auto_vacuum=INCREMENTAL。耗时与库大小成正比，期间其他写入排队等待"""
+        def run(cursor):
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        with metrics.timer('db.vacuum'):
+            self.write_exclusive(run)
+
+    def quick_check(self) -> List[str]:
+        """PRAGMA quick_check：WAL 下只占一个读快照，写入进行中也可以运行。正常时返回 ['ok']"""
+        conn = self.get_connection()
+        try:
+            with metrics.timer('db.quick_check'):
+                return [row[0] for row in conn.execute("PRAGMA quick_check(20)")]
+        finally:
+            conn.close()
+
+    def storage_stats(self) -> dict:
+        """
+        文件 / WAL 大小、空闲页数与比例 (删除后留下的碎片)、auto_vacuum 模式，以及当前数据库代数 (判断是否有写入)
+        """
+        conn = self.get_connection()
+        try:
+            page_size, page_count, freelist, auto_vacuum = (
+                conn.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'))
+            generation = self._generation(conn.cursor())
+        finally:
+            conn.close()
+        wal_path = self.db_path + "-wal"
+        return {
+            'db_bytes': os.path.getsize(self.db_path),
+            'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist,
+            'free_ratio': freelist / page_count if page_count else 0.0,
+            'auto_vacuum': AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+            'generation': generation,
+        }
 
     # ================= 图片操作 =================
 
     def add_image(self, file_path: str, file_name: str, dir_path: str, size: int = 0) -> int:
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("INSERT OR IGNORE INTO images (file_path, file_name, dir_path, file_size) VALUES (?, ?, ?, ?)", 
-                           (file_path, file_name, dir_path, size))
-            conn.commit()
-            cursor.execute("SELECT id FROM images WHERE file_path = ?", (file_path,))
-            row = cursor.fetchone()
-            return row['id'] if row else -1
+            return self.write(self._add_image, file_path, file_name, dir_path, size)
         except Exception as e:
             print(f"[DB Error] {e}")
             return -1
+
+    def _add_image(self, cursor, file_path: str, file_name: str, dir_path: str, size: int = 0,
+                   folder_cache: Optional[Dict[str, int]] = None) -> int:
+        folder_id = self.ensure_folder(cursor, dir_path, folder_cache)
+        cursor.execute("INSERT OR IGNORE INTO images (file_path, file_name, dir_path, file_size, folder_id) VALUES (?, ?, ?, ?, ?)", 
+                       (file_path, file_name, dir_path, size, folder_id))
+        cursor.execute("SELECT id FROM images WHERE file_path = ?", (file_path,))
+        row = cursor.fetchone()
+        return row['id'] if row else -1
+
+    def get_image_rows(self, image_ids) -> List[ImageRow]:
+        """按给定 id 顺序取 ImageRow，已被删除的 id 跳过"""
+        conn = self.get_connection()
+        try:
+            rows = []
+            for start in range(0, len(image_ids), 500):
+                rows.extend(self._fetch_rows_by_ids(conn.cursor(), list(image_ids[start:start + 500])))
+            return rows
         finally:
             conn.close()
 
+    def get_image_ids_by_paths(self, paths) -> Dict[str, int]:
+        """{file_path: id}，不在库中的路径不出现在结果里"""
+        paths = list(paths)
+        result = {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in cursor.execute(f"SELECT id, file_path FROM images WHERE file_path IN ({placeholders})", chunk):
+                result[row[1]] = row[0]
+        conn.close()
+        return result
+
     def get_connection_for_batch(self):
         return self.get_connection()
 
     def delete_image_by_id(self, image_id: int):
+        self.write(lambda cursor: cursor.execute("DELETE FROM images WHERE id = ?", (image_id,)))
+
+    def delete_images_by_dir(self, dir_path: str):
+        def run(cursor):
+            cursor.execute("DELETE FROM images WHERE dir_path = ?", (dir_path,))
+            self._prune_empty_folders(cursor)
+        self.write(run)
+
+    # ================= 导入任务 / 打标队列 =================
+
+    def create_import_job(self) -> int:
+        return self.write(lambda cursor: cursor.execute("INSERT INTO import_jobs (status) VALUES ('running')").lastrowid)
+
+    def finish_import_job(self, job_id: int, image_count: int, status: str = 'done'):
+        def run(cursor):
+            cursor.execute("UPDATE import_jobs SET status = ?, image_count = ? WHERE id = ?", (status, image_count, job_id))
+            cursor.execute('''
+                DELETE FROM import_jobs WHERE id = ? AND NOT EXISTS (SELECT 1 FROM tag_queue WHERE job_id = ?)
+            ''', (job_id, job_id))
+        self.write(run)
+
+    def cancel_import_job(self, job_id: int):
+        """放弃任务及其队列 (例如模型加载失败)"""
+        self.write(lambda cursor: cursor.execute("DELETE FROM import_jobs WHERE id = ?", (job_id,)))
+
+    def get_import_job_status(self, job_id: int) -> Optional[str]:
         conn = self.get_connection()
-        conn.execute("DELETE FROM images WHERE id = ?", (image_id,))
-        conn.commit()
+        row = conn.execute("SELECT status FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
         conn.close()
+        return row['status'] if row else None
 
-    def delete_images_by_dir(self, dir_path: str):
+    def enqueue_for_tagging(self, cursor, job_id: int, file_path: str):
+        """在导入事务内把图片放入打标队列 (按路径查 id，不回传到 Python)"""
+        cursor.execute('''
+            INSERT OR IGNORE INTO tag_queue (job_id, image_id)
+            SELECT ?, id FROM images WHERE file_path = ?
+        ''', (job_id, file_path))
+
+    def fetch_tag_queue(self, job_id: int, limit: int = 500) -> List[int]:
         conn = self.get_connection()
-        conn.execute("DELETE FROM images WHERE dir_path = ?", (dir_path,))
-        conn.commit()
+        rows = conn.execute("SELECT image_id FROM tag_queue WHERE job_id = ? ORDER BY image_id LIMIT ?",
+                            (job_id, limit)).fetchall()
         conn.close()
+        return [row['image_id'] for row in rows]
+
+    def count_tag_queue(self, job_id: int) -> int:
+        conn = self.get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM tag_queue WHERE job_id = ?", (job_id,)).fetchone()[0]
+        conn.close()
+        return count
+
+    def ack_tag_queue(self, job_id: int, image_ids: List[int]):
+        """从队列中移除已处理的图片；队列清空且导入已结束时删除任务记录"""
+        self.write(self._ack_tag_queue, job_id, image_ids)
+
+    def _ack_tag_queue(self, cursor, job_id: int, image_ids: List[int]):
+        cursor.executemany("DELETE FROM tag_queue WHERE job_id = ? AND image_id = ?",
+                           [(job_id, img_id) for img_id in image_ids])
+        cursor.execute('''
+            DELETE FROM import_jobs WHERE id = ? AND status <> 'running'
+            AND NOT EXISTS (SELECT 1 FROM tag_queue WHERE job_id = ?)
+        ''', (job_id, job_id))
+
+    # ================= 模型 =================
+
+    def register_model(self, name: str, file_hash: str, model_path: str = None) -> int:
+        """登记模型 (按文件 hash 去重)，返回 models.id"""
+        def run(cursor):
+            cursor.execute("INSERT OR IGNORE INTO models (name, file_hash, model_path) VALUES (?, ?, ?)",
+                           (name, file_hash, model_path))
+            cursor.execute("SELECT id FROM models WHERE file_hash = ?", (file_hash,))
+            return cursor.fetchone()['id']
+        return self.write(run)
+
+    def get_models(self) -> List[dict]:
+        """已登记的模型及其产生的标签数"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT m.id, m.name, m.file_hash, m.model_path,
+                   (SELECT COUNT(*) FROM image_tags it WHERE it.model_id = m.id) AS tag_rows
+            FROM models m ORDER BY m.id
+        ''')
+        models = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return models
+
+    # ================= 监视目录 / 文件系统同步 =================
+
+    def add_watch_root(self, path: str, recursive: bool = True):
+        self.write(lambda cursor: cursor.execute('''
+            INSERT INTO watch_roots (path, recursive) VALUES (?, ?)
+            ON CONFLICT(path) DO UPDATE SET recursive = MAX(recursive, excluded.recursive)
+        ''', (os.path.normpath(path), int(recursive))))
+
+    def remove_watch_root(self, path: str):
+        self.write(lambda cursor: cursor.execute("DELETE FROM watch_roots WHERE path = ?", (os.path.normpath(path),)))
+
+    def get_watch_roots(self) -> List[Tuple[str, bool]]:
+        conn = self.get_connection()
+        rows = conn.execute("SELECT path, recursive FROM watch_roots ORDER BY path").fetchall()
+        conn.close()
+        return [(row['path'], bool(row['recursive'])) for row in rows]
+
+    def get_dir_file_paths(self, dir_path: str) -> set:
+        """某个目录 (不含子目录) 下已入库的文件路径"""
+        conn = self.get_connection()
+        rows = conn.execute("SELECT file_path FROM images WHERE dir_path = ?", (dir_path,)).fetchall()
+        conn.close()
+        return {row[0] for row in rows}
+
+    def apply_fs_changes(self, upserts=(), deleted=(), deleted_dirs=(), moved=(), moved_dirs=(),
+                         tag_job_id: Optional[int] = None) -> Dict[str, int]:
+        """
+        在一个事务内批量应用文件系统变化 (由 LibraryWatcher 去抖合并后调用):
+        upserts: [(file_path, file_name, dir_path, size)] 新文件入库，已存在的更新大小
+        deleted / deleted_dirs: 已删除的文件 / 目录 (目录按闭包表删除整棵子树)
+        moved / moved_dirs: [(旧路径, 新路径)] 改名或移动，保留 id 与标签
+        tag_job_id: 新入库的图片放入该任务的打标队列
+        返回各类变化的计数
+        """
+        try:
+            return self.write(self._apply_fs_changes, upserts, deleted, deleted_dirs, moved, moved_dirs, tag_job_id)
+        except Exception as e:
+            print(f"[DB Error] apply_fs_changes: {e}")
+            raise
+
+    def _apply_fs_changes(self, cursor, upserts, deleted, deleted_dirs, moved, moved_dirs, tag_job_id) -> Dict[str, int]:
+        folder_cache = {}
+        counts = {'added': 0, 'updated': 0, 'deleted': 0, 'moved': 0}
+        for src, dst in moved_dirs:
+            counts['moved'] += self._move_dir(cursor, src, dst, folder_cache)
+
+        for src, dst in moved:
+            dst_dir = os.path.dirname(dst)
+            folder_id = self.ensure_folder(cursor, dst_dir, folder_cache)
+            # 目标位置被覆盖时，先移除目标原有记录
+            cursor.execute("DELETE FROM images WHERE file_path = ? AND file_path <> ?", (dst, src))
+            cursor.execute('''
+                UPDATE images SET file_path = ?, file_name = ?, dir_path = ?, folder_id = ?, missing_since = NULL
+                WHERE file_path = ?
+            ''', (dst, os.path.basename(dst), dst_dir, folder_id, src))
+            counts['moved'] += cursor.rowcount
+
+        for file_path, file_name, dir_path, size in upserts:
+            folder_id = self.ensure_folder(cursor, dir_path, folder_cache)
+            cursor.execute('''
+                INSERT OR IGNORE INTO images (file_path, file_name, dir_path, file_size, folder_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (file_path, file_name, dir_path, size, folder_id))
+            if cursor.rowcount:
+                counts['added'] += 1
+                if tag_job_id is not None:
+                    self.enqueue_for_tagging(cursor, tag_job_id, file_path)
+            else:
+                # 重新出现的文件 (例如移动硬盘重新接入) 同时清除丢失标记
+                cursor.execute("UPDATE images SET file_size = ?, missing_since = NULL "
+                               "WHERE file_path = ? AND (file_size IS NOT ? OR missing_since IS NOT NULL)",
+                               (size, file_path, size))
+                counts['updated'] += cursor.rowcount
+
+        if deleted:
+            cursor.executemany("DELETE FROM images WHERE file_path = ?", [(p,) for p in deleted])
+            counts['deleted'] += cursor.rowcount
+        for dir_path in deleted_dirs:
+            cursor.execute('''
+                DELETE FROM images WHERE folder_id IN (
+                    SELECT c.descendant_id FROM folder_closure c
+                    JOIN folders f ON f.id = c.ancestor_id WHERE f.path = ?
+                )
+            ''', (dir_path,))
+            counts['deleted'] += cursor.rowcount
+
+        if counts['deleted'] or counts['moved']:
+            self._prune_empty_folders(cursor)
+        return counts
+
+    def _move_dir(self, cursor, src: str, dst: str, folder_cache: dict) -> int:
+        """目录改名 / 移动：按闭包表找出子树内的图片，替换路径前缀"""
+        cursor.execute('''
+            SELECT i.id, i.file_path, i.dir_path FROM images i WHERE i.folder_id IN (
+                SELECT c.descendant_id FROM folder_closure c
+                JOIN folders f ON f.id = c.ancestor_id WHERE f.path = ?
+            )
+        ''', (src,))
+        rows = cursor.fetchall()
+        updates = []
+        for row in rows:
+            new_dir = dst + row['dir_path'][len(src):]
+            new_path = dst + row['file_path'][len(src):]
+            updates.append((new_path, new_dir, self.ensure_folder(cursor, new_dir, folder_cache), row['id']))
+        cursor.executemany("UPDATE images SET file_path = ?, dir_path = ?, folder_id = ?, missing_since = NULL WHERE id = ?",
+                           updates)
+        return len(updates)
+
+    # ================= 文件丢失 / 重定位 =================
+
+    def mark_missing(self, image_ids, missing: bool = True):
+        """批量设置 / 清除丢失标记 (已标记的保留最初发现的时间)"""
+        if not image_ids:
+            return
+        if missing:
+            sql = "UPDATE images SET missing_since = COALESCE(missing_since, CURRENT_TIMESTAMP) WHERE id = ?"
+        else:
+            sql = "UPDATE images SET missing_since = NULL WHERE id = ? AND missing_since IS NOT NULL"
+        self.write(lambda cursor: cursor.executemany(sql, [(i,) for i in image_ids]))
+
+    def count_missing(self, folder_id: Optional[int] = None) -> int:
+        filters = {'missing': True}
+        if folder_id:
+            filters.update(folder_id=folder_id, include_subfolders=True)
+        return self.count_images(filters)
+
+    def get_missing_dirs(self) -> List[Tuple[str, int]]:
+        """含丢失文件的目录及丢失数量，数量多的在前"""
+        conn = self.get_connection()
+        # +dir_path：不让规划器为了省掉 GROUP BY 排序去整个遍历 dir_path 索引，只读丢失文件的部分索引
+        rows = conn.execute('''
+            SELECT dir_path, COUNT(*) FROM images WHERE missing_since IS NOT NULL
+            GROUP BY +dir_path ORDER BY COUNT(*) DESC
+        ''').fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+
+    def get_missing_samples(self, dir_path: str, limit: int = 20) -> List[Tuple[str, int]]:
+        """目录中丢失文件的 (文件名, 大小) 样本，用于在其他位置识别同一批文件"""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT file_name, file_size FROM images WHERE dir_path = ? AND missing_since IS NOT NULL LIMIT ?
+        ''', (dir_path, limit)).fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+
+    def get_missing_under(self, prefix: str) -> List[Tuple[int, str]]:
+        """某目录 (含子目录) 下被标记丢失的 (id, file_path)"""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT i.id, i.file_path FROM images i
+            WHERE i.missing_since IS NOT NULL AND i.folder_id IN (
+                SELECT c.descendant_id FROM folder_closure c
+                JOIN folders f ON f.id = c.ancestor_id WHERE f.path = ?
+            )
+        ''', (prefix,)).fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+
+    def relocate_images(self, updates: List[Tuple[int, str]]) -> int:
+        """
+        批量改写路径 [(id, 新 file_path)]，同时更新 file_name / dir_path / folder_id 并清除丢失标记。
+        id 不变，标签全部保留。新路径已被其他记录占用的跳过。
+        """
+        if not updates:
+            return 0
+        def run(cursor):
+            folder_cache = {}
+            moved = 0
+            for img_id, new_path in updates:
+                new_dir = os.path.dirname(new_path)
+                folder_id = self.ensure_folder(cursor, new_dir, folder_cache)
+                cursor.execute('''
+                    UPDATE OR IGNORE images SET file_path = ?, file_name = ?, dir_path = ?, folder_id = ?, missing_since = NULL
+                    WHERE id = ?
+                ''', (new_path, os.path.basename(new_path), new_dir, folder_id, img_id))
+                moved += cursor.rowcount
+            self._prune_empty_folders(cursor)
+            return moved
+        return self.write(run)
+
+    def relocate_watch_roots(self, old_prefix: str, new_prefix: str):
+        def run(cursor):
+            rows = cursor.execute("SELECT path, recursive FROM watch_roots").fetchall()
+            for row in rows:
+                path = row['path']
+                if path == old_prefix or path.startswith(old_prefix.rstrip(os.sep) + os.sep):
+                    new_path = new_prefix.rstrip(os.sep) + path[len(old_prefix.rstrip(os.sep)):]
+                    cursor.execute("DELETE FROM watch_roots WHERE path = ?", (path,))
+                    cursor.execute("INSERT OR IGNORE INTO watch_roots (path, recursive) VALUES (?, ?)",
+                                   (new_path, row['recursive']))
+        self.write(run)
+
+    def purge_missing(self, folder_id: Optional[int] = None) -> int:
+        """删除被标记丢失的记录 (连同标签)，folder_id 限定在某个目录子树内"""
+        def run(cursor):
+            if folder_id:
+                cursor.execute('''
+                    DELETE FROM images WHERE missing_since IS NOT NULL AND folder_id IN (
+                        SELECT descendant_id FROM folder_closure WHERE ancestor_id = ?
+                    )
+                ''', (folder_id,))
+            else:
+                cursor.execute("DELETE FROM images WHERE missing_since IS NOT NULL")
+            count = cursor.rowcount
+            self._prune_empty_folders(cursor)
+            return count
+        return self.write(run)
+
+    # ================= 目录树操作 =================
+
+    def ensure_folder(self, cursor, dir_path: str, cache: Optional[Dict[str, int]] = None) -> int:
+        """
+        返回目录对应的 folders.id，不存在时连同所有上级目录一起创建。
+        cache: 可选的 {path: id} 字典，批量导入时避免重复查询
+        """
+        if cache is not None and dir_path in cache:
+            return cache[dir_path]
+
+        cursor.execute("SELECT id FROM folders WHERE path = ?", (dir_path,))
+        row = cursor.fetchone()
+        if row:
+            folder_id = row[0]
+        else:
+            parent = os.path.dirname(dir_path)
+            parent_id = None
+            if parent and parent != dir_path:
+                parent_id = self.ensure_folder(cursor, parent, cache)
+
+            cursor.execute("INSERT INTO folders (parent_id, path) VALUES (?, ?)", (parent_id, dir_path))
+            folder_id = cursor.lastrowid
+            # 闭包表：自身 (深度 0) + 父目录的所有祖先 (深度 +1)
+            cursor.execute('''
+                INSERT INTO folder_closure (ancestor_id, descendant_id, depth)
+                SELECT ?, ?, 0
+                UNION ALL
+                SELECT ancestor_id, ?, depth + 1 FROM folder_closure WHERE descendant_id = ?
+            ''', (folder_id, folder_id, folder_id, parent_id))
+
+        if cache is not None:
+            cache[dir_path] = folder_id
+        return folder_id
+
+    def _prune_empty_folders(self, cursor):
+        """删除整棵子树下都没有图片的目录节点"""
+        cursor.execute('''
+            DELETE FROM folders WHERE id NOT IN (
+                SELECT DISTINCT c.ancestor_id FROM folder_closure c
+                WHERE EXISTS (SELECT 1 FROM images i WHERE i.folder_id = c.descendant_id)
+            )
+        ''')
+
+    def get_folder_id(self, dir_path: str) -> Optional[int]:
+        conn = self.get_connection()
+        row = conn.execute("SELECT id FROM folders WHERE path = ?", (os.path.normpath(dir_path),)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def delete_folder_tree(self, folder_id: int):
+        """移除目录及其所有子目录下的图片记录 (只走闭包索引，不做 LIKE 扫描)"""
+        def run(cursor):
+            cursor.execute('''
+                DELETE FROM images WHERE folder_id IN (
+                    SELECT descendant_id FROM folder_closure WHERE ancestor_id = ?
+                )
+            ''', (folder_id,))
+            self._prune_empty_folders(cursor)
+        self.write(run)
+
+    def get_folder_tree(self) -> List[dict]:
+        """
+        返回目录树所有节点 (按路径排序，父节点总在子节点之前):
+        [{'id', 'parent_id', 'path', 'image_count', 'total_count'}]
+        image_count 为本目录图片数，total_count 为包含子目录的总数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT f.id, f.parent_id, f.path,
+                   COALESCE(own.image_count, 0) AS image_count,
+                   COALESCE((
+                       SELECT SUM(fs.image_count) FROM folder_closure c
+                       JOIN folders d ON d.id = c.descendant_id
+                       JOIN folder_stats fs ON fs.dir_path = d.path
+                       WHERE c.ancestor_id = f.id
+                   ), 0) AS total_count
+            FROM folders f
+            LEFT JOIN folder_stats own ON own.dir_path = f.path
+            ORDER BY f.path
+        ''')
+        nodes = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return nodes
 
     def get_all_folders(self) -> List[str]:
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT dir_path FROM images ORDER BY dir_path")
+        cursor.execute("SELECT dir_path FROM folder_stats ORDER BY dir_path")
         folders = [row['dir_path'] for row in cursor.fetchall()]
         conn.close()
         return folders
 
-    def get_images_paginated(self, page: int = 1, page_size: int = 50, filters: dict = None) -> Tuple[List[dict], int]:
+    def get_folder_stats(self) -> List[Tuple[str, int]]:
+        """返回 [(dir_path, 图片数)]，按路径排序"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        offset = (page - 1) * page_size
-        
-        query = "SELECT DISTINCT i.* FROM images i"
+        cursor.execute("SELECT dir_path, image_count FROM folder_stats ORDER BY dir_path")
+        folders = [(row['dir_path'], row['image_count']) for row in cursor.fetchall()]
+        conn.close()
+        return folders
+
+    def _build_filter_clause(self, cursor, filters: dict = None) -> Tuple[str, list]:
+        """
+        把筛选条件转换为 WHERE 子句和参数，供分页查询、结果游标和批量打标共用。
+        filters: tags / path_keyword / exact_dir / folder_id (+ include_subfolders)
+                 untagged: 没有任何标签；tagged_by_other_model: model_id，只有其他模型产生的 AI 标签
+                 missing: 只要被标记为文件丢失的图片
+        """
         params = []
         conditions = []
 
         if filters:
             if filters.get('tags'):
-                tags = filters['tags']
+                # 选择性最高 (图片最少) 的标签放在最前：规划器从它的 id 列表出发，其余标签只做成员检查。
+                # IN 子查询只读 (tag_id, image_id) 覆盖索引，比逐行关联的 EXISTS 快一个数量级 (长尾标签更明显)
+                tags = self._order_tags_by_selectivity(cursor, filters['tags'])
                 for tag in tags:
                     sub_query = """
-                        EXISTS (
-                            SELECT 1 FROM image_tags it 
-                            JOIN tags t ON it.tag_id = t.id 
-                            WHERE it.image_id = i.id AND t.name = ?
+                        i.id IN (
+                            SELECT it.image_id FROM image_tags it
+                            JOIN tags t ON t.id = it.tag_id
+                            WHERE t.name = ?
                         )
                     """
                     conditions.append(sub_query)
@@ -133,84 +1074,369 @@ class ImageDB:
                  conditions.append("i.dir_path = ?")
                  params.append(filters['exact_dir'])
 
+            if filters.get('folder_id'):
+                if filters.get('include_subfolders'):
+                    conditions.append("i.folder_id IN (SELECT descendant_id FROM folder_closure WHERE ancestor_id = ?)")
+                else:
+                    conditions.append("i.folder_id = ?")
+                params.append(filters['folder_id'])
+
+            if filters.get('untagged'):
+                conditions.append("NOT EXISTS (SELECT 1 FROM image_tags it WHERE it.image_id = i.id)")
+
+            if filters.get('missing'):
+                conditions.append("i.missing_since IS NOT NULL")
+
+            if filters.get('tagged_by_other_model'):
+                # 有 AI 标签，但都不是由指定模型 (通常是当前模型) 产生的 -> 需要用新模型重打。
+                # 该模型的图片集合只查一次 (写成关联的 NOT EXISTS 时规划器会对每张图片走一遍 model_id 索引)
+                conditions.append("""
+                    EXISTS (SELECT 1 FROM image_tags it WHERE it.image_id = i.id AND it.is_prediction = 1)
+                    AND i.id NOT IN (SELECT it.image_id FROM image_tags it WHERE it.model_id = ?)
+                """)
+                params.append(filters['tagged_by_other_model'])
+
         where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where_clause, params
+
+    def _result_ids(self, cursor, filters: dict = None) -> Optional[array]:
+        """
+        筛选结果的完整有序 id 列表 (id 降序)，优先取缓存。
+        结果太大 (超过单项缓存上限) 时返回 None，由调用方退回 LIMIT/OFFSET 查询。
+        """
+        generation = self._generation(cursor)
+        key = normalize_filters(filters)
+        ids = result_cache.get(self.db_path, generation, key)
+        if ids is not None:
+            metrics.count('db.result_cache.hits')
+            return ids
+        metrics.count('db.result_cache.misses')
+
+        where_clause, params = self._build_filter_clause(cursor, filters)
+        with metrics.timer('db.query.count'):
+            cursor.execute(f"SELECT COUNT(*) FROM images i {where_clause}", params)
+            total_count = cursor.fetchone()[0]
+        if total_count > result_cache.max_entry_ids():
+            return None
+
+        with metrics.timer('db.query.ids'):
+            cursor.execute(f"SELECT i.id FROM images i {where_clause} ORDER BY i.id DESC", params)
+            ids = array('q', (row[0] for row in cursor))
+        result_cache.put(self.db_path, generation, key, ids)
+        return ids
+
+    def _fetch_rows_by_ids(self, cursor, ids) -> List[ImageRow]:
+        """按给定 id 顺序取行，已被删除的 id 跳过"""
+        if not ids:
+            return []
+        placeholders = ','.join(['?'] * len(ids))
+        with metrics.timer('db.query.page'):
+            cursor.execute(f"SELECT {IMAGE_ROW_COLUMNS} FROM images i WHERE i.id IN ({placeholders})", ids)
+            by_id = {row[0]: ImageRow._make(row) for row in cursor.fetchall()}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def get_images_paginated(self, page: int = 1, page_size: int = 50, filters: dict = None) -> Tuple[List[ImageRow], int]:
+        """返回 (当前页的 ImageRow 列表, 结果总数)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        offset = (page - 1) * page_size
+
+        # 结果 id 列表已缓存时：翻页只是切片 + 一次 WHERE id IN (...)
+        ids = self._result_ids(cursor, filters)
+        if ids is not None:
+            result = self._fetch_rows_by_ids(cursor, ids[offset:offset + page_size])
+            conn.close()
+            return result, len(ids)
         
-        count_sql = f"SELECT COUNT(DISTINCT i.id) FROM images i {where_clause}"
-        cursor.execute(count_sql, params)
-        total_count = cursor.fetchone()[0]
+        query = f"SELECT {IMAGE_ROW_COLUMNS} FROM images i"
+        where_clause, params = self._build_filter_clause(cursor, filters)
+        
+        count_sql = f"SELECT COUNT(*) FROM images i {where_clause}"
+        with metrics.timer('db.query.count'):
+            cursor.execute(count_sql, params)
+            total_count = cursor.fetchone()[0]
 
         data_sql = f"{query} {where_clause} ORDER BY i.id DESC LIMIT ? OFFSET ?"
         params.extend([page_size, offset])
         
-        cursor.execute(data_sql, params)
-        result = [dict(row) for row in cursor.fetchall()]
+        with metrics.timer('db.query.page'):
+            cursor.execute(data_sql, params)
+            result = [ImageRow._make(row) for row in cursor.fetchall()]
         conn.close()
         return result, total_count
 
-    # ================= Tag 操作 =================
+    def get_image_refs(self, filters: dict = None, limit: int = 200, offset: int = 0,
+                       before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[ImageRow]:
+        """
+        不计总数的 ImageRow 查询 (顺序与 get_images_paginated 一致: id 降序)
+        before_id / after_id: 键集分页，从已知 id 继续向后 / 向前取，避免深页 OFFSET 扫描
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if before_id is None and after_id is None:
+            ids = self._result_ids(cursor, filters)
+            if ids is not None:
+                rows = self._fetch_rows_by_ids(cursor, ids[offset:offset + limit])
+                conn.close()
+                return rows
 
-    def add_tag(self, tag_name: str) -> int:
+        where_clause, params = self._build_filter_clause(cursor, filters)
+        order = "DESC"
+        if before_id is not None:
+            where_clause += (" AND " if where_clause else " WHERE ") + "i.id < ?"
+            params.append(before_id)
+        elif after_id is not None:
+            where_clause += (" AND " if where_clause else " WHERE ") + "i.id > ?"
+            params.append(after_id)
+            order = "ASC"
+
+        sql = f"SELECT {IMAGE_ROW_COLUMNS} FROM images i {where_clause} ORDER BY i.id {order} LIMIT ?"
+        params.append(limit)
+        if before_id is None and after_id is None:
+            sql += " OFFSET ?"
+            params.append(offset)
+
+        with metrics.timer('db.query.refs'):
+            cursor.execute(sql, params)
+            rows = [ImageRow._make(row) for row in cursor.fetchall()]
+        conn.close()
+        if order == "ASC":
+            rows.reverse()
+        return rows
+
+    def count_images(self, filters: dict = None) -> int:
         conn = self.get_connection()
         cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag_name,))
-            conn.commit()
-            cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
-            res = cursor.fetchone()
-            return res['id'] if res else -1
-        finally:
+        where_clause, params = self._build_filter_clause(cursor, filters)
+        cursor.execute(f"SELECT COUNT(*) FROM images i {where_clause}", params)
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def iter_image_chunks(self, filters: dict = None, chunk_size: int = 500,
+                          columns: str = "i.id, i.file_path, i.missing_since"):
+        """
+        按 id 升序分批产出符合筛选条件的行 (键集分页，第一列必须是 i.id)，用于对整个图库 / 目录批量处理。
+        每批单独开连接查询，不在处理期间持有读事务；
+        处理过程中条件可能改变 (例如 untagged)，键集分页保证每张图片只会产出一次。
+        """
+        last_id = 0
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            where_clause, params = self._build_filter_clause(cursor, filters)
+            where_clause += (" AND " if where_clause else " WHERE ") + "i.id > ?"
+            params.extend([last_id, chunk_size])
+            with metrics.timer('db.query.id_chunk'):
+                cursor.execute(f"SELECT {columns} FROM images i {where_clause} ORDER BY i.id LIMIT ?", params)
+                rows = cursor.fetchall()
             conn.close()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    def iter_recent_chunks(self, filters: dict = None, chunk_size: int = 500,
+                           before: Optional[Tuple[str, int]] = None):
+        """
+        按入库时间倒序 (created_at, id 降序) 分批产出 [(created_at, ImageRow)]，供多个分片归并排序 (见 shards)。
+        before: (created_at, id) 键集位置，只取排在它之后的行
+        """
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            where_clause, params = self._build_filter_clause(cursor, filters)
+            if before is not None:
+                where_clause += (" AND " if where_clause else " WHERE ") + "(i.created_at, i.id) < (?, ?)"
+                params.extend(before)
+            params.append(chunk_size)
+            with metrics.timer('db.query.recent_chunk'):
+                cursor.execute(f"SELECT i.created_at, {IMAGE_ROW_COLUMNS} FROM images i {where_clause} "
+                               f"ORDER BY i.created_at DESC, i.id DESC LIMIT ?", params)
+                rows = [(row[0], ImageRow._make(tuple(row)[1:])) for row in cursor.fetchall()]
+            conn.close()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            before = (rows[-1][0], rows[-1][1].id)
+
+    def iter_image_id_chunks(self, filters: dict = None, chunk_size: int = 500):
+        """同 iter_image_chunks，只产出 id (array('q'))"""
+        for rows in self.iter_image_chunks(filters, chunk_size, "i.id"):
+            yield array('q', (row[0] for row in rows))
+
+    def _order_tags_by_selectivity(self, cursor, tags: List[str]) -> List[str]:
+        if len(tags) < 2:
+            return list(tags)
+        counts = self._tag_counts(cursor, tags)
+        return sorted(tags, key=lambda t: counts.get(t, 0))
+
+    def _tag_counts(self, cursor, tags: List[str]) -> Dict[str, int]:
+        placeholders = ','.join(['?'] * len(tags))
+        cursor.execute(f'''
+            SELECT t.name, COALESCE(s.image_count, 0) AS image_count FROM tags t
+            LEFT JOIN tag_stats s ON s.tag_id = t.id
+            WHERE t.name IN ({placeholders})
+        ''', list(tags))
+        return {row['name']: row['image_count'] for row in cursor.fetchall()}
+
+    # ================= Tag 操作 =================
+
+    def add_tag(self, tag_name: str) -> int:
+        return self.write(self._add_tag, tag_name)
+
+    def _add_tag(self, cursor, tag_name: str) -> int:
+        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag_name,))
+        cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
+        res = cursor.fetchone()
+        return res['id'] if res else -1
     
     def clear_tags_for_image(self, image_id: int):
-        conn = self.get_connection()
-        conn.execute("DELETE FROM image_tags WHERE image_id = ?", (image_id,))
-        conn.commit()
-        conn.close()
+        def run(cursor):
+            cursor.execute("DELETE FROM image_tags WHERE image_id = ?", (image_id,))
+            self._refresh_tag_blobs(cursor, [image_id])
+        self.write(run)
 
-    def add_image_tag(self, image_id: int, tag_name: str, confidence: float = 1.0, is_prediction: int = 0, mode: str = 'append'):
-        tag_id = self.add_tag(tag_name)
-        if tag_id == -1: return
+    # mode='unique' 已有的标签保持不变；'append' 刷新置信度与来源
+    # 用 UPSERT 代替 INSERT OR REPLACE：REPLACE 的隐式删除不会触发 tag_stats 的删除触发器
+    _IMAGE_TAG_SQL = {
+        'unique': """
+            INSERT OR IGNORE INTO image_tags (image_id, tag_id, confidence, is_prediction, model_id) 
+            VALUES (?, ?, ?, ?, ?)
+        """,
+        'append': """
+            INSERT INTO image_tags (image_id, tag_id, confidence, is_prediction, model_id) 
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(image_id, tag_id) DO UPDATE SET
+                confidence = excluded.confidence, is_prediction = excluded.is_prediction,
+                model_id = excluded.model_id
+        """,
+    }
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if mode == 'unique':
-            cursor.execute("""
-                INSERT OR IGNORE INTO image_tags (image_id, tag_id, confidence, is_prediction) 
-                VALUES (?, ?, ?, ?)
-            """, (image_id, tag_id, confidence, is_prediction))
-        else: 
-            cursor.execute("""
-                INSERT OR REPLACE INTO image_tags (image_id, tag_id, confidence, is_prediction) 
-                VALUES (?, ?, ?, ?)
-            """, (image_id, tag_id, confidence, is_prediction))
-        
-        conn.commit()
-        conn.close()
+    def add_image_tag(self, image_id: int, tag_name: str, confidence: float = 1.0, is_prediction: int = 0, mode: str = 'append',
+                      model_id: Optional[int] = None):
+        def run(cursor):
+            # 标签与关联在同一个事务里写入
+            tag_id = self._add_tag(cursor, tag_name)
+            if tag_id == -1: return
+            sql = self._IMAGE_TAG_SQL['unique' if mode == 'unique' else 'append']
+            cursor.execute(sql, (image_id, tag_id, confidence, is_prediction, model_id))
+            self._refresh_tag_blobs(cursor, [image_id])
+        self.write(run)
+
+    def add_image_tags_bulk(self, entries, mode: str = 'append', model_id: Optional[int] = None,
+                            clear_image_ids=()) -> int:
+        """
+        批量写入标签，单个事务: entries = [(image_id, tag_name, confidence, is_prediction)]。
+        clear_image_ids 中的图片先清空原有标签 (覆盖模式)。返回写入的行数
+        """
+        entries = list(entries)
+        clear_image_ids = list(clear_image_ids)
+        if not entries and not clear_image_ids:
+            return 0
+        self.write(self._add_image_tags_bulk, entries, mode, model_id, clear_image_ids)
+        return len(entries)
+
+    def _add_image_tags_bulk(self, cursor, entries, mode, model_id, clear_image_ids):
+        names = list({entry[1] for entry in entries})
+        cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(n,) for n in names])
+        tag_ids = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in cursor.execute(f"SELECT id, name FROM tags WHERE name IN ({placeholders})", chunk):
+                tag_ids[row[1]] = row[0]
+
+        if clear_image_ids:
+            cursor.executemany("DELETE FROM image_tags WHERE image_id = ?", [(i,) for i in clear_image_ids])
+        sql = self._IMAGE_TAG_SQL['unique' if mode == 'unique' else 'append']
+        cursor.executemany(sql, [(img_id, tag_ids[name], conf, is_prediction, model_id)
+                                 for img_id, name, conf, is_prediction in entries])
+        self._refresh_tag_blobs(cursor, list({entry[0] for entry in entries} | set(clear_image_ids)))
 
     # [NEW] 移除特定 Tag
     def remove_image_tag(self, image_id: int, tag_name: str):
-        conn = self.get_connection()
-        # 子查询找到 tag_id 然后删除关联
-        conn.execute('''
-            DELETE FROM image_tags 
-            WHERE image_id = ? AND tag_id = (SELECT id FROM tags WHERE name = ?)
-        ''', (image_id, tag_name))
-        conn.commit()
-        conn.close()
+        def run(cursor):
+            # 子查询找到 tag_id 然后删除关联
+            cursor.execute('''
+                DELETE FROM image_tags 
+                WHERE image_id = ? AND tag_id = (SELECT id FROM tags WHERE name = ?)
+            ''', (image_id, tag_name))
+            self._refresh_tag_blobs(cursor, [image_id])
+        self.write(run)
         
     def get_tags_for_image(self, image_id: int) -> List[dict]:
+        """[{name, confidence, model_name}]，按置信度降序；优先解码 tag_blob"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            with metrics.timer('db.query.image_tags'):
+                row = cursor.execute("SELECT tag_blob FROM images WHERE id = ?", (image_id,)).fetchone()
+                if row is None:
+                    return []
+                if row[0] is None:
+                    return self._get_tags_for_image_join(cursor, image_id)
+                entries = decode_tag_blob(row[0])
+                names = self._resolve_names(cursor, self._tag_names, "tags", [e[0] for e in entries])
+                models = self._resolve_names(cursor, self._model_names, "models", [e[3] for e in entries if e[3]])
+                return [{'name': names.get(tag_id), 'confidence': conf, 'model_name': models.get(model_id)}
+                        for tag_id, conf, _, model_id in entries]
+        finally:
+            conn.close()
+
+    def _get_tags_for_image_join(self, cursor, image_id: int) -> List[dict]:
         cursor.execute('''
-            SELECT t.name, it.confidence FROM tags t
+            SELECT t.name, it.confidence, m.name AS model_name FROM tags t
             JOIN image_tags it ON t.id = it.tag_id
+            LEFT JOIN models m ON m.id = it.model_id
             WHERE it.image_id = ?
             ORDER BY it.confidence DESC
         ''', (image_id,))
-        tags = [dict(row) for row in cursor.fetchall()]
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _resolve_names(self, cursor, cache: Dict[int, str], table: str, ids) -> Dict[int, str]:
+        """id -> name (tags / models)，未缓存的一次查出"""
+        unknown = list({i for i in ids if i not in cache})
+        for start in range(0, len(unknown), 500):
+            chunk = unknown[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in cursor.execute(f"SELECT id, name FROM {table} WHERE id IN ({placeholders})", chunk):
+                cache[row[0]] = row[1]
+        return cache
+
+    def get_model_names(self, model_ids) -> Dict[int, str]:
+        conn = self.get_connection()
+        try:
+            names = self._resolve_names(conn.cursor(), self._model_names, "models", model_ids)
+            return {i: names[i] for i in model_ids if i in names}
+        finally:
+            conn.close()
+
+    def get_tag_names(self, tag_ids) -> Dict[int, str]:
+        """tag_id -> 标签名 (用于解码 tag_blob / load_tag_vectors 的结果)"""
+        conn = self.get_connection()
+        try:
+            names = self._resolve_names(conn.cursor(), self._tag_names, "tags", tag_ids)
+            return {i: names[i] for i in tag_ids if i in names}
+        finally:
+            conn.close()
+
+    def get_tagged_image_ids(self, image_ids) -> set:
+        """image_ids 中已有任意标签的 id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        result = set()
+        for start in range(0, len(image_ids), 500):
+            chunk = list(image_ids[start:start + 500])
+            placeholders = ','.join(['?'] * len(chunk))
+            cursor.execute(f"SELECT DISTINCT image_id FROM image_tags WHERE image_id IN ({placeholders})", chunk)
+            result.update(row[0] for row in cursor.fetchall())
         conn.close()
-        return tags
+        return result
 
     def get_all_tags(self) -> List[str]:
         conn = self.get_connection()
@@ -218,4 +1444,152 @@ class ImageDB:
         cursor.execute("SELECT name FROM tags ORDER BY name")
         tags = [row['name'] for row in cursor.fetchall()]
         conn.close()
-        return tags
\ No newline at end of file
+        return tags
+
+    def get_tag_stats(self) -> Dict[str, int]:
+        """返回 {标签名: 图片数}，来自 tag_stats，不扫描 image_tags"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        with metrics.timer('db.query.tag_stats'):
+            cursor.execute('''
+                SELECT t.name, COALESCE(s.image_count, 0) AS image_count FROM tags t
+                LEFT JOIN tag_stats s ON s.tag_id = t.id
+            ''')
+            stats = {row['name']: row['image_count'] for row in cursor.fetchall()}
+        conn.close()
+        return stats
+
+    def get_tag_counts(self, tags: List[str]) -> Dict[str, int]:
+        if not tags:
+            return {}
+        conn = self.get_connection()
+        try:
+            return self._tag_counts(conn.cursor(), tags)
+        finally:
+            conn.close()
+
+    # ================= 标签打包 (tag_blob) =================
+
+    def _build_tag_blobs(self, cursor, image_ids) -> Dict[int, bytes]:
+        """从 image_tags 计算 {image_id: tag_blob} (没有标签的为空 BLOB)"""
+        grouped = {img_id: [] for img_id in image_ids}
+        for start in range(0, len(image_ids), 500):
+            chunk = list(image_ids[start:start + 500])
+            placeholders = ','.join(['?'] * len(chunk))
+            cursor.execute(f'''
+                SELECT image_id, tag_id, confidence, is_prediction, model_id FROM image_tags
+                WHERE image_id IN ({placeholders})
+            ''', chunk)
+            for row in cursor.fetchall():
+                grouped[row[0]].append(tuple(row)[1:])
+        return {img_id: encode_tag_blob(rows) for img_id, rows in grouped.items()}
+
+    def _refresh_tag_blobs(self, cursor, image_ids=None, batch: int = 5000) -> int:
+        """重建待更新 (NULL) 的 tag_blob；image_ids 为 None 时处理全部。返回重建的图片数"""
+        refreshed = 0
+        while True:
+            if image_ids is None:
+                cursor.execute("SELECT id FROM images WHERE tag_blob IS NULL LIMIT ?", (batch,))
+                ids = [row[0] for row in cursor.fetchall()]
+            else:
+                ids = list(image_ids)
+            if not ids:
+                return refreshed
+            blobs = self._build_tag_blobs(cursor, ids)
+            cursor.executemany("UPDATE images SET tag_blob = ? WHERE id = ?",
+                               [(blob, img_id) for img_id, blob in blobs.items()])
+            refreshed += len(ids)
+            if image_ids is not None:
+                return refreshed
+
+    def refresh_tag_blobs(self) -> int:
+        """批量写入标签后调用 (例如打标线程每批结束)，重建所有待更新的 tag_blob"""
+        with metrics.timer('db.refresh_tag_blobs'):
+            return self.write(self._refresh_tag_blobs)
+
+    def iter_tagged_rows(self, filters: dict = None, batch_size: int = 5000):
+        """
+        流式产出 [(id, file_path, tag_blob)]，每批 batch_size 行，id 升序，用于导出。
+        整个遍历是同一条语句 (同一个读快照) 上的 fetchmany，结果前后一致，内存只与批大小有关。
+        尚未重建的 tag_blob 在同一快照内从 image_tags 计算 (不写库)
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            side = conn.cursor()
+            where_clause, params = self._build_filter_clause(side, filters)
+            cursor.execute(f"SELECT i.id, i.file_path, i.tag_blob FROM images i {where_clause} ORDER BY i.id", params)
+            while True:
+                with metrics.timer('db.query.tag_rows'):
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    stale = [row[0] for row in rows if row[2] is None]
+                    built = self._build_tag_blobs(side, stale) if stale else {}
+                    batch = [(row[0], row[1], built[row[0]] if row[2] is None else row[2]) for row in rows]
+                yield batch
+        finally:
+            conn.close()
+
+    def iter_tag_blobs(self, filters: dict = None, chunk_size: int = 5000):
+        """同 iter_tagged_rows，按批产出 (image_ids, blobs)"""
+        for rows in self.iter_tagged_rows(filters, chunk_size):
+            yield [row[0] for row in rows], [row[2] for row in rows]
+
+    def load_tag_vectors(self, filters: dict = None, chunk_size: int = 50000) -> dict:
+        """
+        整个图库 (或筛选结果) 的全部标签，NumPy 数组形式 (见 decode_tag_blobs)，
+        例如标签共现 / 置信度分布统计。标签名用 get_tag_names 查询
+        """
+        import numpy as np
+        parts = [decode_tag_blobs(ids, blobs) for ids, blobs in self.iter_tag_blobs(filters, chunk_size)]
+        if not parts:
+            return decode_tag_blobs([], [])
+        return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+# ================= 结果集游标 =================
+
+class ImageResultCursor:
+    """
+    对某个筛选条件结果集的懒加载游标，行为类似只读列表:
+    len(cursor) / cursor[index] -> ImageRow (已被删除返回 None)
+    按窗口 (WINDOW_SIZE 行) 按需查询，最多保留 MAX_WINDOWS 个窗口，内存与结果集大小无关。
+    相邻窗口已加载时使用键集分页 (id < / id >)，避免深页 OFFSET。
+    """
+    WINDOW_SIZE = 200
+    MAX_WINDOWS = 4
+
+    def __init__(self, db: ImageDB, filters: dict = None, total_count: Optional[int] = None):
+        self.db = db
+        self.filters = dict(filters or {})
+        if total_count is None:
+            _, total_count = db.get_images_paginated(1, 1, self.filters)
+        self.total_count = total_count
+        self._windows = {}  # 窗口号 -> 行列表，按访问顺序淘汰
+
+    def __len__(self):
+        return self.total_count
+
+    def __getitem__(self, index: int):
+        if index < 0 or index >= self.total_count:
+            raise IndexError(index)
+        window_no, pos = divmod(index, self.WINDOW_SIZE)
+        rows = self._load_window(window_no)
+        return rows[pos] if pos < len(rows) else None
+
+    def _load_window(self, window_no: int) -> List[ImageRow]:
+        rows = self._windows.pop(window_no, None)
+        if rows is None:
+            prev_rows = self._windows.get(window_no - 1)
+            next_rows = self._windows.get(window_no + 1)
+            if prev_rows and len(prev_rows) == self.WINDOW_SIZE:
+                rows = self.db.get_image_refs(self.filters, self.WINDOW_SIZE, before_id=prev_rows[-1].id)
+            elif next_rows:
+                rows = self.db.get_image_refs(self.filters, self.WINDOW_SIZE, after_id=next_rows[0].id)
+            else:
+                rows = self.db.get_image_refs(self.filters, self.WINDOW_SIZE, offset=window_no * self.WINDOW_SIZE)
+        # 重新插入到末尾 = 最近使用
+        self._windows[window_no] = rows
+        while len(self._windows) > self.MAX_WINDOWS:
+            self._windows.pop(next(iter(self._windows)))
+        return rows
@@ -0,0 +1,287 @@
+"""
+单写入线程：进程内对同一个数据库的写入都交给一个线程、一条连接执行，工作线程之间不再争抢写锁。
+
+写入方把写操作 (接收 cursor 的函数) 放进队列，拿到一个 Future。写线程每次取出队列里已有的操作
+(最多 MAX_BATCH_OPS 个，执行时间累计超过 MAX_BATCH_MS 就提前结束)，在同一个事务里依次执行后统一提交：
+- 空闲时单个操作立即执行提交，不额外等待；并发写入越多，每次提交合并的操作越多 (组提交)
+- 每个操作在自己的 SAVEPOINT 里执行，出错只回滚它自己，异常经 Future 交回调用方，不会被吞掉
+- Future 在 COMMIT 之后才完成，调用方随后用自己的读连接一定能读到写入结果
+读取仍然各自开连接 (WAL 下读写互不阻塞)。
+
+BEGIN / COMMIT 被其他进程 (或外部连接) 的写锁挡住时按 LOCK_RETRIES 重试；仍然失败时这一批的 Future 全部
+收到异常，写线程继续处理后面的写入。VACUUM / 检查点这类不能放在事务里的操作用 exclusive=True 提交：
+在写线程的连接上单独执行，期间其他写入排队，不会另开连接去争写锁。
+
+写操作里不能再调用 ImageDB 的写入方法 (会在写线程上等待自己)；需要组合时直接在同一个 cursor 上执行 SQL。
+"""
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from instrumentation import metrics
+
+# 一个事务最多合并的操作数 / 累计执行时间 (毫秒)，超过后先提交，限制单次提交的延迟
+MAX_BATCH_OPS = 256
+MAX_BATCH_MS = 50.0
+# BEGIN / COMMIT 遇到锁 (已等满连接的 busy timeout) 后的重试次数与间隔 (秒，逐次递增)
+LOCK_RETRIES = 5
+LOCK_RETRY_S = 0.5
+# call() 默认等待提交的最长时间 (秒)；超时抛出 TimeoutError，操作仍留在队列里，写线程照常运行
+CALL_TIMEOUT_S = 120.0
+
+_STOP = object()
+
+def _is_locked(error: Exception) -> bool:
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class DBWriter:
+    def __init__(self, db_path: str, connect):
+        """connect: 在写线程里调用，返回新连接 (ImageDB.get_connection)"""
+        self.db_path = db_path
+        self._connect = connect
+        self._queue = queue.Queue()
+        self._ops = 0
+        self._batches = 0
+        self._failed = 0
+        self._max_depth = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._conn = None
+        # 取批次时遇到的独占操作，留到下一轮单独执行
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name=f"DBWriter-{os.path.basename(db_path)}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, exclusive: bool = False) -> Future:
+        """
+        异步写入：fn(cursor, *args) 在写线程的事务中执行，返回 Future (结果为 fn 的返回值)。
+        exclusive: 不开事务、单独执行 (VACUUM / 检查点等)
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("write operations cannot be nested inside another write")
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"database writer for {self.db_path} is stopped")
+            self._queue.put((future, fn, args, time.perf_counter(), exclusive))
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return future
+
+    def call(self, fn, *args, timeout: float = CALL_TIMEOUT_S, exclusive: bool = False):
+        """同步写入：等到提交完成后返回 fn 的结果 (或抛出它的异常)；timeout 为 None 时一直等待"""
+        return self.submit(fn, *args, exclusive=exclusive).result(timeout)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            'depth': self._queue.qsize(),
+            'max_depth': self._max_depth,
+            'ops': self._ops,
+            'batches': self._batches,
+            'failed': self._failed,
+        }
+
+    def stop(self, timeout: float = None):
+        """处理完已入队的操作后退出"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        """取第一个操作 (先取上一轮留下的)，再取队列里已有的操作，不等待新的写入；独占操作单独成批"""
+        first, self._carry = self._carry, None
+        if first is None:
+            first = self._queue.get()
+        batch = [first]
+        if first is _STOP or first[4]:
+            return batch
+        while len(batch) < MAX_BATCH_OPS:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[4]:
+                self._carry = item
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _cursor(self):
+        if self._conn is None:
+            self._conn = self._connect()
+            # 手动控制事务 (BEGIN IMMEDIATE / SAVEPOINT / COMMIT)
+            self._conn.isolation_level = None
+        return self._conn.cursor()
+
+    def _run(self):
+        pending = []
+        stopping = False
+        while not stopping or pending:
+            if not pending:
+                pending = self._next_batch()
+            if pending[-1] is _STOP:
+                pending.pop()
+                stopping = True
+            if not pending:
+                continue
+            try:
+                cursor = self._cursor()
+                if pending[0][4]:
+                    pending = self._execute_exclusive(cursor, pending[0])
+                else:
+                    pending = self._execute(cursor, pending)
+            except Exception as e:
+                print(f"[DB Writer] batch failed: {e}")
+                self._fail(pending, e)
+                pending = []
+        if self._conn is not None:
+            self._conn.close()
+
+    def _fail(self, batch, error: Exception):
+        """整批失败 (拿不到写锁 / 连接异常)：回滚，尚未完成的 Future 全部收到异常，写线程继续运行"""
+        if self._conn is not None:
+            try:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            except Exception:
+                # 连接已不可用，下一批重新连接
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+        for future, *_ in batch:
+            if not future.done():
+                self._failed += 1
+                future.set_exception(error)
+        metrics.count('db.writer.failed_batches')
+
+    def _execute_locked(self, cursor, sql: str):
+        """BEGIN / COMMIT：被外部写锁挡住时重试，超过 LOCK_RETRIES 次后抛出"""
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                cursor.execute(sql)
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_locked(e) or attempt == LOCK_RETRIES:
+                    raise
+                metrics.count('db.writer.lock_retries')
+                print(f"[DB Writer] {sql}: {e}, retrying ({attempt + 1}/{LOCK_RETRIES})")
+                time.sleep(LOCK_RETRY_S * (attempt + 1))
+
+    def _execute_exclusive(self, cursor, item) -> list:
+        future, fn, args, queued_at, _ = item
+        if future.set_running_or_notify_cancel():
+            metrics.observe('db.writer.wait', time.perf_counter() - queued_at)
+            try:
+                future.set_result(fn(cursor, *args))
+                self._ops += 1
+            except Exception as e:
+                self._failed += 1
+                future.set_exception(e)
+        return []
+
+    def _execute(self, cursor, batch) -> list:
+        """在一个事务里执行 batch，返回因超出 MAX_BATCH_MS 而留到下一个事务的操作"""
+        done = []
+        self._execute_locked(cursor, "BEGIN IMMEDIATE")
+        start = time.perf_counter()
+        rest = []
+        for index, (future, fn, args, queued_at, _) in enumerate(batch):
+            if (time.perf_counter() - start) * 1000 > MAX_BATCH_MS and done:
+                rest = batch[index:]
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            metrics.observe('db.writer.wait', time.perf_counter() - queued_at)
+            cursor.execute("SAVEPOINT op")
+            try:
+                result = fn(cursor, *args)
+            except BaseException as e:
+                cursor.execute("ROLLBACK TO op")
+                cursor.execute("RELEASE op")
+                self._failed += 1
+                metrics.count('db.writer.failed')
+                future.set_exception(e)
+                continue
+            cursor.execute("RELEASE op")
+            done.append((future, result))
+
+        try:
+            with metrics.timer('db.writer.commit'):
+                self._execute_locked(cursor, "COMMIT")
+        except Exception as e:
+            print(f"[DB Writer] commit failed: {e}")
+            self._fail(batch[:len(batch) - len(rest)], e)
+            return rest
+
+        self._ops += len(done)
+        self._batches += 1
+        metrics.count('db.writer.ops', len(done))
+        metrics.count('db.writer.batches')
+        for future, result in done:
+            future.set_result(result)
+        return rest
+
+# ================= 每个数据库文件一个写线程 =================
+
+_writers = {}
+_writers_lock = threading.Lock()
+# shutdown_writers 之后不再创建写线程 (退出过程中的写入直接报错，而不是悄悄起一个新线程)
+_shut_down = False
+
+def get_writer(db_path: str, connect) -> DBWriter:
+    db_path = os.path.abspath(db_path)
+    with _writers_lock:
+        if _shut_down:
+            raise RuntimeError("database writers have been shut down")
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = DBWriter(db_path, connect)
+        return writer
+
+def stop_writer(db_path: str, timeout: float = None):
+    """提交并停止某个数据库的写线程 (例如删除 / 替换该数据库文件之前)"""
+    with _writers_lock:
+        writer = _writers.pop(os.path.abspath(db_path), None)
+    if writer is not None:
+        writer.stop(timeout)
+
+def writer_stats() -> dict:
+    """{db_path: DBWriter.stats()}"""
+    with _writers_lock:
+        return {path: writer.stats() for path, writer in _writers.items()}
+
+def format_writer_stats() -> str:
+    lines = []
+    for path, s in writer_stats().items():
+        avg = s['ops'] / s['batches'] if s['batches'] else 0
+        lines.append(f"写入队列: {s['depth']} (峰值 {s['max_depth']})   已提交 {s['ops']:,} 个操作 / "
+                     f"{s['batches']:,} 次事务 (平均每次 {avg:.1f})   失败 {s['failed']}")
+    return "\n".join(lines)
+
+def shutdown_writers(timeout: float = None):
+    """退出前调用：等待所有已入队的写入提交，之后不再接受写入"""
+    global _shut_down
+    with _writers_lock:
+        _shut_down = True
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop(timeout)
+
+atexit.register(shutdown_writers)
@@ -5,20 +5,37 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                                QPushButton, QLabel, QListWidget, QListWidgetItem, QFileDialog, 
                                QSplitter, QLineEdit, QProgressBar, QMessageBox, QTabWidget,
                                QDialog, QCheckBox, QRadioButton, QButtonGroup, QFormLayout,
-                               QComboBox, QSpinBox, QMenu, QInputDialog) # [NEW] Added QInputDialog
-from PySide6.QtCore import Qt, QSize, Slot
-from PySide6.QtGui import QIcon, QAction, QCursor
+                               QComboBox, QSpinBox, QMenu, QInputDialog, QListView,
+                               QAbstractItemView, QTreeWidget, QTreeWidgetItem,
+                               QTreeWidgetItemIterator, QPlainTextEdit)
+from PySide6.QtCore import Qt, QSize, Slot, QTimer, QItemSelection, QItemSelectionModel
+from PySide6.QtGui import QIcon, QAction, QCursor, QPixmap, QFontDatabase
 
-from database import ImageDB
-from workers import ImportWorker, ThumbnailWorker, TaggerWorker
-from gui_viewer import ImageViewerWindow
+from database import ImageDB, ImageResultCursor
+from workers import (ImportWorker, ThumbnailWorker, TaggerWorker, ModelLoadWorker, IntegrityCheckWorker,
+                     TagTransferWorker, SidebarLoadWorker, RulePreviewWorker)
+from model_registry import ModelRegistry
+from gui_models import TagListModel
+from watcher import LibraryWatcher
+from maintenance import MaintenanceScheduler, format_storage, ACTION_FULL_VACUUM, ACTION_QUICK_CHECK
+from db_writer import format_writer_stats, shutdown_writers
+from instrumentation import metrics, startup
+from tag_io import FORMATS, FORMAT_TXT
+from tag_rules import RuleSet, format_preview
+
+# 侧栏筛选输入防抖 (毫秒)
+FILTER_DEBOUNCE_MS = 150
+# 启动后空闲多久开始后台预加载默认模型 (毫秒)
+MODEL_PRELOAD_DELAY_MS = 3000
+# 性能统计面板刷新间隔 (毫秒)
+STATS_REFRESH_MS = 1000
 
 # 样式
 STYLE_SHEET = """
     QMainWindow { background-color: #2b2b2b; color: #ffffff; }
     QWidget { color: #ffffff; }
-    QListWidget, QTreeWidget { background-color: #333333; border: 1px solid #444; }
-    QListWidget::item:selected { background-color: #0078d7; }
+    QListWidget, QListView, QTreeWidget { background-color: #333333; border: 1px solid #444; }
+    QListWidget::item:selected, QListView::item:selected { background-color: #0078d7; }
     QLineEdit, QSpinBox, QComboBox { background-color: #333333; color: #ffffff; border: 1px solid #555; padding: 4px;}
     QPushButton { background-color: #444444; border: 1px solid #555; padding: 6px; }
     QPushButton:hover { background-color: #555555; }
@@ -35,7 +52,7 @@ STYLE_SHEET = """
 # ================= 对话框类 (保持不变) =================
 
 class ImportDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, model_names=None):
         super().__init__(parent)
         self.setWindowTitle("导入选项")
         self.resize(400, 350)
@@ -74,6 +91,11 @@ class ImportDialog(QDialog):
         self.lbl_type = QLabel("注意：导入时仅支持 AI 自动打标")
         self.tag_layout.addWidget(self.lbl_type)
 
+        self.tag_layout.addWidget(QLabel("AI 模型:"))
+        self.cmb_model = QComboBox()
+        self.cmb_model.addItems(model_names or [])
+        self.tag_layout.addWidget(self.cmb_model)
+
         self.layout.addWidget(self.tag_options)
         
         self.group_tag.toggled.connect(self.tag_options.setVisible)
@@ -93,28 +115,73 @@ class ImportDialog(QDialog):
         return {
             'recursive': self.chk_recursive.isChecked(),
             'auto_tag': self.group_tag.isChecked(),
-            'tag_mode': mode_map[self.btn_group_mode.checkedId()]
+            'tag_mode': mode_map[self.btn_group_mode.checkedId()],
+            'model': self.cmb_model.currentText() or None
         }
 
 class BatchTagDialog(QDialog):
-    def __init__(self, parent=None):
+    # 打标范围
+    SCOPE_SELECTED = 'selected'
+    SCOPE_FILTER = 'filter'
+    SCOPE_LIBRARY = 'library'
+
+    def __init__(self, parent=None, model_names=None, selected_count=0, filtered_count=0, library_count=0,
+                 preview_callback=None):
+        """preview_callback(get_data() 的结果) -> 未启动的 RulePreviewWorker (规则有误时抛出 ValueError)"""
         super().__init__(parent)
+        self.preview_callback = preview_callback
+        self.preview_worker = None
         self.setWindowTitle("批量打标")
-        self.resize(400, 400)
+        self.resize(400, 500)
         self.layout = QVBoxLayout(self)
+
+        self.layout.addWidget(QLabel("打标范围:"))
+        self.cmb_scope = QComboBox()
+        if selected_count:
+            self.cmb_scope.addItem(f"选中的图片 ({selected_count})", self.SCOPE_SELECTED)
+        self.cmb_scope.addItem(f"当前筛选结果 ({filtered_count})", self.SCOPE_FILTER)
+        self.cmb_scope.addItem(f"整个图库 ({library_count})", self.SCOPE_LIBRARY)
+        self.layout.addWidget(self.cmb_scope)
+
+        self.chk_untagged = QCheckBox("仅处理没有任何标签的图片")
+        self.chk_older_model = QCheckBox("仅处理由其他模型打过标的图片 (换模型后重打)")
+        self.layout.addWidget(self.chk_untagged)
+        self.layout.addWidget(self.chk_older_model)
+        self.cmb_scope.currentIndexChanged.connect(self.update_scope_options)
         
         self.cmb_method = QComboBox()
         self.cmb_method.addItem("AI 自动识别", "ai")
-        self.cmb_method.addItem("正则表达式 (文件名)", "regex")
+        self.cmb_method.addItem("规则 / 正则表达式 (文件名、文件夹)", "regex")
         self.layout.addWidget(QLabel("打标方式:"))
         self.layout.addWidget(self.cmb_method)
+
+        self.model_widget = QWidget()
+        self.model_layout = QVBoxLayout(self.model_widget)
+        self.cmb_model = QComboBox()
+        self.cmb_model.addItems(model_names or [])
+        self.model_layout.addWidget(QLabel("AI 模型:"))
+        self.model_layout.addWidget(self.cmb_model)
+        self.layout.addWidget(self.model_widget)
         
         self.regex_widget = QWidget()
         self.regex_layout = QVBoxLayout(self.regex_widget)
-        self.regex_input = QLineEdit()
-        self.regex_input.setPlaceholderText("例如: (.*?)_image")
-        self.regex_layout.addWidget(QLabel("正则表达式:"))
+        self.regex_input = QPlainTextEdit()
+        self.regex_input.setPlaceholderText("每行一条: [名称 = ] 目标: 正则 [=> 标签]\n"
+                                            "目标: name 文件名 / stem 不含扩展名 / folder 所在文件夹 / path 任一级目录\n"
+                                            "例如:\n(.*?)_image\n人像 = folder: ^(portrait|人像)$ => portrait\n"
+                                            "path: (?i)^screenshots?$ => screenshot")
+        self.regex_input.setMaximumHeight(120)
+        self.regex_layout.addWidget(QLabel("规则 (省略 \"=> 标签\" 时匹配内容本身作为标签):"))
         self.regex_layout.addWidget(self.regex_input)
+        btn_preview = QPushButton("预览 (不写入)")
+        btn_preview.clicked.connect(self.preview_rules)
+        self.btn_preview = btn_preview
+        self.lbl_preview = QLabel()
+        self.lbl_preview.setWordWrap(True)
+        self.lbl_preview.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.regex_layout.addWidget(btn_preview)
+        self.regex_layout.addWidget(self.lbl_preview)
+        btn_preview.setEnabled(preview_callback is not None)
         self.layout.addWidget(self.regex_widget)
         self.regex_widget.setVisible(False)
         
@@ -148,18 +215,137 @@ class BatchTagDialog(QDialog):
         btn_layout.addWidget(btn_cancel)
         self.layout.addLayout(btn_layout)
 
+        self.update_scope_options()
+
     def on_method_change(self):
         is_regex = (self.cmb_method.currentData() == 'regex')
         self.regex_widget.setVisible(is_regex)
+        self.model_widget.setVisible(not is_regex)
+        self.update_scope_options()
+
+    def preview_rules(self):
+        # 试运行在后台线程中逐批扫描范围内的图片，界面只显示进度
+        try:
+            worker = self.preview_callback(self.get_data())
+        except ValueError as e:
+            self.lbl_preview.setText(str(e))
+            return
+        self.stop_preview()
+        self.preview_worker = worker
+        worker.progress_signal.connect(lambda n: self.lbl_preview.setText(f"预览中... 已检查 {n} 张"))
+        worker.finished_signal.connect(lambda result: self.lbl_preview.setText(format_preview(result)))
+        worker.failed_signal.connect(self.lbl_preview.setText)
+        worker.finished.connect(lambda: self.btn_preview.setEnabled(True))
+        self.btn_preview.setEnabled(False)
+        self.lbl_preview.setText("预览中...")
+        worker.start()
+
+    def stop_preview(self):
+        if self.preview_worker is not None:
+            self.preview_worker.stop()
+            self.preview_worker.wait()
+            self.preview_worker = None
+
+    def done(self, result):
+        # 确定 / 取消 / 关闭窗口都会经过这里
+        self.stop_preview()
+        super().done(result)
+
+    def update_scope_options(self):
+        # 附加条件只对按筛选条件查询的范围有效；"其他模型" 只对 AI 打标有意义
+        by_query = self.cmb_scope.currentData() != self.SCOPE_SELECTED
+        self.chk_untagged.setEnabled(by_query)
+        self.chk_older_model.setEnabled(by_query and self.cmb_method.currentData() == 'ai')
 
     def get_data(self):
         mode_map = {0: 'append', 1: 'overwrite', 2: 'unique', 3: 'skip'}
         return {
             'method': self.cmb_method.currentData(),
-            'regex': self.regex_input.text(),
-            'mode': mode_map[self.btn_group.checkedId()]
+            'regex': self.regex_input.toPlainText(),
+            'mode': mode_map[self.btn_group.checkedId()],
+            'model': self.cmb_model.currentText() or None,
+            'scope': self.cmb_scope.currentData(),
+            'untagged': self.chk_untagged.isEnabled() and self.chk_untagged.isChecked(),
+            'older_model': self.chk_older_model.isEnabled() and self.chk_older_model.isChecked(),
         }
 
+class StatsDialog(QDialog):
+    """
+    性能统计面板：数据库大小 / WAL / 空闲页 (见 maintenance)、写入队列深度 (见 db_writer)
+    与各阶段耗时直方图、计数 (见 instrumentation)，打开期间定时刷新
+    """
+    def __init__(self, parent=None, maintenance=None):
+        super().__init__(parent)
+        self.setWindowTitle("性能统计")
+        self.resize(900, 560)
+        self.layout = QVBoxLayout(self)
+        self.maintenance = maintenance
+
+        self.storage_label = QLabel()
+        self.storage_label.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.storage_label.setWordWrap(True)
+        self.layout.addWidget(self.storage_label)
+        if maintenance is None:
+            self.storage_label.hide()
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.layout.addWidget(self.text)
+
+        btn_layout = QHBoxLayout()
+        if maintenance is not None:
+            for title, tip, action in (
+                    ("立即维护", "检查点 / 回收空闲页 / 更新查询统计 (平时在空闲时自动进行)", None),
+                    ("完整压缩", "VACUUM 重写整个数据库文件，并启用增量回收", ACTION_FULL_VACUUM),
+                    ("完整性检查", "PRAGMA quick_check", ACTION_QUICK_CHECK)):
+                btn = QPushButton(title)
+                btn.setToolTip(tip)
+                btn.clicked.connect(lambda checked=False, a=action: self.run_maintenance(a))
+                btn_layout.addWidget(btn)
+            maintenance.result_signal.connect(self.on_maintenance_result)
+        btn_reset = QPushButton("清零")
+        btn_reset.clicked.connect(self.reset_stats)
+        btn_close = QPushButton("关闭")
+        btn_close.clicked.connect(self.close)
+        btn_layout.addWidget(btn_reset)
+        btn_layout.addWidget(btn_close)
+        self.layout.addLayout(btn_layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(STATS_REFRESH_MS)
+        self.refresh()
+
+    def refresh(self):
+        bar = self.text.verticalScrollBar()
+        pos = bar.value()
+        self.text.setPlainText(metrics.report())
+        bar.setValue(pos)
+        if self.maintenance is not None:
+            self.storage_label.setText(self.storage_text())
+
+    def storage_text(self) -> str:
+        writers = format_writer_stats()
+        return format_storage(self.maintenance.last_stats) + ("\n" + writers if writers else "")
+
+    def run_maintenance(self, action):
+        if action == ACTION_FULL_VACUUM:
+            reply = QMessageBox.question(self, "完整压缩",
+                                         "将重写整个数据库文件，大图库可能需要几分钟，期间导入 / 打标会等待。继续吗?",
+                                         QMessageBox.Yes | QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        self.maintenance.request(action)
+        self.storage_label.setText(self.storage_text() + "\n  维护进行中...")
+
+    def on_maintenance_result(self, action, message):
+        QMessageBox.information(self, "数据库维护", message)
+
+    def reset_stats(self):
+        metrics.reset()
+        self.refresh()
+
 # ================= 主窗口 =================
 
 class MainWindow(QMainWindow):
@@ -174,15 +360,26 @@ class MainWindow(QMainWindow):
         self.models_dir = os.path.join(self.base_dir, "models")
         
         self.db = ImageDB(self.db_path)
+        self.model_registry = ModelRegistry(self.models_dir)
+        self.model_loaders = []
+        self.watcher = None
+        self.watch_tag_job_id = None
+        self.maintenance = None
         
         self.current_page = 1
         self.page_size = 50
         self.total_images = 0
         self.current_filters = {}
-        self.ai_engine = None 
+        self.selected_tags = set()
+        self.image_items = {}
+        self._restoring_tag_selection = False
+        self._folder_filter_text = ""
         
         self.init_ui()
-        self.refresh_all_data()
+        # 窗口先显示，首页与侧栏在事件循环开始后再加载 (侧栏在后台线程查询)
+        QTimer.singleShot(0, self.start_initial_load)
+        # 空闲时在后台预加载默认模型，首次打标无需等待
+        QTimer.singleShot(MODEL_PRELOAD_DELAY_MS, self.preload_default_model)
 
     def init_ui(self):
         main_widget = QWidget()
@@ -202,8 +399,23 @@ class MainWindow(QMainWindow):
         btn_import.clicked.connect(self.open_import_dialog)
         btn_batch = QPushButton("批量打标")
         btn_batch.clicked.connect(self.open_batch_tag_dialog)
+        btn_stats = QPushButton("统计")
+        btn_stats.setToolTip("查看导入 / 打标 / 查询各阶段的耗时统计")
+        btn_stats.clicked.connect(self.open_stats_dialog)
+        btn_transfer = QPushButton("标签文件")
+        btn_transfer.setToolTip("导出 / 导入标签 (当前筛选结果，未筛选时为整个图库)")
+        transfer_menu = QMenu(btn_transfer)
+        for action, title in (('export', "导出"), ('import', "导入")):
+            sub_menu = transfer_menu.addMenu(title)
+            for fmt in FORMATS:
+                label = "同名 .txt 标注文件" if fmt == FORMAT_TXT else fmt.upper()
+                sub_menu.addAction(label).triggered.connect(
+                    lambda checked=False, a=action, f=fmt: self.start_tag_transfer(a, f))
+        btn_transfer.setMenu(transfer_menu)
         tool_layout.addWidget(btn_import)
         tool_layout.addWidget(btn_batch)
+        tool_layout.addWidget(btn_transfer)
+        tool_layout.addWidget(btn_stats)
         left_layout.addLayout(tool_layout)
         
         # 搜索与重置
@@ -228,12 +440,27 @@ class MainWindow(QMainWindow):
         tags_layout.setContentsMargins(0, 5, 0, 0)
         self.tag_search = QLineEdit()
         self.tag_search.setPlaceholderText("筛选标签...")
-        self.tag_search.textChanged.connect(self.filter_tag_list)
-        tags_layout.addWidget(self.tag_search)
-        self.tag_list_widget = QListWidget()
-        self.tag_list_widget.setSelectionMode(QListWidget.MultiSelection)
-        self.tag_list_widget.itemSelectionChanged.connect(self.apply_filters)
-        tags_layout.addWidget(self.tag_list_widget)
+        self.cmb_tag_sort = QComboBox()
+        self.cmb_tag_sort.addItem("按名称", TagListModel.SORT_BY_NAME)
+        self.cmb_tag_sort.addItem("按数量", TagListModel.SORT_BY_COUNT)
+        self.cmb_tag_sort.currentIndexChanged.connect(self.on_tag_sort_change)
+        tag_search_layout = QHBoxLayout()
+        tag_search_layout.addWidget(self.tag_search)
+        tag_search_layout.addWidget(self.cmb_tag_sort)
+        tags_layout.addLayout(tag_search_layout)
+        # 标签很多时逐键过滤会卡顿，这里用模型 + 防抖
+        self.tag_model = TagListModel(self)
+        self.tag_list_view = QListView()
+        self.tag_list_view.setModel(self.tag_model)
+        self.tag_list_view.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.tag_list_view.setUniformItemSizes(True)
+        self.tag_list_view.selectionModel().selectionChanged.connect(self.on_tag_selection_changed)
+        tags_layout.addWidget(self.tag_list_view)
+        self.tag_filter_timer = QTimer(self)
+        self.tag_filter_timer.setSingleShot(True)
+        self.tag_filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self.tag_filter_timer.timeout.connect(lambda: self.filter_tag_list(self.tag_search.text()))
+        self.tag_search.textChanged.connect(self.tag_filter_timer.start)
         self.left_tabs.addTab(tab_tags, "标签")
         
         # 文件夹页
@@ -242,13 +469,33 @@ class MainWindow(QMainWindow):
         folders_layout.setContentsMargins(0, 5, 0, 0)
         self.folder_search = QLineEdit()
         self.folder_search.setPlaceholderText("筛选文件夹...")
-        self.folder_search.textChanged.connect(self.filter_folder_list)
         folders_layout.addWidget(self.folder_search)
-        self.folder_list_widget = QListWidget()
-        self.folder_list_widget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.folder_list_widget.customContextMenuRequested.connect(self.show_folder_menu)
-        self.folder_list_widget.itemClicked.connect(self.on_folder_clicked)
-        folders_layout.addWidget(self.folder_list_widget)
+        self.folder_filter_timer = QTimer(self)
+        self.folder_filter_timer.setSingleShot(True)
+        self.folder_filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self.folder_filter_timer.timeout.connect(lambda: self.filter_folder_list(self.folder_search.text()))
+        self.folder_search.textChanged.connect(self.folder_filter_timer.start)
+        self.chk_subfolders = QCheckBox("包含子文件夹")
+        self.chk_subfolders.setChecked(True)
+        self.chk_subfolders.toggled.connect(self.apply_filters)
+        folders_layout.addWidget(self.chk_subfolders)
+        self.folder_tree = QTreeWidget()
+        self.folder_tree.setHeaderHidden(True)
+        self.folder_tree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.folder_tree.customContextMenuRequested.connect(self.show_folder_menu)
+        self.folder_tree.itemClicked.connect(self.on_folder_clicked)
+        folders_layout.addWidget(self.folder_tree)
+        watch_layout = QHBoxLayout()
+        self.chk_watch = QCheckBox("监视文件夹变化")
+        self.chk_watch.setToolTip("自动同步已导入目录中新增 / 删除 / 移动的图片")
+        self.chk_watch.toggled.connect(self.toggle_watcher)
+        self.chk_watch_tag = QCheckBox("新图片自动打标")
+        self.chk_watch_tag.setEnabled(False)
+        self.chk_watch.toggled.connect(self.chk_watch_tag.setEnabled)
+        self.chk_watch_tag.toggled.connect(self.on_watch_tag_toggled)
+        watch_layout.addWidget(self.chk_watch)
+        watch_layout.addWidget(self.chk_watch_tag)
+        folders_layout.addLayout(watch_layout)
         self.left_tabs.addTab(tab_folders, "文件夹")
         
         left_layout.addWidget(self.left_tabs)
@@ -345,51 +592,148 @@ class MainWindow(QMainWindow):
         self.load_folders_list()
         self.refresh_image_list()
 
-    def load_tags_list(self):
-        self.tag_list_widget.clear()
-        tags = self.db.get_all_tags()
-        for tag in tags:
-            self.tag_list_widget.addItem(tag)
+    def start_initial_load(self):
+        startup.mark('shown')
+        self.refresh_image_list()
+        startup.mark('first_page')
+        self.sidebar_loader = SidebarLoadWorker(self.db_path)
+        self.sidebar_loader.loaded_signal.connect(self.on_initial_sidebars_loaded)
+        self.sidebar_loader.start()
+
+    def on_initial_sidebars_loaded(self, tag_stats, folder_tree):
+        self.load_tags_list(tag_stats)
+        self.load_folders_list(folder_tree)
+        startup.mark('sidebars')
+        print(f"[Startup] {startup.report()}")
+        # 启动完成后再开始后台维护 (检查点 / 空间回收 / 查询统计)
+        self.maintenance = MaintenanceScheduler(self.db_path)
+        self.maintenance.start()
+
+    def load_tags_list(self, tag_stats=None):
+        # 与数据库做差量同步，不再清空重建
+        if tag_stats is None:
+            tag_stats = self.db.get_tag_stats()
+        self.update_tag_model(self.tag_model.sync_tags, tag_stats)
+        self.selected_tags = {t for t in self.selected_tags if self.tag_model.contains(t)}
         self.filter_tag_list(self.tag_search.text())
             
-    def load_folders_list(self):
-        self.folder_list_widget.clear()
-        folders = self.db.get_all_folders()
-        item_all = QListWidgetItem("全部图片")
-        item_all.setData(Qt.UserRole, None)
-        self.folder_list_widget.addItem(item_all)
-        for f in folders:
-            item = QListWidgetItem(f)
-            item.setData(Qt.UserRole, f)
-            self.folder_list_widget.addItem(item)
+    def load_folders_list(self, folder_tree=None):
+        # 记住当前选中的目录，重建后恢复
+        current = self.folder_tree.currentItem()
+        current_id = current.data(0, Qt.UserRole) if current else None
+
+        self.folder_tree.clear()
+        item_all = QTreeWidgetItem(["全部图片"])
+        item_all.setData(0, Qt.UserRole, None)
+        self.folder_tree.addTopLevelItem(item_all)
+
+        # 节点按路径排序，父节点总在子节点之前
+        items = {}
+        if folder_tree is None:
+            folder_tree = self.db.get_folder_tree()
+        for node in folder_tree:
+            name = os.path.basename(node['path']) or node['path']
+            item = QTreeWidgetItem([f"{name} ({node['total_count']})"])
+            item.setData(0, Qt.UserRole, node['id'])
+            item.setData(0, Qt.UserRole + 1, node['path'])
+            item.setToolTip(0, f"{node['path']}\n本目录: {node['image_count']}  含子目录: {node['total_count']}")
+            parent = items.get(node['parent_id'])
+            if parent:
+                parent.addChild(item)
+            else:
+                self.folder_tree.addTopLevelItem(item)
+            items[node['id']] = item
+
+        self.folder_tree.expandToDepth(0)
+        restored = items.get(current_id, item_all)
+        self.folder_tree.setCurrentItem(restored)
+        self._folder_filter_text = ""
         self.filter_folder_list(self.folder_search.text())
 
     def filter_tag_list(self, text):
-        search_text = text.lower()
-        for i in range(self.tag_list_widget.count()):
-            item = self.tag_list_widget.item(i)
-            item.setHidden(search_text not in item.text().lower())
+        self.update_tag_model(self.tag_model.set_filter, text)
+
+    def on_tag_sort_change(self):
+        self.update_tag_model(self.tag_model.set_sort_mode, self.cmb_tag_sort.currentData())
+
+    def update_tag_model(self, func, *args):
+        """修改标签模型时屏蔽选择信号，结束后按名称恢复选中"""
+        self._restoring_tag_selection = True
+        try:
+            func(*args)
+        finally:
+            self._restoring_tag_selection = False
+        self.restore_tag_selection()
+
+    def restore_tag_selection(self):
+        """模型重置后选中状态会丢失，按名称重新选中仍可见的标签"""
+        selection = QItemSelection()
+        for name in self.selected_tags:
+            row = self.tag_model.row_of(name)
+            if row >= 0:
+                index = self.tag_model.index(row)
+                selection.select(index, index)
+        sel_model = self.tag_list_view.selectionModel()
+        sel_model.blockSignals(True)
+        sel_model.select(selection, QItemSelectionModel.ClearAndSelect)
+        sel_model.blockSignals(False)
+        self.tag_list_view.viewport().update()
+
+    def on_tag_selection_changed(self, selected, deselected):
+        if self._restoring_tag_selection:
+            return
+        for index in deselected.indexes():
+            self.selected_tags.discard(index.data(TagListModel.NameRole))
+        for index in selected.indexes():
+            self.selected_tags.add(index.data(TagListModel.NameRole))
+        self.apply_filters()
 
     def filter_folder_list(self, text):
         search_text = text.lower()
-        for i in range(self.folder_list_widget.count()):
-            item = self.folder_list_widget.item(i)
-            item.setHidden(search_text not in item.text().lower())
+        if search_text == self._folder_filter_text:
+            return
+        self._folder_filter_text = search_text
+
+        # 命中的目录及其所有上级目录可见；只修改状态变化的节点
+        visible = set()
+        it = QTreeWidgetItemIterator(self.folder_tree)
+        while it.value():
+            item = it.value()
+            path = item.data(0, Qt.UserRole + 1) or item.text(0)
+            if search_text in path.lower():
+                node = item
+                while node is not None and id(node) not in visible:
+                    visible.add(id(node))
+                    node = node.parent()
+            it += 1
+
+        it = QTreeWidgetItemIterator(self.folder_tree)
+        while it.value():
+            item = it.value()
+            should_hide = bool(search_text) and id(item) not in visible
+            if should_hide != item.isHidden():
+                item.setHidden(should_hide)
+            it += 1
+        if search_text:
+            self.folder_tree.expandAll()
 
     def clear_all_filters(self):
         self.search_input.clear()
         self.tag_search.clear()
         self.folder_search.clear()
         
-        self.tag_list_widget.blockSignals(True)
-        self.tag_list_widget.clearSelection()
-        self.tag_list_widget.blockSignals(False)
+        self.selected_tags.clear()
+        sel_model = self.tag_list_view.selectionModel()
+        sel_model.blockSignals(True)
+        sel_model.clearSelection()
+        sel_model.blockSignals(False)
+        self.tag_list_view.viewport().update()
         
-        self.folder_list_widget.blockSignals(True)
-        self.folder_list_widget.clearSelection()
-        if self.folder_list_widget.count() > 0:
-            self.folder_list_widget.item(0).setSelected(True)
-        self.folder_list_widget.blockSignals(False)
+        self.folder_tree.blockSignals(True)
+        self.folder_tree.clearSelection()
+        if self.folder_tree.topLevelItemCount() > 0:
+            self.folder_tree.setCurrentItem(self.folder_tree.topLevelItem(0))
+        self.folder_tree.blockSignals(False)
         
         self.current_page = 1
         self.refresh_image_list()
@@ -402,14 +746,15 @@ class MainWindow(QMainWindow):
         if keyword:
             filters['path_keyword'] = keyword
             
-        selected_tags = [item.text() for item in self.tag_list_widget.selectedItems()]
-        if selected_tags:
-            filters['tags'] = selected_tags
+        if self.selected_tags:
+            filters['tags'] = sorted(self.selected_tags)
 
-        curr_folder_item = self.folder_list_widget.currentItem()
-        if curr_folder_item and curr_folder_item.data(Qt.UserRole):
-            filters['exact_dir'] = curr_folder_item.data(Qt.UserRole)
+        curr_folder_item = self.folder_tree.currentItem()
+        if curr_folder_item and curr_folder_item.data(0, Qt.UserRole):
+            filters['folder_id'] = curr_folder_item.data(0, Qt.UserRole)
+            filters['include_subfolders'] = self.chk_subfolders.isChecked()
 
+        self.current_filters = filters
         images, total_count = self.db.get_images_paginated(self.current_page, self.page_size, filters)
         self.total_images = total_count
         
@@ -423,11 +768,13 @@ class MainWindow(QMainWindow):
         
         self.lbl_total_page.setText(f"/ {total_pages} (Total: {total_count})")
         
+        self.image_items = {}
         for img in images:
-            item = QListWidgetItem(img['file_name'])
-            item.setData(Qt.UserRole, img['id'])
-            item.setData(Qt.UserRole + 1, img['file_path'])
+            item = QListWidgetItem(img.file_name)
+            item.setData(Qt.UserRole, img.id)
+            item.setData(Qt.UserRole + 1, img.file_path)
             self.image_list_widget.addItem(item)
+            self.image_items[img.id] = item
             
         self.image_list_widget.doItemsLayout()
         if self.image_list_widget.count() > 0:
@@ -446,36 +793,42 @@ class MainWindow(QMainWindow):
         self.thumb_worker.file_missing_signal.connect(self.on_file_missing)
         self.thumb_worker.start()
 
-    @Slot(int, object)
-    def update_thumbnail(self, img_id, pixmap):
-        for i in range(self.image_list_widget.count()):
-            item = self.image_list_widget.item(i)
-            if item.data(Qt.UserRole) == img_id:
-                item.setIcon(QIcon(pixmap))
-                break
+    @Slot(int, object, object)
+    def update_thumbnail(self, img_id, image, _buffer):
+        # QPixmap 只在 GUI 线程创建；转换完成后 _buffer 即可释放
+        item = self.image_items.get(img_id)
+        if item is not None:
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
 
     @Slot(str)
     def on_file_missing(self, path):
-        self.lbl_status.setText(f"移除不存在文件: {os.path.basename(path)}")
+        self.lbl_status.setText(f"文件丢失 (已标记): {os.path.basename(path)}")
 
     def apply_filters(self):
         self.current_page = 1
         self.refresh_image_list()
 
-    def on_folder_clicked(self, item):
+    def on_folder_clicked(self, item, column=0):
         self.current_page = 1
         self.refresh_image_list()
 
     def show_folder_menu(self, pos):
-        item = self.folder_list_widget.itemAt(pos)
+        item = self.folder_tree.itemAt(pos)
         if not item: return
-        dir_path = item.data(Qt.UserRole)
-        if not dir_path: return
+        folder_id = item.data(0, Qt.UserRole)
+        if not folder_id: return
+        dir_path = item.data(0, Qt.UserRole + 1)
         menu = QMenu()
-        del_action = QAction(f"从数据库移除: {dir_path}", self)
-        del_action.triggered.connect(lambda: self.remove_folder_from_db(dir_path))
+        del_action = QAction(f"从数据库移除 (含子文件夹): {dir_path}", self)
+        del_action.triggered.connect(lambda: self.remove_folder_from_db(folder_id, dir_path))
         menu.addAction(del_action)
-        menu.exec(self.folder_list_widget.mapToGlobal(pos))
+        check_action = QAction("检查文件完整性 (丢失 / 移动)", self)
+        check_action.triggered.connect(lambda: self.start_integrity_check(folder_id))
+        menu.addAction(check_action)
+        purge_action = QAction("清理已丢失文件的记录", self)
+        purge_action.triggered.connect(lambda: self.purge_missing_records(folder_id, dir_path))
+        menu.addAction(purge_action)
+        menu.exec(self.folder_tree.viewport().mapToGlobal(pos))
 
     def show_image_context_menu(self, pos):
         item = self.image_list_widget.itemAt(pos)
@@ -501,12 +854,57 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 print(f"Error opening explorer: {e}")
 
-    def remove_folder_from_db(self, dir_path):
-        reply = QMessageBox.question(self, "确认删除", f"确定移除该文件夹的记录吗?\n{dir_path}\n(本地文件不会被删除)", 
+    def remove_folder_from_db(self, folder_id, dir_path):
+        reply = QMessageBox.question(self, "确认删除", f"确定移除该文件夹及其子文件夹的记录吗?\n{dir_path}\n(本地文件不会被删除)", 
                                      QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            self.db.delete_images_by_dir(dir_path)
+            self.db.delete_folder_tree(folder_id)
             self.load_folders_list()
+            self.load_tags_list()
+            self.refresh_image_list()
+
+    # ================= 文件完整性 =================
+
+    def start_integrity_check(self, folder_id=None, search_roots=None):
+        if getattr(self, 'integrity_worker', None) and self.integrity_worker.isRunning():
+            return
+        self.integrity_folder_id = folder_id
+        self.integrity_worker = IntegrityCheckWorker(self.db_path, folder_id, search_roots)
+        self.integrity_worker.status_signal.connect(self.lbl_status.setText)
+        self.integrity_worker.progress_signal.connect(lambda c, t: self.progress_bar.setValue(int(c/t*100)))
+        self.integrity_worker.finished_signal.connect(self.on_integrity_finished)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.integrity_worker.start()
+
+    def on_integrity_finished(self, missing, restored, relocated):
+        self.progress_bar.setVisible(False)
+        self.lbl_status.setText(f"检查完成: 丢失 {missing}，恢复 {restored}，重定位 {relocated}")
+        if relocated:
+            self.load_folders_list()
+            self.refresh_image_list()
+        if not missing:
+            return
+        reply = QMessageBox.question(self, "文件丢失",
+                                     f"仍有 {missing} 个文件找不到 (记录已标记，标签保留)。\n"
+                                     f"是否指定它们的新位置 (例如移动硬盘的新盘符或移动后的文件夹)?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            new_root = QFileDialog.getExistingDirectory(self, "选择新位置")
+            if new_root:
+                self.start_integrity_check(self.integrity_folder_id, [new_root])
+
+    def purge_missing_records(self, folder_id, dir_path):
+        missing = self.db.count_missing(folder_id)
+        if not missing:
+            QMessageBox.information(self, "提示", "没有被标记为丢失的文件。\n(可先运行 \"检查文件完整性\")")
+            return
+        reply = QMessageBox.question(self, "确认清理", f"确定删除 {dir_path} 下 {missing} 个已丢失文件的记录及其标签吗?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.db.purge_missing(folder_id)
+            self.load_folders_list()
+            self.load_tags_list()
             self.refresh_image_list()
 
     def on_image_selected(self):
@@ -528,6 +926,7 @@ class MainWindow(QMainWindow):
             list_item = QListWidgetItem(f"{t['name']} ({t['confidence']:.2f})")
             # [NEW] 存入纯 Tag 名称，方便后续删除
             list_item.setData(Qt.UserRole, t['name'])
+            list_item.setToolTip(f"来源模型: {t['model_name']}" if t['model_name'] else "人工标签")
             self.info_tag_list.addItem(list_item)
 
     # [NEW] 手动添加标签逻辑
@@ -547,8 +946,8 @@ class MainWindow(QMainWindow):
             # 刷新右侧信息
             self.on_image_selected()
             
-            # 刷新左侧大列表 (如果加了新Tag)
-            self.load_tags_list()
+            # 左侧列表只做增量更新，无需重新查询全部标签
+            self.update_tag_model(self.tag_model.update_counts, self.db.get_tag_counts([tag_name.strip()]))
 
     # [NEW] 右键删除标签逻辑
     def show_tag_context_menu(self, pos):
@@ -573,6 +972,7 @@ class MainWindow(QMainWindow):
         self.db.remove_image_tag(img_id, tag_name)
         # 刷新右侧信息
         self.on_image_selected()
+        self.update_tag_model(self.tag_model.update_counts, self.db.get_tag_counts([tag_name]))
 
     def prev_page(self):
         if self.current_page > 1:
@@ -599,68 +999,177 @@ class MainWindow(QMainWindow):
     def open_import_dialog(self):
         folder = QFileDialog.getExistingDirectory(self, "选择图片目录")
         if not folder: return
-        dialog = ImportDialog(self)
+        dialog = ImportDialog(self, self.model_names())
         if dialog.exec():
             data = dialog.get_data()
             self.start_import(folder, data)
 
     def start_import(self, folder, options):
-        self.import_worker = ImportWorker(self.db_path, [folder], options['recursive'])
+        # 自动打标时导入与打标并行：导入线程写入 tag_queue，打标线程同时分批消费
+        job_id = None
+        if options['auto_tag']:
+            job_id = self.db.create_import_job()
+            if not self.start_tagging_task(None, 'ai', None, options['tag_mode'], queue_job_id=job_id,
+                                           model_name=options['model']):
+                self.db.cancel_import_job(job_id)
+                job_id = None
+
+        self.import_worker = ImportWorker(self.db_path, [folder], options['recursive'], tag_job_id=job_id)
         self.import_worker.status_signal.connect(self.lbl_status.setText)
         self.import_worker.progress_signal.connect(lambda c, t: self.lbl_status.setText(f"已导入: {c}"))
-        self.import_worker.finished_signal.connect(lambda ids: self.on_import_finished(ids, options))
+        self.import_worker.finished_signal.connect(lambda count, _job: self.on_import_finished(count))
         self.lbl_status.setText("开始扫描...")
         self.import_worker.start()
 
-    def on_import_finished(self, new_ids, options):
-        if not new_ids:
+    def on_import_finished(self, count):
+        if self.watcher is not None:
+            self.watcher.add_root(self.import_worker.target_paths[0], self.import_worker.recursive)
+        if not count:
             QMessageBox.warning(self, "提示", "未找到任何图片！\n请检查文件夹内是否有 .jpg/.png 等支持的图片格式。")
         else:
-            self.lbl_status.setText(f"导入完成 (新增 {len(new_ids)})")
+            self.lbl_status.setText(f"导入完成 (新增 {count})")
             
         self.load_folders_list()
         self.refresh_image_list()
-        
-        if options['auto_tag'] and new_ids:
-            reply = QMessageBox.question(self, "自动打标", f"导入了 {len(new_ids)} 张图片，是否立即开始 AI 打标?", 
-                                         QMessageBox.Yes | QMessageBox.No)
-            if reply == QMessageBox.Yes:
-                self.start_tagging_task(new_ids, 'ai', None, options['tag_mode'])
+
+    # ================= 文件夹监视 =================
+
+    def toggle_watcher(self, enabled):
+        if enabled and self.watcher is None:
+            self.watcher = LibraryWatcher(self.db_path, auto_tag=self.chk_watch_tag.isChecked())
+            self.watcher.status_signal.connect(self.lbl_status.setText)
+            self.watcher.changes_applied.connect(self.on_watch_changes)
+            self.watcher.start()
+        elif not enabled and self.watcher is not None:
+            self.stop_watcher()
+
+    def stop_watcher(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher.wait()
+            self.watcher = None
+
+    def on_watch_tag_toggled(self, checked):
+        if self.watcher is not None:
+            self.watcher.auto_tag = checked
+
+    def on_watch_changes(self, added, removed, moved, tag_job_id):
+        if tag_job_id:
+            # 已有打标任务在运行时不再并行启动，放弃这批新图片的队列 (之后可用 "未打标" 范围补打)
+            if getattr(self, 'tag_worker', None) and self.tag_worker.isRunning():
+                self.db.cancel_import_job(tag_job_id)
+            elif self.start_tagging_task(None, 'ai', None, 'append', queue_job_id=tag_job_id):
+                self.watch_tag_job_id = tag_job_id
+            else:
+                self.db.cancel_import_job(tag_job_id)
+        self.load_folders_list()
+        self.refresh_image_list()
+
+    def closeEvent(self, event):
+        self.stop_watcher()
+        # 先通知所有可中断的线程停止 (各自在当前这一批写完后退出)，再逐个等待
+        stoppable = [getattr(self, name, None) for name in ('tag_worker', 'import_worker', 'thumb_worker', 'integrity_worker')]
+        stoppable.append(self.maintenance)
+        for worker in stoppable:
+            if worker is not None and worker.isRunning():
+                worker.stop()
+        others = [getattr(self, name, None) for name in ('transfer_worker', 'sidebar_loader')] + list(self.model_loaders)
+        for worker in stoppable + others:
+            if worker is not None:
+                worker.wait()
+        # 后台线程都已停止，等写入队列中剩余的操作提交
+        shutdown_writers()
+        super().closeEvent(event)
 
     def open_batch_tag_dialog(self):
+        # 没有选中图片时也可以按当前筛选结果 / 整个图库打标 (由打标线程在数据库中分批取 id)
         selected_items = self.image_list_widget.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "提示", "请先选择要打标的图片")
+        dialog = BatchTagDialog(self, self.model_names(), len(selected_items),
+                                self.total_images, self.db.count_images(),
+                                preview_callback=lambda data: self.preview_tag_rules(data, selected_items))
+        if not dialog.exec():
             return
-        ids = [item.data(Qt.UserRole) for item in selected_items]
-        dialog = BatchTagDialog(self)
-        if dialog.exec():
-            data = dialog.get_data()
-            self.start_tagging_task(ids, data['method'], data['regex'], data['mode'])
-
-    def get_ai_engine(self):
-        if self.ai_engine: return self.ai_engine
-        from ai_tagger import TaggerEngine
-        model_path = os.path.join(self.models_dir, "model.onnx")
-        tags_path = os.path.join(self.models_dir, "tag_mapping.json")
-        if not os.path.exists(model_path):
-            raise FileNotFoundError("Model files missing")
-        self.ai_engine = TaggerEngine(model_path, tags_path)
-        return self.ai_engine
-
-    def start_tagging_task(self, ids, method, regex, mode):
-        engine = None
+        data = dialog.get_data()
+        ids, filters = self.batch_tag_scope(data, selected_items)
+        self.start_tagging_task(ids, data['method'], data['regex'], data['mode'],
+                                model_name=data['model'], filters=filters)
+
+    def batch_tag_scope(self, data, selected_items):
+        """BatchTagDialog 的范围 -> (ids, filters)，二者之一为 None"""
+        if data['scope'] == BatchTagDialog.SCOPE_SELECTED:
+            return [item.data(Qt.UserRole) for item in selected_items], None
+        filters = dict(self.current_filters) if data['scope'] == BatchTagDialog.SCOPE_FILTER else {}
+        if data['untagged']:
+            filters['untagged'] = True
+        if data['older_model']:
+            filters['older_model'] = True
+        return None, filters
+
+    def preview_tag_rules(self, data, selected_items):
+        """规则试运行：返回未启动的 RulePreviewWorker (只读，不写库)；规则解析失败时抛出 ValueError"""
+        rules = RuleSet.parse(data['regex'])
+        ids, filters = self.batch_tag_scope(data, selected_items)
+        if filters is not None:
+            filters.pop('older_model', None)
+        return RulePreviewWorker(self.db_path, rules, ids, filters)
+
+    # ================= 模型 =================
+
+    def model_names(self):
+        return [info.name for info in self.model_registry.discover()]
+
+    def load_model_async(self, model_name, on_loaded, on_failed=None):
+        """在后台线程加载模型，完成后在 GUI 线程回调 on_loaded(engine)"""
+        loader = ModelLoadWorker(self.model_registry, model_name)
+        loader.loaded_signal.connect(on_loaded)
+        if on_failed:
+            loader.failed_signal.connect(on_failed)
+        loader.finished.connect(lambda: self.model_loaders.remove(loader))
+        self.model_loaders.append(loader)
+        loader.start()
+
+    def preload_default_model(self):
+        if self.model_registry.get() is None:
+            return
+        self.load_model_async(None, lambda engine: print(f"[Models] Preloaded: {engine.model_name}"))
+
+    def start_tagging_task(self, ids, method, regex, mode, queue_job_id=None, model_name=None, filters=None):
+        """
+        启动打标任务。AI 模式下模型在后台加载，加载完成后才真正启动打标线程。
+        ids / queue_job_id / filters 三选一指定要处理的图片 (见 TaggerWorker)
+        返回 False 表示无法启动 (例如没有可用模型)
+        """
         if method == 'ai':
-            try:
-                self.lbl_status.setText("正在加载 AI 模型...")
-                QApplication.processEvents()
-                engine = self.get_ai_engine()
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"AI 模型加载失败: {e}")
-                return
+            if self.model_registry.get(model_name) is None:
+                QMessageBox.critical(self, "错误", "AI 模型加载失败: 未找到模型文件 (models/*.onnx 及标签映射)")
+                return False
+            engine = self.model_registry.cached(model_name)
+            if engine is None:
+                self.lbl_status.setText("正在后台加载 AI 模型...")
+                self.load_model_async(
+                    model_name,
+                    lambda engine: self.run_tagging_task(ids, method, regex, mode, queue_job_id, engine, filters),
+                    lambda err: self.on_model_load_failed(err, queue_job_id))
+                return True
+            self.run_tagging_task(ids, method, regex, mode, queue_job_id, engine, filters)
+            return True
+
+        self.run_tagging_task(ids, method, regex, mode, queue_job_id, None, filters)
+        return True
 
+    def on_model_load_failed(self, error, queue_job_id=None):
+        if queue_job_id is not None:
+            # 导入继续，但不再为该任务排队打标
+            if getattr(self, 'import_worker', None) and self.import_worker.tag_job_id == queue_job_id:
+                self.import_worker.tag_job_id = None
+            self.db.cancel_import_job(queue_job_id)
+        self.lbl_status.setText("AI 模型加载失败")
+        QMessageBox.critical(self, "错误", f"AI 模型加载失败: {error}")
+
+    def run_tagging_task(self, ids, method, regex, mode, queue_job_id, engine, filters=None):
         self.tag_worker = TaggerWorker(self.db_path, ids, mode=method, ai_engine=engine, 
-                                       regex_pattern=regex, tag_action=mode)
+                                       regex_pattern=regex, tag_action=mode, queue_job_id=queue_job_id,
+                                       filters=filters)
         self.tag_worker.status_signal.connect(self.lbl_status.setText)
         self.tag_worker.progress_signal.connect(lambda c, t: self.progress_bar.setValue(int(c/t*100)))
         self.tag_worker.finished_signal.connect(self.on_tagging_finished)
@@ -671,20 +1180,77 @@ class MainWindow(QMainWindow):
     def on_tagging_finished(self):
         self.progress_bar.setVisible(False)
         self.lbl_status.setText("打标任务完成")
-        QMessageBox.information(self, "完成", "批量打标已完成")
+        # 监视触发的后台打标不弹窗
+        if self.tag_worker.queue_job_id is None or self.tag_worker.queue_job_id != self.watch_tag_job_id:
+            QMessageBox.information(self, "完成", "批量打标已完成")
         self.load_tags_list()
         self.on_image_selected()
 
+    # ================= 标签导出 / 导入 =================
+
+    TRANSFER_IMPORT_MODES = {"追加 (更新已有标签的置信度)": 'append', "仅新增 (已有标签不变)": 'unique',
+                             "覆盖 (先清空这些图片的标签)": 'overwrite'}
+
+    def start_tag_transfer(self, action, fmt):
+        if getattr(self, 'transfer_worker', None) and self.transfer_worker.isRunning():
+            QMessageBox.warning(self, "提示", "已有导出 / 导入任务在运行")
+            return
+        filters = dict(self.current_filters)
+        scope = "当前筛选结果" if any(filters.values()) else "整个图库"
+        path = None
+        if fmt == FORMAT_TXT:
+            text = (f"将为{scope}中有标签的图片在同目录写入同名 .txt (覆盖已有文件)。继续?" if action == 'export'
+                    else f"将读取{scope}中每张图片同目录的同名 .txt 作为标签。继续?")
+            if QMessageBox.question(self, "标签文件", text, QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+                return
+        elif action == 'export':
+            path, _ = QFileDialog.getSaveFileName(self, f"导出标签 ({scope})", f"tags.{fmt}", f"{fmt.upper()} (*.{fmt})")
+        else:
+            path, _ = QFileDialog.getOpenFileName(self, "导入标签", "", f"{fmt.upper()} (*.{fmt})")
+        if fmt != FORMAT_TXT and not path:
+            return
+
+        mode = 'append'
+        if action == 'import':
+            label, ok = QInputDialog.getItem(self, "导入模式", "已有标签的处理方式:",
+                                             list(self.TRANSFER_IMPORT_MODES), 0, False)
+            if not ok:
+                return
+            mode = self.TRANSFER_IMPORT_MODES[label]
+
+        self.transfer_worker = TagTransferWorker(self.db_path, action, fmt, path, filters, mode)
+        verb = "导出" if action == 'export' else "导入"
+        self.transfer_worker.progress_signal.connect(lambda n: self.lbl_status.setText(f"正在{verb}标签: {n}"))
+        self.transfer_worker.finished_signal.connect(lambda _count, message: self.on_tag_transfer_finished(action, message))
+        self.transfer_worker.failed_signal.connect(lambda error: QMessageBox.critical(self, "错误", f"{verb}失败: {error}"))
+        self.lbl_status.setText(f"正在{verb}标签...")
+        self.transfer_worker.start()
+
+    def on_tag_transfer_finished(self, action, message):
+        self.lbl_status.setText(message)
+        if action == 'import':
+            self.load_tags_list()
+            self.on_image_selected()
+
+    def open_stats_dialog(self):
+        # 非模态，打标运行时可以一直开着观察
+        self.stats_dialog = StatsDialog(self, self.maintenance)
+        self.stats_dialog.setAttribute(Qt.WA_DeleteOnClose)
+        self.stats_dialog.show()
+
     def open_viewer(self, item):
-        current_id = item.data(Qt.UserRole)
-        current_page_images = []
-        found_index = 0
-        for i in range(self.image_list_widget.count()):
-            list_item = self.image_list_widget.item(i)
-            img_id = list_item.data(Qt.UserRole)
-            img_path = list_item.data(Qt.UserRole + 1)
-            current_page_images.append({'id': img_id, 'file_path': img_path})
-            if img_id == current_id:
-                found_index = i
-        self.viewer = ImageViewerWindow(current_page_images, found_index)
-        self.viewer.show()
\ No newline at end of file
+        # 看图器可在整个筛选结果中翻页，游标按需分窗口加载 id/路径
+        row = self.image_list_widget.row(item)
+        global_index = (self.current_page - 1) * self.page_size + row
+        # 看图器只在第一次打开时导入，不拖慢启动
+        from gui_viewer import ImageViewerWindow
+        cursor = ImageResultCursor(self.db, self.current_filters, self.total_images)
+        self.viewer = ImageViewerWindow(cursor, global_index, thumb_lookup=self.get_thumbnail_pixmap)
+        self.viewer.show()
+
+    def get_thumbnail_pixmap(self, img_id):
+        """从当前页列表中取已生成的缩略图，给看图器做占位"""
+        item = self.image_items.get(img_id)
+        if item is None or item.icon().isNull():
+            return None
+        return item.icon().pixmap(self.image_list_widget.iconSize())
\ No newline at end of file
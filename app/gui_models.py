@@ -0,0 +1,198 @@
+from bisect import bisect_left
+from typing import List, Iterable, Dict
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+# ================= 标签列表模型 =================
+
+class TagListModel(QAbstractListModel):
+    """
+    自带过滤的标签列表模型 (替代 QListWidget + setHidden)
+    - _names: 按排序键有序的全部标签，插入/删除用二分查找定位
+    - _visible: 当前过滤条件下可见行在 _names 中的下标 (升序)
+    - 输入在上次关键字基础上追加字符时，只在上次结果里继续收窄
+    - _counts: 每个标签的图片数 (来自 tag_stats)，可按名称或数量排序
+    """
+    NameRole = Qt.UserRole
+    CountRole = Qt.UserRole + 1
+
+    SORT_BY_NAME = 'name'
+    SORT_BY_COUNT = 'count'
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._names: List[str] = []
+        self._keys: List = []
+        self._visible: List[int] = []
+        self._counts: Dict[str, int] = {}
+        self._filter = ""
+        self.sort_mode = self.SORT_BY_NAME
+
+    # ---------- Qt 接口 ----------
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._visible)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._visible):
+            return None
+        name = self._names[self._visible[index.row()]]
+        if role == Qt.DisplayRole:
+            return f"{name} ({self._counts.get(name, 0)})"
+        if role == self.NameRole:
+            return name
+        if role == self.CountRole:
+            return self._counts.get(name, 0)
+        return None
+
+    # ---------- 查询 ----------
+
+    def name_at(self, row: int) -> str:
+        return self._names[self._visible[row]]
+
+    def row_of(self, name: str) -> int:
+        """返回标签在可见列表中的行号，不可见返回 -1"""
+        pos = self._find(name)
+        if pos < 0:
+            return -1
+        row = bisect_left(self._visible, pos)
+        if row < len(self._visible) and self._visible[row] == pos:
+            return row
+        return -1
+
+    def contains(self, name: str) -> bool:
+        return self._find(name) >= 0
+
+    def all_names(self) -> List[str]:
+        return list(self._names)
+
+    def _sort_key(self, name: str):
+        if self.sort_mode == self.SORT_BY_COUNT:
+            return (-self._counts.get(name, 0), name)
+        return name
+
+    def set_sort_mode(self, mode: str):
+        if mode == self.sort_mode:
+            return
+        self.sort_mode = mode
+        self.set_tags(self._counts)
+
+    def _find(self, name: str) -> int:
+        key = self._sort_key(name)
+        pos = bisect_left(self._keys, key)
+        if pos < len(self._names) and self._names[pos] == name:
+            return pos
+        return -1
+
+    def _matches(self, name: str, text: str) -> bool:
+        return not text or text in name.lower()
+
+    # ---------- 过滤 ----------
+
+    def set_filter(self, text: str):
+        text = text.lower()
+        if text == self._filter:
+            return
+
+        if not text:
+            visible = list(range(len(self._names)))
+        elif self._filter and text.startswith(self._filter):
+            # 增量收窄：只在上次的结果中继续筛选
+            visible = [i for i in self._visible if text in self._names[i].lower()]
+        else:
+            visible = [i for i, n in enumerate(self._names) if text in n.lower()]
+
+        self.beginResetModel()
+        self._filter = text
+        self._visible = visible
+        self.endResetModel()
+
+    # ---------- 全量 / 增量更新 ----------
+
+    def set_tags(self, counts: Dict[str, int]):
+        self.beginResetModel()
+        self._counts = dict(counts)
+        self._names = sorted(self._counts, key=self._sort_key)
+        self._keys = [self._sort_key(n) for n in self._names]
+        self._visible = [i for i, n in enumerate(self._names) if self._matches(n, self._filter)]
+        self.endResetModel()
+
+    def sync_tags(self, counts: Dict[str, int]):
+        """与数据库中的标签统计做差量同步，只插入/删除/刷新变化的行"""
+        new_set = set(counts)
+        old_set = set(self._names)
+        removed = old_set - new_set
+        added = new_set - old_set
+        changed = [n for n in new_set & old_set if self._counts.get(n) != counts[n]]
+        if len(removed) + len(added) > len(self._names) // 2 + 100:
+            # 变化太大时直接重建更快
+            self.set_tags(counts)
+            return
+        self.remove_tags(removed)
+        self.update_counts({n: counts[n] for n in changed})
+        self.add_tags({n: counts[n] for n in added})
+
+    def update_counts(self, counts: Dict[str, int]):
+        """更新已有标签的计数；按数量排序时需要移动行，直接删除后重新插入"""
+        for name, count in counts.items():
+            if self._find(name) < 0:
+                self.add_tags({name: count})
+                continue
+            if self._counts.get(name) == count:
+                continue
+            if self.sort_mode == self.SORT_BY_COUNT:
+                self.remove_tags([name])
+                self.add_tags({name: count})
+            else:
+                self._counts[name] = count
+                row = self.row_of(name)
+                if row >= 0:
+                    index = self.index(row)
+                    self.dataChanged.emit(index, index, [Qt.DisplayRole, self.CountRole])
+
+    def add_tags(self, counts: Dict[str, int]):
+        for name, count in counts.items():
+            if self._find(name) >= 0:
+                continue
+            self._counts[name] = count
+            key = self._sort_key(name)
+            pos = bisect_left(self._keys, key)
+            # 插入点之后的下标整体后移
+            row = bisect_left(self._visible, pos)
+            for r in range(row, len(self._visible)):
+                self._visible[r] += 1
+
+            if self._matches(name, self._filter):
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._names.insert(pos, name)
+                self._keys.insert(pos, key)
+                self._visible.insert(row, pos)
+                self.endInsertRows()
+            else:
+                self._names.insert(pos, name)
+                self._keys.insert(pos, key)
+
+    def remove_tags(self, names: Iterable[str]):
+        for name in names:
+            pos = self._find(name)
+            if pos < 0:
+                continue
+            self._counts.pop(name, None)
+            row = bisect_left(self._visible, pos)
+            is_visible = row < len(self._visible) and self._visible[row] == pos
+
+            if is_visible:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._visible[row]
+                del self._names[pos]
+                del self._keys[pos]
+                for r in range(row, len(self._visible)):
+                    self._visible[r] -= 1
+                self.endRemoveRows()
+            else:
+                del self._names[pos]
+                del self._keys[pos]
+                for r in range(row, len(self._visible)):
+                    self._visible[r] -= 1
@@ -1,8 +1,91 @@
 import os
-from PySide6.QtWidgets import (QMainWindow, QGraphicsView, QGraphicsScene, 
+from collections import OrderedDict
+from PySide6.QtWidgets import (QMainWindow, QGraphicsView, QGraphicsScene,
                                QGraphicsPixmapItem, QVBoxLayout, QWidget, QLabel)
-from PySide6.QtCore import Qt, Signal, QRectF
-from PySide6.QtGui import QPixmap, QPainter, QImage, QAction
+from PySide6.QtCore import (Qt, Signal, QRectF, QRect, QSize, QObject, QRunnable,
+                            QThreadPool, QTimer)
+from PySide6.QtGui import QPixmap, QPainter, QImage, QAction, QImageReader, QImageIOHandler
+
+# 解码缓存上限 (字节)
+VIEWER_CACHE_BYTES = 256 * 1024 * 1024
+# 预取当前图片前后各 N 张
+PREFETCH_RADIUS = 2
+# 缩放/拖动停止后多久再解码局部高清图 (毫秒)
+TILE_DEBOUNCE_MS = 120
+
+class DecodedImageCache:
+    """
+    按字节数限制的 LRU 缓存: key -> (QImage, 原图尺寸 QSize)
+    只在 GUI 线程访问
+    """
+    def __init__(self, max_bytes=VIEWER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        entry = self._items.get(key)
+        if entry is not None:
+            self._items.move_to_end(key)
+        return entry
+
+    def put(self, key, image, original_size):
+        if key in self._items:
+            old_image, _ = self._items.pop(key)
+            self.current_bytes -= old_image.sizeInBytes()
+        size = image.sizeInBytes()
+        if size > self.max_bytes:
+            return
+        self._items[key] = (image, original_size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and self._items:
+            _, (old_image, _) = self._items.popitem(last=False)
+            self.current_bytes -= old_image.sizeInBytes()
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+class _DecodeSignals(QObject):
+    # key, QImage (失败为 None), 原图尺寸
+    finished = Signal(object, object, object)
+
+class DecodeTask(QRunnable):
+    """
+    后台解码任务 (只产出 QImage，QPixmap 必须在 GUI 线程创建)
+    - target_size: 解码时直接缩放到的最大尺寸 (按比例适配)，None 表示原尺寸
+    - clip_rect: 只解码原图中的这一块 (用于放大后的局部高清图)
+    """
+    def __init__(self, key, file_path, target_size=None, clip_rect=None):
+        super().__init__()
+        self.key = key
+        self.file_path = file_path
+        self.target_size = target_size
+        self.clip_rect = clip_rect
+        self.signals = _DecodeSignals()
+
+    def run(self):
+        reader = QImageReader(self.file_path)
+        reader.setAutoTransform(True)
+        original = reader.size()
+
+        source = QSize(original)
+        if self.clip_rect is not None:
+            reader.setClipRect(self.clip_rect)
+            source = self.clip_rect.size()
+
+        if self.target_size is not None and source.isValid():
+            if source.width() > self.target_size.width() or source.height() > self.target_size.height():
+                reader.setScaledSize(source.scaled(self.target_size, Qt.KeepAspectRatio))
+
+        image = reader.read()
+        if image.isNull():
+            print(f"Failed to decode image: {self.file_path} - {reader.errorString()}")
+            image = None
+        self.signals.finished.emit(self.key, image, original)
 
 class PhotoGraphicsView(QGraphicsView):
     """
@@ -11,6 +94,8 @@ class PhotoGraphicsView(QGraphicsView):
     # 定义信号，通知主窗口翻页
     request_prev = Signal()
     request_next = Signal()
+    # 缩放或平移后通知窗口刷新局部高清图
+    viewport_changed = Signal()
 
     def __init__(self, scene, parent=None):
         super().__init__(scene, parent)
@@ -29,10 +114,19 @@ class PhotoGraphicsView(QGraphicsView):
         """滚轮缩放逻辑"""
         # 设置缩放锚点为鼠标位置
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
-        
+
         zoom_in = event.angleDelta().y() > 0
         scale_factor = 1.15 if zoom_in else 1 / 1.15
         self.scale(scale_factor, scale_factor)
+        self.viewport_changed.emit()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.viewport_changed.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.viewport_changed.emit()
 
     def keyPressEvent(self, event):
         """
@@ -52,65 +146,220 @@ class PhotoGraphicsView(QGraphicsView):
 class ImageViewerWindow(QMainWindow):
     """
     大图查看器主窗口
+    - 图片在后台线程解码，并按屏幕分辨率缩放后放入 LRU 缓存
+    - 翻页时预取前后 PREFETCH_RADIUS 张
+    - 解码完成前先显示列表里已有的缩略图
+    - 放大超过缓存分辨率时，只解码当前可见区域 (局部高清图)，不加载整张原图
     """
-    def __init__(self, image_list, current_index=0):
+    def __init__(self, image_list, current_index=0, thumb_lookup=None):
+        """
+        image_list: 支持 len() 和下标访问的序列，元素为 database.ImageRow (有 id / file_path)；
+                    可以是普通 list，也可以是 database.ImageResultCursor (整个筛选结果集，按需加载)
+        """
         super().__init__()
         self.image_list = image_list
         self.current_index = current_index
-        
+        # thumb_lookup(img_id) -> QPixmap 或 None，用于解码完成前的占位
+        self.thumb_lookup = thumb_lookup
+
+        self.cache = DecodedImageCache(VIEWER_CACHE_BYTES)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, min(4, QThreadPool.globalInstance().maxThreadCount())))
+        self._pending = set()
+        self._tile_request = None
+
         # 1. 创建场景
         self.scene = QGraphicsScene()
-        
+
         # 2. 创建自定义的 View (使用上面的类)
         self.view = PhotoGraphicsView(self.scene)
-        
+
         # 3. 连接翻页信号
         self.view.request_prev.connect(self.show_prev)
         self.view.request_next.connect(self.show_next)
-        
+
+        self.tile_timer = QTimer(self)
+        self.tile_timer.setSingleShot(True)
+        self.tile_timer.setInterval(TILE_DEBOUNCE_MS)
+        self.tile_timer.timeout.connect(self.update_detail_tile)
+        self.view.viewport_changed.connect(self.tile_timer.start)
+
         self.setCentralWidget(self.view)
-        
+
         # 当前显示的 Item
         self.pixmap_item = None
-        
-        # 4. 加载初始图片
-        self.load_image()
-        
-        # 5. 设置窗口默认大小
+        self.tile_item = None
+        self.current_path = None
+        self.current_original_size = None
+        self.current_decoded_size = None
+
+        # 4. 设置窗口默认大小
         self.resize(1000, 800)
 
+        # 5. 加载初始图片
+        self.load_image()
+
+    def display_target_size(self):
+        """解码目标尺寸：屏幕物理分辨率"""
+        screen = self.screen()
+        size = screen.size()
+        ratio = screen.devicePixelRatio()
+        return QSize(int(size.width() * ratio), int(size.height() * ratio))
+
+    def current_path_at(self, index):
+        if 0 <= index < len(self.image_list):
+            img_data = self.image_list[index]
+            if img_data:
+                return img_data.file_path
+        return None
+
     def load_image(self):
         if not self.image_list or self.current_index < 0 or self.current_index >= len(self.image_list):
             return
-            
+
         img_data = self.image_list[self.current_index]
-        file_path = img_data['file_path'] # 确保 gui_main 传进来的是字典包含 'file_path'
-        
+        if not img_data:
+            return
+        file_path = img_data.file_path
+        self.current_path = file_path
+
         self.setWindowTitle(f"Viewing: {os.path.basename(file_path)} ({self.current_index + 1}/{len(self.image_list)})")
-        
-        # 加载图片
-        pixmap = QPixmap(file_path)
-        if pixmap.isNull():
-            print(f"Failed to load image: {file_path}")
+
+        entry = self.cache.get(file_path)
+        if entry is not None:
+            self.show_decoded(file_path, *entry)
+        else:
+            # 先显示缩略图占位，后台解码完成后替换
+            placeholder = self.thumb_lookup(img_data.id) if self.thumb_lookup else None
+            self.show_placeholder(placeholder)
+            self.request_decode(file_path, priority=1)
+
+        self.prefetch_neighbours()
+
+    def request_decode(self, file_path, priority=0):
+        if file_path in self._pending or file_path in self.cache:
+            return
+        self._pending.add(file_path)
+        task = DecodeTask(file_path, file_path, self.display_target_size())
+        task.signals.finished.connect(self.on_decoded)
+        self.pool.start(task, priority)
+
+    def prefetch_neighbours(self):
+        for offset in range(1, PREFETCH_RADIUS + 1):
+            for index in (self.current_index + offset, self.current_index - offset):
+                path = self.current_path_at(index)
+                if path:
+                    self.request_decode(path)
+
+    def on_decoded(self, key, image, original_size):
+        self._pending.discard(key)
+        if image is None:
+            if key == self.current_path:
+                print(f"Failed to load image: {key}")
+            return
+        self.cache.put(key, image, original_size)
+        if key == self.current_path:
+            self.show_decoded(key, image, original_size)
+
+    def show_placeholder(self, pixmap):
+        self.clear_scene()
+        self.current_original_size = None
+        self.current_decoded_size = None
+        if pixmap is None or pixmap.isNull():
             return
-            
-        self.scene.clear()
         self.pixmap_item = QGraphicsPixmapItem(pixmap)
+        self.pixmap_item.setTransformationMode(Qt.SmoothTransformation)
         self.scene.addItem(self.pixmap_item)
-        
+        self.view.resetTransform()
+        self.fit_to_window()
+
+    def show_decoded(self, file_path, image, original_size):
+        self.clear_scene()
+        pixmap = QPixmap.fromImage(image)
+        self.pixmap_item = QGraphicsPixmapItem(pixmap)
+        self.pixmap_item.setTransformationMode(Qt.SmoothTransformation)
+        # 场景坐标统一使用原图像素坐标，缩放解码的图片按比例放大铺满
+        if original_size.isValid() and image.width() > 0:
+            self.pixmap_item.setScale(original_size.width() / image.width())
+            self.current_original_size = original_size
+        else:
+            self.current_original_size = image.size()
+        self.current_decoded_size = image.size()
+        self.scene.addItem(self.pixmap_item)
+
         # 重置视图缩放
         self.view.resetTransform()
-        
+
         # 适应窗口大小 (Fit to Window)
         self.fit_to_window()
 
+    def clear_scene(self):
+        self.scene.clear()
+        self.pixmap_item = None
+        self.tile_item = None
+        self._tile_request = None
+
     def fit_to_window(self):
         """让图片适应窗口大小"""
         if self.pixmap_item:
             # 强制刷新一下场景计算
-            self.scene.setSceneRect(self.pixmap_item.boundingRect())
+            self.scene.setSceneRect(self.pixmap_item.sceneBoundingRect())
             self.view.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
 
+    # ---------- 局部高清图 ----------
+
+    def update_detail_tile(self):
+        """放大倍数超过缓存图分辨率时，只解码可见区域"""
+        if not self.pixmap_item or not self.current_original_size or not self.current_decoded_size:
+            return
+        original = self.current_original_size
+        decoded = self.current_decoded_size
+        zoom = self.view.transform().m11() * self.devicePixelRatioF()
+        base_density = decoded.width() / max(1, original.width())
+
+        if base_density >= 1.0 or zoom <= base_density:
+            # 缓存图已经足够清晰
+            self.remove_tile()
+            return
+
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        clip = visible.intersected(QRectF(0, 0, original.width(), original.height())).toAlignedRect()
+        if clip.isEmpty():
+            self.remove_tile()
+            return
+        # 带 EXIF 旋转的图片，裁剪坐标与显示坐标不一致，不做局部解码
+        reader = QImageReader(self.current_path)
+        if reader.transformation() != QImageIOHandler.TransformationNone:
+            return
+
+        target = QSize(max(1, int(clip.width() * min(1.0, zoom))),
+                       max(1, int(clip.height() * min(1.0, zoom))))
+        key = (self.current_path, clip.x(), clip.y(), clip.width(), clip.height(), target.width())
+        if key == self._tile_request:
+            return
+        self._tile_request = key
+        task = DecodeTask(key, self.current_path, target, QRect(clip))
+        task.signals.finished.connect(self.on_tile_decoded)
+        self.pool.start(task, 2)
+
+    def on_tile_decoded(self, key, image, original_size):
+        if key != self._tile_request or image is None:
+            return
+        _, x, y, w, _, _ = key
+        self.remove_tile()
+        self.tile_item = QGraphicsPixmapItem(QPixmap.fromImage(image))
+        self.tile_item.setTransformationMode(Qt.SmoothTransformation)
+        self.tile_item.setPos(x, y)
+        self.tile_item.setScale(w / image.width())
+        self.tile_item.setZValue(1)
+        self.scene.addItem(self.tile_item)
+
+    def remove_tile(self):
+        if self.tile_item is not None:
+            self.scene.removeItem(self.tile_item)
+            self.tile_item = None
+        self._tile_request = None
+
     def show_prev(self):
         if self.current_index > 0:
             self.current_index -= 1
@@ -120,10 +369,17 @@ class ImageViewerWindow(QMainWindow):
         if self.current_index < len(self.image_list) - 1:
             self.current_index += 1
             self.load_image()
-            
+
     def keyPressEvent(self, event):
         # 处理 ESC 退出
         if event.key() == Qt.Key_Escape:
             self.close()
         else:
-            super().keyPressEvent(event)
\ No newline at end of file
+            super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        # 丢弃尚未开始的解码任务并释放缓存
+        self.pool.clear()
+        self.pool.waitForDone(1000)
+        self.cache.clear()
+        super().closeEvent(event)
@@ -0,0 +1,238 @@
+"""
+轻量级性能统计：计时器 / 计数器 / 延迟直方图，以及按任务的 cProfile / pyinstrument 采样
+
+级别 (环境变量 AIM_STATS 或 main.py --stats 设置):
+    0 关闭   计时器为空操作，几乎无开销
+    1 统计   记录计数与耗时直方图 (默认)
+    2 调试   另外输出逐项调试日志 (例如扫描到的每个文件)
+
+采样 (环境变量 AIM_PROFILE 或 main.py --profile 设置): cprofile / pyinstrument，
+每个后台任务 (导入、打标) 单独生成一份报告，写入 PROFILE_DIR。
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+LEVEL_OFF = 0
+LEVEL_STATS = 1
+LEVEL_DEBUG = 2
+
+PROFILER_CPROFILE = 'cprofile'
+PROFILER_PYINSTRUMENT = 'pyinstrument'
+
+# 直方图桶上界 (毫秒)，最后一个桶收纳更慢的值
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "profiles")
+
+class Histogram:
+    """固定对数桶的耗时直方图，百分位为所在桶上界 (近似值)"""
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        target = self.count * p
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 2),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+        }
+
+class _NullTimer:
+    """关闭统计时使用的空计时器"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """线程安全的计数器与耗时直方图集合 (进程内单例见 metrics)"""
+    def __init__(self, level: int = LEVEL_STATS):
+        self.level = level
+        self.profiler = None
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        return self.level >= LEVEL_STATS
+
+    def timer(self, name: str):
+        """with metrics.timer('tagger.inference'): ..."""
+        if self.level < LEVEL_STATS:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name: str, seconds: float):
+        if self.level < LEVEL_STATS:
+            return
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.add(seconds * 1000)
+
+    def count(self, name: str, n: int = 1):
+        if self.level < LEVEL_STATS:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def debug(self, message: str):
+        if self.level >= LEVEL_DEBUG:
+            print(f"[DEBUG] {message}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'uptime_s': round(time.time() - self._started, 1),
+                'counters': dict(sorted(self._counters.items())),
+                'timers': {name: hist.summary() for name, hist in sorted(self._histograms.items())},
+            }
+
+    def report(self) -> str:
+        """纯文本报告，用于 --stats 输出与界面的统计面板"""
+        snap = self.snapshot()
+        lines = [f"Uptime: {snap['uptime_s']} s"]
+        if snap['timers']:
+            lines.append(f"{'timer':<28}{'count':>9}{'total ms':>12}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>10}")
+            for name, s in snap['timers'].items():
+                lines.append(f"{name:<28}{s['count']:>9}{s['total_ms']:>12.1f}{s['mean_ms']:>9.2f}"
+                             f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>10.1f}")
+        if snap['counters']:
+            lines.append("")
+            lines.append(f"{'counter':<28}{'value':>12}")
+            for name, value in snap['counters'].items():
+                lines.append(f"{name:<28}{value:>12}")
+        if len(lines) == 1:
+            lines.append("(no data)" if self.enabled else "(statistics disabled)")
+        return "\n".join(lines)
+
+def _level_from_env() -> int:
+    try:
+        return int(os.environ.get('AIM_STATS', LEVEL_STATS))
+    except ValueError:
+        return LEVEL_STATS
+
+metrics = Metrics(_level_from_env())
+metrics.profiler = os.environ.get('AIM_PROFILE') or None
+
+class StartupTimer:
+    """
+    记录启动各阶段的完成时间点 (从导入本模块开始计时)，main.py 在启动结束时打印:
+    [Startup] imports 120 ms | app 35 ms | window 60 ms | shown 40 ms | ... (total 400 ms)
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks = []
+
+    def mark(self, name: str):
+        elapsed = time.perf_counter() - self.t0
+        previous = self.marks[-1][1] if self.marks else 0.0
+        self.marks.append((name, elapsed))
+        metrics.observe(f'startup.{name}', elapsed - previous)
+
+    def report(self) -> str:
+        parts = []
+        previous = 0.0
+        for name, elapsed in self.marks:
+            parts.append(f"{name} {(elapsed - previous) * 1000:.0f} ms")
+            previous = elapsed
+        return f"{' | '.join(parts)} (total {previous * 1000:.0f} ms)"
+
+startup = StartupTimer()
+
+@contextmanager
+def profile_job(name: str):
+    """
+    对一个后台任务采样 (在该任务所在线程内使用)。未设置 profiler 时不做任何事。
+    报告写入 PROFILE_DIR/<name>-<时间>.prof (cProfile，可用 snakeviz 查看) 或 .html (pyinstrument)
+    """
+    kind = metrics.profiler
+    if not kind:
+        yield
+        return
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if kind == PROFILER_PYINSTRUMENT:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[Stats] pyinstrument is not installed, falling back to cProfile")
+            kind = PROFILER_CPROFILE
+
+    if kind == PROFILER_PYINSTRUMENT:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            print(f"[Stats] Profile written: {os.path.abspath(path)}")
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.prof")
+            profiler.dump_stats(path)
+            print(f"[Stats] Profile written: {os.path.abspath(path)}")
@@ -1,12 +1,36 @@
 import sys
+import argparse
+# 最先导入：启动计时从这里开始 (见 instrumentation.StartupTimer)
+from instrumentation import metrics, startup, PROFILER_CPROFILE, PROFILER_PYINSTRUMENT
 from PySide6.QtWidgets import QApplication
 from gui_main import MainWindow
+startup.mark('imports')
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="AI Image Manager")
+    parser.add_argument("--stats", nargs="?", type=int, const=1, metavar="LEVEL",
+                        help="统计级别 0=关闭 1=计时/计数 2=另加调试日志；退出时打印统计报告")
+    parser.add_argument("--profile", choices=[PROFILER_CPROFILE, PROFILER_PYINSTRUMENT],
+                        help="为每个导入/打标任务生成采样报告 (写入 profiles/)")
+    # 其余参数 (如 Qt 的 -style) 交给 QApplication
+    return parser.parse_known_args(argv[1:])
 
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args(sys.argv)
+    if args.stats is not None:
+        metrics.level = args.stats
+    if args.profile:
+        metrics.profiler = args.profile
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup.mark('app')
     window = MainWindow()
+    startup.mark('window')
     window.show()
-    sys.exit(app.exec())
+    code = app.exec()
+    if args.stats:
+        print(metrics.report())
+    sys.exit(code)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
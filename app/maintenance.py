@@ -0,0 +1,170 @@
+"""
+数据库后台维护：WAL 检查点、分步回收空闲页、更新查询规划统计，并把文件大小 / 碎片信息交给界面显示。
+
+每 TICK_S 秒检查一次。连续 IDLE_S 秒没有写入 (数据库代数与 WAL 大小都没变) 视为空闲，空闲时:
+- wal_checkpoint(TRUNCATE)：WAL 写回主库并截断为 0，之后的读取不必再查 WAL
+- incremental_vacuum：空闲页超过阈值时每次归还 VACUUM_STEP_PAGES 页 (需要 auto_vacuum=INCREMENTAL)
+- optimize：距上次超过 OPTIMIZE_INTERVAL_S 且期间有写入时重新 ANALYZE
+打标 / 导入进行中时只在 WAL 超过 WAL_BUSY_BYTES 后做 PASSIVE 检查点：不等待任何读写方，
+已写回的部分在下一次写入时从头复用，WAL 不会随长时间任务无限增长。
+"""
+import time
+import threading
+from PySide6.QtCore import QThread, Signal
+
+from database import ImageDB
+from instrumentation import metrics
+
+# 检查间隔 / 判定空闲所需的无写入时长 (秒)
+TICK_S = 15.0
+IDLE_S = 30.0
+# 忙碌时 WAL 超过这个大小就做一次 PASSIVE 检查点
+WAL_BUSY_BYTES = 32 * 1024 * 1024
+# 空闲页达到总页数的这个比例 (且不少于 VACUUM_MIN_FREE_PAGES) 才回收，每次最多归还 VACUUM_STEP_PAGES 页
+VACUUM_MIN_FREE_RATIO = 0.05
+VACUUM_MIN_FREE_PAGES = 1024
+VACUUM_STEP_PAGES = 4096
+# 两次 optimize 之间的最短间隔 (秒)
+OPTIMIZE_INTERVAL_S = 3600.0
+
+ACTION_CHECKPOINT = 'checkpoint'
+ACTION_PASSIVE_CHECKPOINT = 'passive_checkpoint'
+ACTION_VACUUM_STEP = 'incremental_vacuum'
+ACTION_OPTIMIZE = 'optimize'
+# 只由用户触发
+ACTION_FULL_VACUUM = 'vacuum'
+ACTION_QUICK_CHECK = 'quick_check'
+MANUAL_ACTIONS = (ACTION_FULL_VACUUM, ACTION_QUICK_CHECK)
+
+def plan_actions(stats: dict, idle: bool, optimize_due: bool) -> list:
+    """根据 storage_stats 决定本轮要做的维护 (不含手动任务)"""
+    actions = []
+    if idle:
+        if optimize_due:
+            actions.append(ACTION_OPTIMIZE)
+        if (stats['auto_vacuum'] == 'incremental' and stats['freelist_count'] >= VACUUM_MIN_FREE_PAGES
+                and stats['free_ratio'] >= VACUUM_MIN_FREE_RATIO):
+            actions.append(ACTION_VACUUM_STEP)
+        # 检查点放在最后：回收 / ANALYZE 的写入也要经过 WAL，写回之后文件才真正变小
+        if actions or stats['wal_bytes'] > 0:
+            actions.append(ACTION_CHECKPOINT)
+    elif stats['wal_bytes'] > WAL_BUSY_BYTES:
+        actions.append(ACTION_PASSIVE_CHECKPOINT)
+    return actions
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):,.1f} MB"
+
+def format_storage(stats: dict) -> str:
+    if not stats:
+        return "数据库: 统计中..."
+    lines = [
+        f"数据库: {_mb(stats['db_bytes'])}   WAL: {_mb(stats['wal_bytes'])}   "
+        f"空闲页: {stats['freelist_count']:,} / {stats['page_count']:,} ({stats['free_ratio']:.1%})   "
+        f"auto_vacuum: {stats['auto_vacuum']}",
+    ]
+    if stats['auto_vacuum'] != 'incremental':
+        lines.append("  未启用增量回收：空闲时点 \"完整压缩\" 做一次 VACUUM 后，删除记录留下的空间会自动归还")
+    if stats.get('last_run'):
+        done = "; ".join(stats.get('last_actions') or ()) or "无需处理"
+        lines.append(f"  上次维护: {time.strftime('%H:%M:%S', time.localtime(stats['last_run']))}  {done}")
+    return "\n".join(lines)
+
+class MaintenanceScheduler(QThread):
+    # storage_stats 加上 last_run (时间戳) / last_actions (本轮各项的说明) / idle
+    stats_signal = Signal(object)
+    # 手动任务的结果 (动作, 说明)
+    result_signal = Signal(str, str)
+
+    def __init__(self, db_path, tick_s: float = TICK_S):
+        super().__init__()
+        self.db_path = db_path
+        self.tick_s = tick_s
+        self.last_stats = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requests = []
+        self._running = True
+
+    def request(self, action: str):
+        """手动任务 (ACTION_FULL_VACUUM / ACTION_QUICK_CHECK) 或 None 表示立即做一轮常规维护"""
+        with self._lock:
+            self._requests.append(action)
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def run(self):
+        db = ImageDB(self.db_path)
+        last_change = time.monotonic()
+        last_seen = None
+        last_optimize = time.monotonic()
+        optimized_generation = None
+        while self._running:
+            self._wake.wait(self.tick_s)
+            self._wake.clear()
+            if not self._running:
+                break
+            with self._lock:
+                requests, self._requests = self._requests, []
+            try:
+                stats = db.storage_stats()
+                seen = (stats['generation'], stats['wal_bytes'])
+                now = time.monotonic()
+                if seen != last_seen:
+                    last_change = now
+                idle = now - last_change >= IDLE_S or None in requests
+                if optimized_generation is None:
+                    optimized_generation = stats['generation']
+                optimize_due = (stats['generation'] != optimized_generation
+                                and now - last_optimize >= OPTIMIZE_INTERVAL_S)
+
+                actions = plan_actions(stats, idle, optimize_due)
+                done = [self._run_action(db, action) for action in actions]
+                if ACTION_OPTIMIZE in actions:
+                    last_optimize = now
+                    optimized_generation = stats['generation']
+                for action in requests:
+                    if action in MANUAL_ACTIONS:
+                        try:
+                            message = self._run_action(db, action)
+                        except Exception as e:
+                            message = f"失败: {e}"
+                        done.append(message)
+                        self.result_signal.emit(action, message)
+
+                if done:
+                    stats = db.storage_stats()
+                # 自己的检查点 / 回收改变了 WAL 大小，不算作外部写入
+                last_seen = (stats['generation'], stats['wal_bytes'])
+                stats.update(last_run=time.time(), last_actions=done, idle=idle)
+                self.last_stats = stats
+                self.stats_signal.emit(stats)
+            except Exception as e:
+                print(f"[Maintenance Error] {e}")
+
+    def _run_action(self, db: ImageDB, action: str) -> str:
+        metrics.count(f'maintenance.{action}')
+        if action == ACTION_CHECKPOINT:
+            busy, frames, done = db.checkpoint('TRUNCATE')
+            return f"检查点: {done}/{frames} 帧" + (" (有读写方占用，未截断)" if busy else "")
+        if action == ACTION_PASSIVE_CHECKPOINT:
+            busy, frames, done = db.checkpoint('PASSIVE')
+            return f"检查点 (不等待): {done}/{frames} 帧"
+        if action == ACTION_VACUUM_STEP:
+            return f"回收 {db.incremental_vacuum(VACUUM_STEP_PAGES)} 页"
+        if action == ACTION_OPTIMIZE:
+            db.optimize()
+            return "已更新查询统计"
+        if action == ACTION_FULL_VACUUM:
+            before = db.storage_stats()['db_bytes']
+            db.checkpoint('TRUNCATE')
+            db.vacuum()
+            db.checkpoint('TRUNCATE')
+            return f"完整压缩完成: {_mb(before)} -> {_mb(db.storage_stats()['db_bytes'])}"
+        if action == ACTION_QUICK_CHECK:
+            problems = [row for row in db.quick_check() if row != 'ok']
+            return "完整性检查通过" if not problems else "发现问题:\n" + "\n".join(problems)
+        return ""
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import threading
+from typing import List, Optional, Dict
+
+from model_tools import split_variant, VARIANT_INT8, VARIANT_OPTIMIZED
+
+# 旧版固定文件名 (models/model.onnx + models/tag_mapping.json)
+LEGACY_MODEL_NAME = "model"
+LEGACY_TAGS_FILE = "tag_mapping.json"
+
+class ModelInfo:
+    """
+    一个可用的打标模型:
+    - models/<name>.onnx
+    - 标签映射: <name>.json / <name>_tags.json / <name>.tags.json，找不到时用 tag_mapping.json
+    - 可选配置: <name>.config.json，例如 {"resize_mode": "letterbox", "threshold": 0.35, "batch_size": 4}
+    - 变体 <base>.int8.onnx / <base>.opt.onnx (见 model_tools.py) 找不到自己的映射/配置时使用基础模型的
+    """
+    def __init__(self, name: str, model_path: str, tags_path: str, config: dict = None):
+        self.name = name
+        self.base_name, self.variant = split_variant(name)
+        self.model_path = model_path
+        self.tags_path = tags_path
+        self.config = config or {}
+        self._hash = None
+        self._hash_stamp = None
+
+    def file_hash(self) -> str:
+        """模型文件的 sha256 (按 mtime/size 缓存，文件未变化时不重复计算)"""
+        st = os.stat(self.model_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._hash is None or self._hash_stamp != stamp:
+            h = hashlib.sha256()
+            with open(self.model_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+            self._hash = h.hexdigest()
+            self._hash_stamp = stamp
+        return self._hash
+
+    def __repr__(self):
+        return f"ModelInfo({self.name!r}, {self.model_path!r})"
+
+class ModelRegistry:
+    """
+    扫描 models 目录中的 ONNX 模型，按需 (懒) 加载推理会话。
+    已加载的 TaggerEngine 以模型文件 hash 加上生效的配置 (缩放方式 / batch / 阈值等) 为键缓存：
+    同一文件改名/复制且配置相同时不会重复加载，配置不同的名称各自加载；文件被替换后 hash 变化会自动重新加载。
+    load() 是阻塞调用，应在后台线程中执行 (见 workers.ModelLoadWorker)。
+    """
+    def __init__(self, models_dir: str):
+        self.models_dir = models_dir
+        self._models: Dict[str, ModelInfo] = {}
+        self._engines = {}
+        self._lock = threading.Lock()
+        # 串行化加载：启动预加载与用户触发的加载同时发生时，后者等待并直接命中缓存
+        self._load_lock = threading.Lock()
+        self.discover()
+
+    def discover(self) -> List[ModelInfo]:
+        models = {}
+        if os.path.isdir(self.models_dir):
+            for file_name in sorted(os.listdir(self.models_dir)):
+                if not file_name.lower().endswith('.onnx'):
+                    continue
+                name = file_name[:-len('.onnx')]
+                tags_path = self._find_tags_file(name)
+                if tags_path is None:
+                    print(f"[Models] No tag mapping for {file_name}, skipped")
+                    continue
+                models[name] = ModelInfo(name, os.path.join(self.models_dir, file_name),
+                                         tags_path, self._load_config(name))
+        with self._lock:
+            # 保留已有 ModelInfo 对象 (其中缓存了 hash)
+            for name, info in models.items():
+                old = self._models.get(name)
+                if old and old.model_path == info.model_path:
+                    old.tags_path = info.tags_path
+                    old.config = info.config
+                    models[name] = old
+            self._models = models
+        return self.list_models()
+
+    def _find_tags_file(self, name: str) -> Optional[str]:
+        base, _ = split_variant(name)
+        for n in dict.fromkeys((name, base)):
+            for candidate in (f"{n}.json", f"{n}_tags.json", f"{n}.tags.json"):
+                path = os.path.join(self.models_dir, candidate)
+                if os.path.exists(path):
+                    return path
+        path = os.path.join(self.models_dir, LEGACY_TAGS_FILE)
+        return path if os.path.exists(path) else None
+
+    def _load_config(self, name: str) -> dict:
+        base, _ = split_variant(name)
+        path = os.path.join(self.models_dir, f"{name}.config.json")
+        if not os.path.exists(path):
+            path = os.path.join(self.models_dir, f"{base}.config.json")
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[Models] Bad config {path}: {e}")
+            return {}
+
+    def list_models(self) -> List[ModelInfo]:
+        with self._lock:
+            return list(self._models.values())
+
+    def default_name(self) -> Optional[str]:
+        with self._lock:
+            if LEGACY_MODEL_NAME in self._models:
+                return LEGACY_MODEL_NAME
+            return next(iter(self._models), None)
+
+    def get(self, name: Optional[str] = None) -> Optional[ModelInfo]:
+        if name is None:
+            name = self.default_name()
+        with self._lock:
+            return self._models.get(name)
+
+    def cached(self, name: Optional[str] = None):
+        """已加载的引擎；未加载返回 None，不会触发加载 (也不会重新计算 hash)"""
+        info = self.get(name)
+        if info is None or info._hash is None:
+            return None
+        with self._lock:
+            return self._engines.get(self._engine_key(info, info._hash))
+
+    def load(self, name: Optional[str] = None):
+        """加载 (或从缓存取) 模型对应的 TaggerEngine，阻塞调用"""
+        info = self.get(name)
+        if info is None:
+            raise FileNotFoundError(f"Model not found: {name or '(default)'}")
+
+        with self._load_lock:
+            return self._load(info)
+
+    @staticmethod
+    def _engine_options(info: ModelInfo) -> dict:
+        """构造 TaggerEngine 的参数 (由变体与 <name>.config.json 决定)"""
+        options = {k: info.config[k] for k in ('resize_mode', 'batch_size') if k in info.config}
+        if info.variant == VARIANT_INT8:
+            # 动态量化算子在 DirectML 上不受支持/无收益，只用 CPU
+            options['providers'] = ['CPUExecutionProvider']
+        elif info.variant == VARIANT_OPTIMIZED:
+            # .opt.onnx 是针对 CPU 执行提供者优化后序列化的图 (见 model_tools.optimize_graph)，
+            # 换到 DirectML 上运行既用不上它的融合算子，又因关闭了图优化而缺少布局优化
+            options['providers'] = ['CPUExecutionProvider']
+            options['pre_optimized'] = True
+        return options
+
+    @classmethod
+    def _engine_key(cls, info: ModelInfo, file_hash: str):
+        """
+        缓存键：文件 hash + 生效的参数与阈值。
+        同一文件、同样配置的不同名称共用一个引擎；配置不同 (缩放方式 / 阈值等) 时各自加载
+        """
+        options = tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                               for k, v in cls._engine_options(info).items()))
+        return file_hash, options, info.config.get('threshold')
+
+    def _load(self, info: ModelInfo):
+        file_hash = info.file_hash()
+        key = self._engine_key(info, file_hash)
+        with self._lock:
+            engine = self._engines.get(key)
+        if engine is not None:
+            return engine
+
+        # onnxruntime 较重，延迟到真正需要时才导入
+        from ai_tagger import TaggerEngine
+        engine = TaggerEngine(info.model_path, info.tags_path, **self._engine_options(info))
+        engine.model_name = info.name
+        engine.file_hash = file_hash
+        if 'threshold' in info.config:
+            engine.threshold = float(info.config['threshold'])
+
+        with self._lock:
+            engine = self._engines.setdefault(key, engine)
+        return engine
+
+    def unload(self, name: Optional[str] = None):
+        info = self.get(name)
+        if info is None or info._hash is None:
+            return
+        with self._lock:
+            self._engines.pop(self._engine_key(info, info._hash), None)
@@ -0,0 +1,73 @@
+"""
+模型变体生成工具 (离线执行一次即可)
+
+    python model_tools.py quantize models/model.onnx   -> models/model.int8.onnx (动态 int8 量化，CPU 用)
+    python model_tools.py optimize models/model.onnx   -> models/model.opt.onnx  (序列化的图优化结果，加载更快，CPU 用)
+
+生成的变体会被 ModelRegistry 自动发现，并复用基础模型的标签映射和配置文件。
+"""
+import os
+import sys
+import argparse
+
+# 变体后缀：models/<base>.<variant>.onnx
+VARIANT_INT8 = 'int8'
+VARIANT_OPTIMIZED = 'opt'
+KNOWN_VARIANTS = (VARIANT_INT8, VARIANT_OPTIMIZED)
+
+def split_variant(name: str):
+    """'model.int8' -> ('model', 'int8')；不是已知变体时返回 (name, None)"""
+    base, dot, suffix = name.rpartition('.')
+    if dot and suffix in KNOWN_VARIANTS:
+        return base, suffix
+    return name, None
+
+def variant_path(model_path: str, variant: str) -> str:
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+def quantize_dynamic_int8(model_path: str, output_path: str = None) -> str:
+    """权重 int8 动态量化 (激活在运行时量化)，主要用于 CPU 推理"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_path = output_path or variant_path(model_path, VARIANT_INT8)
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+def optimize_graph(model_path: str, output_path: str = None) -> str:
+    """
+    让 onnxruntime 做一次图优化并把结果写到文件，之后加载时可跳过优化。
+    使用 EXTENDED 级别：ALL 级别会引入与执行设备相关的布局变换，换机器后可能无法加载。
+    EXTENDED 的融合算子同样是针对 CPU 执行提供者生成的，ModelRegistry 只用 CPU 加载 .opt 变体
+    (与 int8 变体相同)；DirectML 用户应直接使用基础模型
+    """
+    import onnxruntime as ort
+
+    output_path = output_path or variant_path(model_path, VARIANT_OPTIMIZED)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = output_path
+    ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+    return output_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ONNX model variants")
+    parser.add_argument("action", choices=["quantize", "optimize", "all"])
+    parser.add_argument("model", help="基础模型路径，例如 models/model.onnx")
+    parser.add_argument("-o", "--output", help="输出路径 (默认在原文件名后加 .int8 / .opt)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        print(f"Model file not found: {args.model}")
+        return 1
+
+    if args.action in ("quantize", "all"):
+        out = quantize_dynamic_int8(args.model, args.output if args.action == "quantize" else None)
+        print(f"[int8] {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    if args.action in ("optimize", "all"):
+        out = optimize_graph(args.model, args.output if args.action == "optimize" else None)
+        print(f"[opt]  {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
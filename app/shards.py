@@ -0,0 +1,557 @@
+"""
+按根目录分片的图库 (可选，用于千万级图片)：每个导入根目录一个独立的 SQLite 文件。
+
+每个分片与 images.db 结构完全相同 (迁移、触发器、写入线程、维护都按分片各自进行)，另外记录自己的根目录：
+- 备份 / VACUUM / 重建只涉及一个分片，其他根目录照常读写
+- 把一个根目录的数据带到另一台机器：export 得到单个文件，对方 import 即可 (标签、目录树、丢失标记全部保留)
+- 不再需要的根目录直接 drop，不必在大库里 DELETE 后再回收空间
+
+ShardedLibrary 把查询分发到各分片再合并：计数 / 标签统计求和，列表按 (created_at, id) 倒序归并，
+支持 OFFSET 与键集两种分页。对外的图片 / 目录 id 是 "全局 id" = 分片槽位 << SHARD_ID_BITS | 分片内 id，
+只在本进程内有效 (槽位在打开分片时分配)，持久化时请用文件路径。
+
+现有单库可以用 split 拆分 (ATTACH 原库后按目录子树 INSERT ... SELECT，原库不修改):
+    python shards.py split ../images.db ../shards                # 按监视目录 (导入根目录) 拆分
+    python shards.py split ../images.db ../shards --root D:\\Photos
+    python shards.py list ../shards
+    python shards.py export ../shards D:\\Photos photos.shard.db  # 单文件快照 (VACUUM INTO)
+    python shards.py import ../shards photos.shard.db
+    python shards.py rebuild ../shards D:\\Photos                 # 重建统计 / tag_blob / 索引并压缩
+    python shards.py drop ../shards D:\\Photos
+"""
+import os
+import sys
+import heapq
+import shutil
+import hashlib
+import sqlite3
+import argparse
+import threading
+from itertools import islice
+from typing import List, Tuple, Optional, Dict, NamedTuple
+
+from database import ImageDB, ImageRow
+from db_writer import stop_writer
+
+SHARD_SUFFIX = '.shard.db'
+# 全局 id 中分片内 id 占用的位数 (单个分片最多约 1 万亿行)
+SHARD_ID_BITS = 40
+LOCAL_ID_MASK = (1 << SHARD_ID_BITS) - 1
+# 归并排序时每个分片每次读取的行数
+MERGE_CHUNK = 200
+# 分片自己的结构迁移 (在 ImageDB 的 MIGRATIONS 之后执行)。版本号记在 shard_info 的 schema_version 中，
+# 不占用 user_version，ImageDB 以后新增迁移不会与之冲突
+SHARD_MIGRATIONS = (
+    '_migrate_shard_1_info',
+)
+SHARD_SCHEMA_VERSION = len(SHARD_MIGRATIONS)
+
+def make_global_id(slot: int, local_id: int) -> int:
+    return (slot << SHARD_ID_BITS) | local_id
+
+def split_global_id(global_id: int) -> Tuple[int, int]:
+    """全局 id -> (槽位, 分片内 id)"""
+    return global_id >> SHARD_ID_BITS, global_id & LOCAL_ID_MASK
+
+def shard_file_name(root: str) -> str:
+    """根目录 -> 分片文件名 (可读的目录名 + 路径 hash，不同盘符下的同名目录不冲突)"""
+    base = os.path.basename(root.rstrip('\\/')) or 'root'
+    base = ''.join(c if c.isalnum() or c in '-_' else '_' for c in base)[:40]
+    digest = hashlib.sha1(os.path.normcase(root).encode('utf-8')).hexdigest()[:8]
+    return f"{base}-{digest}{SHARD_SUFFIX}"
+
+def read_shard_root(db_path: str) -> Optional[str]:
+    """分片文件记录的根目录 (不是分片时返回 None)，只读打开，不做迁移"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM shard_info WHERE key = 'root'").fetchone()
+        return row[0] if row else None
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        conn.close()
+
+class ShardDB(ImageDB):
+    """一个根目录的分片：ImageDB 结构加上 shard_info (记录根目录) 与跨分片排序用的 created_at 索引"""
+    def init_db(self):
+        super().init_db()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        version = self._shard_version(cursor)
+        if version > SHARD_SCHEMA_VERSION:
+            print(f"[Shards] Shard schema version {version} is newer than this program ({SHARD_SCHEMA_VERSION})")
+        for number in range(version + 1, SHARD_SCHEMA_VERSION + 1):
+            name = SHARD_MIGRATIONS[number - 1]
+            getattr(self, name)(cursor)
+            cursor.execute("INSERT OR REPLACE INTO shard_info (key, value) VALUES ('schema_version', ?)", (str(number),))
+            conn.commit()
+            print(f"[Shards] Shard schema migrated to version {number} ({name})")
+        conn.close()
+
+    def _shard_version(self, cursor) -> int:
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shard_info'").fetchone() is None:
+            return 0
+        row = cursor.execute("SELECT value FROM shard_info WHERE key = 'schema_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _migrate_shard_1_info(self, cursor):
+        """版本 1：shard_info 与 created_at 索引 (早期分片已有这两项，IF NOT EXISTS 补齐版本号即可)"""
+        cursor.execute("CREATE TABLE IF NOT EXISTS shard_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # 隐含 rowid，即 (created_at, id)：归并分页的每个分片都是索引上的范围扫描
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_created ON images (created_at)")
+
+    def get_root(self) -> Optional[str]:
+        conn = self.get_connection()
+        row = conn.execute("SELECT value FROM shard_info WHERE key = 'root'").fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def set_root(self, root: str):
+        self.write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO shard_info (key, value) VALUES ('root', ?)", (root,)))
+
+class Shard(NamedTuple):
+    slot: int
+    root: str
+    db: ShardDB
+
+class ShardedLibrary:
+    def __init__(self, shard_dir: str):
+        self.shard_dir = os.path.abspath(shard_dir)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # 槽位 -> Shard；删除的槽位不再复用，已发出的全局 id 不会指向别的分片
+        self._shards: Dict[int, Shard] = {}
+        self._next_slot = 1
+        self.refresh()
+
+    # ================= 分片管理 =================
+
+    def refresh(self) -> List[Shard]:
+        """打开目录中新出现的分片文件 (例如手动复制进来的)，返回新打开的分片"""
+        opened = {os.path.normcase(s.db.db_path) for s in self.shards()}
+        added = []
+        for name in sorted(os.listdir(self.shard_dir)):
+            path = os.path.join(self.shard_dir, name)
+            if not name.endswith(SHARD_SUFFIX) or os.path.normcase(path) in opened:
+                continue
+            root = read_shard_root(path)
+            if root is None:
+                print(f"[Shards] Skipping {name}: not a shard")
+                continue
+            if self.find_shard(root) is not None:
+                print(f"[Shards] Skipping {name}: root already loaded ({root})")
+                continue
+            added.append(self._open(path, root))
+        return added
+
+    def _open(self, path: str, root: str) -> Shard:
+        db = ShardDB(path)
+        with self._lock:
+            shard = Shard(self._next_slot, root, db)
+            self._shards[shard.slot] = shard
+            self._next_slot += 1
+        return shard
+
+    def shards(self) -> List[Shard]:
+        with self._lock:
+            return list(self._shards.values())
+
+    def find_shard(self, root: str) -> Optional[Shard]:
+        key = os.path.normcase(os.path.normpath(root))
+        for shard in self.shards():
+            if os.path.normcase(shard.root) == key:
+                return shard
+        return None
+
+    def _require_shard(self, root: str) -> Shard:
+        shard = self.find_shard(root)
+        if shard is None:
+            raise KeyError(f"no shard for root {root}")
+        return shard
+
+    def shard_for_path(self, file_path: str) -> Optional[Shard]:
+        """文件所属的分片 (根目录最长匹配)"""
+        path = os.path.normcase(os.path.normpath(file_path))
+        best = None
+        for shard in self.shards():
+            root = os.path.normcase(shard.root).rstrip('\\/')
+            if (path == root or path.startswith(root + os.sep)) and (best is None or len(shard.root) > len(best.root)):
+                best = shard
+        return best
+
+    def _shard_by_slot(self, slot: int) -> Shard:
+        with self._lock:
+            shard = self._shards.get(slot)
+        if shard is None:
+            raise KeyError(f"shard slot {slot} is not loaded")
+        return shard
+
+    def add_root(self, root: str) -> Shard:
+        """为根目录新建一个空分片 (已存在时直接返回)"""
+        root = os.path.normpath(root)
+        shard = self.find_shard(root)
+        if shard is not None:
+            return shard
+        shard = self._open(os.path.join(self.shard_dir, shard_file_name(root)), root)
+        shard.db.set_root(root)
+        shard.db.add_watch_root(root)
+        print(f"[Shards] Created shard for {root}")
+        return shard
+
+    def drop_root(self, root: str):
+        """删除一个根目录的全部数据 (删除分片文件，不影响其他分片和硬盘上的图片)"""
+        shard = self._require_shard(root)
+        with self._lock:
+            del self._shards[shard.slot]
+        stop_writer(shard.db.db_path)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard.db.db_path + suffix):
+                os.remove(shard.db.db_path + suffix)
+        print(f"[Shards] Dropped shard for {shard.root}")
+
+    def rebuild(self, root: str) -> dict:
+        """重建一个分片：统计表、待更新的 tag_blob、索引，然后 ANALYZE 并 VACUUM。返回重建后的 storage_stats"""
+        db = self._require_shard(root).db
+        db.rebuild_stats()
+        db.refresh_tag_blobs()
+        db.write(lambda cursor: cursor.execute("REINDEX"))
+        db.optimize()
+        db.checkpoint('TRUNCATE')
+        db.vacuum()
+        return db.storage_stats()
+
+    def export_shard(self, root: str, dest_path: str):
+        """把一个分片写成单个文件 (VACUUM INTO 一致快照，不含 WAL)，可以直接复制到其他机器后 import"""
+        db = self._require_shard(root).db
+        if os.path.exists(dest_path):
+            raise FileExistsError(dest_path)
+        conn = db.get_connection()
+        try:
+            conn.execute("VACUUM INTO ?", (os.path.abspath(dest_path),))
+        finally:
+            conn.close()
+
+    def import_shard(self, src_path: str) -> Shard:
+        """复制一个分片文件进来并打开 (同一根目录已存在时拒绝)"""
+        root = read_shard_root(src_path)
+        if root is None:
+            raise ValueError(f"{src_path} is not a shard")
+        if self.find_shard(root) is not None:
+            raise ValueError(f"root already exists: {root}")
+        dest = os.path.join(self.shard_dir, shard_file_name(root))
+        shutil.copyfile(src_path, dest)
+        return self._open(dest, root)
+
+    # ================= 从单库拆分 =================
+
+    def split(self, source_path: str, roots: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        把单个 images.db 按根目录拆分为分片 (原库只读，不做修改)。
+        roots 默认为原库的监视目录；返回 {根目录: 图片数}，不在任何根目录下的图片留在原库，计数在 None 键下
+        """
+        source_path = os.path.abspath(source_path)
+        # 打开时先把原库迁移到当前结构，列与分片一致
+        source = ImageDB(source_path)
+        watch_roots = source.get_watch_roots()
+        if roots is None:
+            roots = [path for path, _ in watch_roots]
+        roots = sorted({os.path.normpath(r) for r in roots}, key=len, reverse=True)
+        if not roots:
+            raise ValueError("no roots given and the source database has no watch roots")
+        for root in roots:
+            if self.find_shard(root) is not None:
+                raise ValueError(f"root already exists: {root}")
+
+        result = {}
+        copied = set()
+        for root in roots:
+            shard = self.add_root(root)
+            result[root] = self._copy_subtree(shard, source_path, root, copied)
+            for path, recursive in watch_roots:
+                if path != root and path.startswith(root.rstrip('\\/') + os.sep) and self.shard_for_path(path) is shard:
+                    shard.db.add_watch_root(path, recursive)
+            copied.add(root)
+            print(f"[Shards] {root}: {result[root]} images")
+
+        result[None] = source.count_images() - sum(result.values())
+        return result
+
+    def _copy_subtree(self, shard: Shard, source_path: str, root: str, exclude_roots) -> int:
+        """
+        在分片写入线程的连接上 ATTACH 原库，按闭包表复制根目录子树的目录 / 图片 / 标签 / 模型 (保留原 id)。
+        已拆到更深一层根目录 (嵌套的监视目录) 的子树跳过，每张图片只属于一个分片。
+        分片上的触发器照常维护 tag_stats / folder_stats / 代数
+        """
+        db = shard.db
+        def run(cursor):
+            # ATTACH / DETACH 不能在事务中执行，因此作为独占操作提交，复制部分自己开事务
+            cursor.execute("ATTACH DATABASE ? AS src", (source_path,))
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    count = self._copy_attached(db, cursor, root, exclude_roots)
+                    cursor.execute("COMMIT")
+                except BaseException:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                cursor.execute("DETACH DATABASE src")
+            return count
+        count = db.write_exclusive(run)
+        db.refresh_tag_blobs()
+        db.optimize(count)
+        return count
+
+    def _copy_attached(self, db: ShardDB, cursor, root: str, exclude_roots) -> int:
+        """_copy_subtree 的复制部分，在已 ATTACH 原库的事务中执行，返回复制的图片数"""
+        row = cursor.execute("SELECT id FROM src.folders WHERE path = ?", (root,)).fetchone()
+        if row is None:
+            return 0
+        root_id = row[0]
+        cursor.execute("CREATE TEMP TABLE split_images (id INTEGER PRIMARY KEY)")
+        cursor.execute('''
+            INSERT INTO split_images SELECT i.id FROM src.images i WHERE i.folder_id IN (
+                SELECT descendant_id FROM src.folder_closure WHERE ancestor_id = ?
+            )
+        ''', (root_id,))
+        for nested in exclude_roots:
+            cursor.execute('''
+                DELETE FROM split_images WHERE id IN (
+                    SELECT i.id FROM src.images i WHERE i.folder_id IN (
+                        SELECT c.descendant_id FROM src.folder_closure c
+                        JOIN src.folders f ON f.id = c.ancestor_id WHERE f.path = ?
+                    )
+                )
+            ''', (nested,))
+
+        # 目录：根目录的全部祖先 + 子树，父目录 (路径更短) 先插入
+        cursor.execute('''
+            CREATE TEMP TABLE split_folders AS
+            SELECT ancestor_id AS id FROM src.folder_closure WHERE descendant_id = ?
+            UNION SELECT descendant_id FROM src.folder_closure WHERE ancestor_id = ?
+        ''', (root_id, root_id))
+        cursor.execute('''
+            INSERT INTO folders (id, parent_id, path)
+            SELECT id, parent_id, path FROM src.folders WHERE id IN (SELECT id FROM split_folders)
+            ORDER BY LENGTH(path)
+        ''')
+        cursor.execute('''
+            INSERT INTO folder_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM src.folder_closure
+            WHERE ancestor_id IN (SELECT id FROM split_folders) AND descendant_id IN (SELECT id FROM split_folders)
+        ''')
+
+        cursor.execute("INSERT INTO models SELECT * FROM src.models")
+        cursor.execute('''
+            INSERT INTO tags (id, name) SELECT id, name FROM src.tags WHERE id IN (
+                SELECT DISTINCT tag_id FROM src.image_tags WHERE image_id IN (SELECT id FROM split_images)
+            )
+        ''')
+        columns = ', '.join(row[1] for row in cursor.execute("PRAGMA main.table_info(images)"))
+        cursor.execute(f'''
+            INSERT INTO images ({columns}) SELECT {columns} FROM src.images
+            WHERE id IN (SELECT id FROM split_images)
+        ''')
+        count = cursor.rowcount
+        tag_columns = ', '.join(row[1] for row in cursor.execute("PRAGMA main.table_info(image_tags)"))
+        cursor.execute(f'''
+            INSERT INTO image_tags ({tag_columns}) SELECT {tag_columns} FROM src.image_tags
+            WHERE image_id IN (SELECT id FROM split_images)
+        ''')
+        # 插入标签时触发器把 tag_blob 置为待重建，原库里已是最新的直接带回来
+        cursor.execute('''
+            UPDATE images SET tag_blob = (SELECT s.tag_blob FROM src.images s WHERE s.id = images.id)
+            WHERE tag_blob IS NULL
+        ''')
+        # 嵌套根目录拆走后留下的空目录节点
+        db._prune_empty_folders(cursor)
+        # 临时表留在写入线程的连接上，用完即删 (下一个根目录会重新创建)
+        cursor.execute("DROP TABLE temp.split_images")
+        cursor.execute("DROP TABLE temp.split_folders")
+        return count
+
+    # ================= 跨分片查询 =================
+
+    def _local_filters(self, shard: Shard, filters: Optional[dict]) -> Tuple[bool, Optional[dict]]:
+        """把全局筛选条件转成某个分片的条件；(False, None) 表示该分片不可能有结果"""
+        if not filters:
+            return True, filters
+        if filters.get('tagged_by_other_model'):
+            raise ValueError("tagged_by_other_model refers to a per-shard model id; query the shard directly")
+        if filters.get('folder_id'):
+            slot, local_id = split_global_id(filters['folder_id'])
+            if slot != shard.slot:
+                return False, None
+            filters = dict(filters, folder_id=local_id)
+        return True, filters
+
+    def _targets(self, filters: Optional[dict]):
+        for shard in self.shards():
+            ok, local = self._local_filters(shard, filters)
+            if ok:
+                yield shard, local
+
+    def count_images(self, filters: dict = None) -> int:
+        return sum(shard.db.count_images(local) for shard, local in self._targets(filters))
+
+    def _iter_shard_ordered(self, shard: Shard, filters, before: Optional[Tuple[str, int]]):
+        """单个分片按全局顺序 (created_at, 全局 id 降序) 产出 ((created_at, 全局 id), ImageRow)"""
+        local_before = None
+        if before is not None:
+            created_at, global_id = before
+            slot, local_id = split_global_id(global_id)
+            # 同一时间戳内全局 id 按槽位排：槽位更小的分片中该时间戳的行全部排在后面，更大的全部排在前面
+            if shard.slot < slot:
+                local_before = (created_at, LOCAL_ID_MASK + 1)
+            elif shard.slot > slot:
+                local_before = (created_at, 0)
+            else:
+                local_before = (created_at, local_id)
+        for rows in shard.db.iter_recent_chunks(filters, MERGE_CHUNK, local_before):
+            for created_at, row in rows:
+                global_id = make_global_id(shard.slot, row.id)
+                yield (created_at, global_id), row._replace(id=global_id)
+
+    def iter_images(self, filters: dict = None, before: Optional[Tuple[str, int]] = None):
+        """
+        全部分片归并后的结果，按入库时间倒序 (同一时间按全局 id 倒序)，产出 (键, ImageRow)。
+        每个分片按需分批读取，取前 N 条只会读到各分片的前 N 条
+        """
+        streams = [self._iter_shard_ordered(shard, local, before) for shard, local in self._targets(filters)]
+        return heapq.merge(*streams, key=lambda item: item[0], reverse=True)
+
+    def get_image_page(self, filters: dict = None, limit: int = 200,
+                       before: Optional[Tuple[str, int]] = None) -> Tuple[List[ImageRow], Optional[Tuple[str, int]]]:
+        """键集分页：返回 (本页 ImageRow, 下一页的 before)，没有更多时为 None"""
+        items = list(islice(self.iter_images(filters, before), limit))
+        rows = [row for _, row in items]
+        return rows, (items[-1][0] if len(items) == limit else None)
+
+    def get_images_paginated(self, page: int = 1, page_size: int = 50, filters: dict = None) -> Tuple[List[ImageRow], int]:
+        """与 ImageDB.get_images_paginated 相同的接口；深页需要各分片跳过 offset 行，连续翻页请用 get_image_page"""
+        offset = (page - 1) * page_size
+        rows = [row for _, row in islice(self.iter_images(filters), offset, offset + page_size)]
+        return rows, self.count_images(filters)
+
+    def get_image_rows(self, image_ids) -> List[ImageRow]:
+        """按给定全局 id 顺序取 ImageRow，已被删除的跳过"""
+        by_slot = {}
+        for global_id in image_ids:
+            slot, local_id = split_global_id(global_id)
+            by_slot.setdefault(slot, []).append(local_id)
+        found = {}
+        for slot, local_ids in by_slot.items():
+            for row in self._shard_by_slot(slot).db.get_image_rows(local_ids):
+                global_id = make_global_id(slot, row.id)
+                found[global_id] = row._replace(id=global_id)
+        return [found[i] for i in image_ids if i in found]
+
+    def get_tag_stats(self) -> Dict[str, int]:
+        merged = {}
+        for shard in self.shards():
+            for name, count in shard.db.get_tag_stats().items():
+                merged[name] = merged.get(name, 0) + count
+        return merged
+
+    def get_all_tags(self) -> List[str]:
+        return sorted(self.get_tag_stats())
+
+    def get_folder_tree(self) -> List[dict]:
+        """各分片的目录树合并，id / parent_id 为全局 id (祖先目录在每个分片中各有一份)"""
+        nodes = []
+        for shard in self.shards():
+            for node in shard.db.get_folder_tree():
+                node['id'] = make_global_id(shard.slot, node['id'])
+                if node['parent_id'] is not None:
+                    node['parent_id'] = make_global_id(shard.slot, node['parent_id'])
+                node['shard_root'] = shard.root
+                nodes.append(node)
+        nodes.sort(key=lambda node: node['path'])
+        return nodes
+
+    def storage_stats(self) -> Dict[str, dict]:
+        """{根目录: storage_stats}"""
+        return {shard.root: shard.db.storage_stats() for shard in self.shards()}
+
+    # ================= 写入 (按根目录 / 全局 id 分发到分片) =================
+
+    def add_image(self, file_path: str, file_name: str, dir_path: str, size: int = 0) -> int:
+        """写入所属根目录的分片，返回全局 id (不在任何根目录下时为 -1)"""
+        shard = self.shard_for_path(file_path)
+        if shard is None:
+            print(f"[Shards] No shard for {file_path}")
+            return -1
+        local_id = shard.db.add_image(file_path, file_name, dir_path, size)
+        return make_global_id(shard.slot, local_id) if local_id != -1 else -1
+
+    def get_tags_for_image(self, image_id: int) -> List[dict]:
+        slot, local_id = split_global_id(image_id)
+        return self._shard_by_slot(slot).db.get_tags_for_image(local_id)
+
+    def add_image_tag(self, image_id: int, tag_name: str, confidence: float = 1.0, is_prediction: int = 0,
+                      mode: str = 'append'):
+        slot, local_id = split_global_id(image_id)
+        self._shard_by_slot(slot).db.add_image_tag(local_id, tag_name, confidence, is_prediction, mode)
+
+    def remove_image_tag(self, image_id: int, tag_name: str):
+        slot, local_id = split_global_id(image_id)
+        self._shard_by_slot(slot).db.remove_image_tag(local_id, tag_name)
+
+    def add_image_tags_bulk(self, entries, mode: str = 'append', clear_image_ids=()) -> int:
+        """entries = [(全局 id, tag_name, confidence, is_prediction)]，每个分片一个事务"""
+        grouped = {}
+        for global_id, name, conf, is_prediction in entries:
+            slot, local_id = split_global_id(global_id)
+            grouped.setdefault(slot, ([], []))[0].append((local_id, name, conf, is_prediction))
+        for global_id in clear_image_ids:
+            slot, local_id = split_global_id(global_id)
+            grouped.setdefault(slot, ([], []))[1].append(local_id)
+        return sum(self._shard_by_slot(slot).db.add_image_tags_bulk(local_entries, mode, clear_image_ids=clear)
+                   for slot, (local_entries, clear) in grouped.items())
+
+# ================= 命令行 =================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage per-root database shards")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("split", help="把单个 images.db 按根目录拆分为分片 (原库不修改)")
+    p.add_argument("source")
+    p.add_argument("shard_dir")
+    p.add_argument("--root", action="append", help="根目录 (可重复)，默认为原库的监视目录")
+    p = sub.add_parser("list", help="列出分片及其大小")
+    p.add_argument("shard_dir")
+    for name, help_text in (("rebuild", "重建统计 / tag_blob / 索引并压缩"), ("drop", "删除分片文件")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("shard_dir")
+        p.add_argument("root")
+    p = sub.add_parser("export", help="导出分片为单个文件")
+    p.add_argument("shard_dir")
+    p.add_argument("root")
+    p.add_argument("dest")
+    p = sub.add_parser("import", help="导入分片文件")
+    p.add_argument("shard_dir")
+    p.add_argument("file")
+    args = parser.parse_args(argv)
+
+    library = ShardedLibrary(args.shard_dir)
+    if args.action == "split":
+        result = library.split(args.source, args.root)
+        leftover = result.pop(None)
+        print(f"{sum(result.values())} images in {len(result)} shards, {leftover} outside the given roots")
+    elif args.action == "list":
+        for root, stats in library.storage_stats().items():
+            print(f"{root}\t{stats['db_bytes'] / (1024 * 1024):,.1f} MB\t{library.find_shard(root).db.count_images():,} images")
+    elif args.action == "rebuild":
+        stats = library.rebuild(args.root)
+        print(f"{args.root}: {stats['db_bytes'] / (1024 * 1024):,.1f} MB")
+    elif args.action == "drop":
+        library.drop_root(args.root)
+    elif args.action == "export":
+        library.export_shard(args.root, args.dest)
+    elif args.action == "import":
+        print(f"Imported {library.import_shard(args.file).root}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+标签的批量导出 / 导入 (流式处理，内存只与批大小有关，百万级图库也可使用)
+
+格式:
+    txt      每张图片旁边的同名 .txt 标注文件 (训练集常用)，标签按置信度降序、以 ", " 分隔
+    jsonl    每行一张图片: {"path": ..., "tags": [{"name": ..., "confidence": ..., "prediction": ...}]}
+    csv      每行一个 图片-标签: file_path, tag, confidence, is_prediction, model
+    parquet  与 csv 相同的列 (需要 pyarrow)
+
+    python tag_io.py export jsonl tags.jsonl
+    python tag_io.py export txt --min-confidence 0.5
+    python tag_io.py import txt --mode overwrite
+    python tag_io.py import csv tags.csv
+
+导入按 file_path 匹配库中已有的图片 (不会新增图片)，来源模型不导入 (写入为人工标签或无模型的预测)。
+"""
+import os
+import sys
+import csv
+import json
+import sqlite3
+import argparse
+
+from database import ImageDB, decode_tag_blob
+
+FORMAT_TXT = 'txt'
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMATS = (FORMAT_TXT, FORMAT_JSONL, FORMAT_CSV, FORMAT_PARQUET)
+
+# 导入模式，与批量打标的 append / unique / overwrite 含义相同
+IMPORT_MODES = ('append', 'unique', 'overwrite')
+
+CSV_COLUMNS = ['file_path', 'tag', 'confidence', 'is_prediction', 'model']
+CAPTION_SEPARATOR = ', '
+# 每批读取 / 写入的图片数 (导入时为标签行数)
+BATCH_SIZE = 5000
+# 输出文件的写缓冲 (字节)
+WRITE_BUFFER = 1 << 20
+
+def sidecar_path(image_path: str) -> str:
+    return os.path.splitext(image_path)[0] + '.txt'
+
+def parse_caption(text: str):
+    """'a, b\\nc' -> ['a', 'b', 'c'] (去空白、去重、保持顺序)"""
+    tags = (t.strip() for line in text.splitlines() for t in line.split(','))
+    return list(dict.fromkeys(t for t in tags if t))
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+        return pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet 需要 pyarrow (pip install pyarrow)")
+
+# ================= 导出 =================
+
+def iter_export_batches(db: ImageDB, filters: dict = None, min_confidence: float = 0.0, batch_size: int = BATCH_SIZE):
+    """
+    按批产出 [(file_path, [(tag, confidence, is_prediction, model_name)])]，
+    标签来自 tag_blob (已按置信度降序)，不 JOIN image_tags
+    """
+    for rows in db.iter_tagged_rows(filters, batch_size):
+        decoded = [(path, [e for e in decode_tag_blob(blob) if e[1] >= min_confidence]) for _, path, blob in rows]
+        tag_names = db.get_tag_names({e[0] for _, entries in decoded for e in entries})
+        model_names = db.get_model_names({e[3] for _, entries in decoded for e in entries if e[3]})
+        yield [(path, [(tag_names.get(tag_id), conf, bool(pred), model_names.get(model_id))
+                       for tag_id, conf, pred, model_id in entries])
+               for path, entries in decoded]
+
+def export_tags(db: ImageDB, fmt: str, path: str = None, filters: dict = None, min_confidence: float = 0.0,
+                progress=None) -> int:
+    """
+    导出标签，返回处理的图片数。fmt 为 txt 时 path 不使用 (写到每张图片旁边)，没有标签的图片不生成文件。
+    progress: 可选回调 progress(已处理图片数)
+    """
+    batches = iter_export_batches(db, filters, min_confidence)
+    if fmt == FORMAT_TXT:
+        return _export_txt(batches, progress)
+    if path is None:
+        raise ValueError(f"{fmt} 导出需要输出文件路径")
+    if fmt == FORMAT_JSONL:
+        return _export_jsonl(batches, path, progress)
+    if fmt == FORMAT_CSV:
+        return _export_csv(batches, path, progress)
+    if fmt == FORMAT_PARQUET:
+        return _export_parquet(batches, path, progress)
+    raise ValueError(f"未知格式: {fmt}")
+
+def _export_txt(batches, progress) -> int:
+    done = 0
+    for batch in batches:
+        for image_path, tags in batch:
+            if tags:
+                try:
+                    with open(sidecar_path(image_path), 'w', encoding='utf-8') as f:
+                        f.write(CAPTION_SEPARATOR.join(t[0] for t in tags))
+                except OSError as e:
+                    print(f"[Export] {image_path}: {e}")
+        done += len(batch)
+        if progress:
+            progress(done)
+    return done
+
+def _export_jsonl(batches, path, progress) -> int:
+    done = 0
+    with open(path, 'w', encoding='utf-8', newline='\n', buffering=WRITE_BUFFER) as f:
+        for batch in batches:
+            f.writelines(json.dumps({
+                'path': image_path,
+                'tags': [{'name': name, 'confidence': round(conf, 4), 'prediction': pred, 'model': model}
+                         for name, conf, pred, model in tags],
+            }, ensure_ascii=False) + '\n' for image_path, tags in batch)
+            done += len(batch)
+            if progress:
+                progress(done)
+    return done
+
+def _export_csv(batches, path, progress) -> int:
+    done = 0
+    with open(path, 'w', encoding='utf-8', newline='', buffering=WRITE_BUFFER) as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for batch in batches:
+            writer.writerows((image_path, name, round(conf, 4), int(pred), model or '')
+                             for image_path, tags in batch for name, conf, pred, model in tags)
+            done += len(batch)
+            if progress:
+                progress(done)
+    return done
+
+def _export_parquet(batches, path, progress) -> int:
+    pa = _require_pyarrow()
+    schema = pa.schema([('file_path', pa.string()), ('tag', pa.string()), ('confidence', pa.float32()),
+                        ('is_prediction', pa.bool_()), ('model', pa.string())])
+    done = 0
+    # 每批一个 row group，写完即释放
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            columns = {name: [] for name in schema.names}
+            for image_path, tags in batch:
+                for name, conf, pred, model in tags:
+                    columns['file_path'].append(image_path)
+                    columns['tag'].append(name)
+                    columns['confidence'].append(conf)
+                    columns['is_prediction'].append(pred)
+                    columns['model'].append(model)
+            writer.write_table(pa.table(columns, schema=schema))
+            done += len(batch)
+            if progress:
+                progress(done)
+    return done
+
+# ================= 导入 =================
+
+class _TagImporter:
+    """
+    收集 (图片, tag, confidence, is_prediction)，攒满一批后按路径查 id，经 add_image_tags_bulk 一次写入。
+    图片用路径 (add) 或已知的 id (add_id) 指定。同一图片的行在外部文件中不一定连续，可能分散在多批里：
+    已处理过的图片 id 记在一个私有的临时 SQLite 库中 (页缓存之外落盘，内存不随图片数增长)，
+    覆盖模式下每张图片只在第一次出现时清空旧标签，图片数也按此去重
+    """
+    def __init__(self, db: ImageDB, mode: str, batch_size: int = BATCH_SIZE):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"未知导入模式: {mode}")
+        self.db = db
+        self.mode = mode
+        self.batch_size = batch_size
+        # (file_path, image_id, tag, confidence, is_prediction)，二者之一为 None
+        self.pending = []
+        self.images = 0
+        self.tags_written = 0
+        self.unknown_paths = 0
+        # 空文件名：关闭时自动删除的临时库
+        self._seen = sqlite3.connect('')
+        self._seen.execute("CREATE TABLE seen (id INTEGER PRIMARY KEY)")
+
+    def add(self, file_path: str, tag: str, confidence: float = 1.0, is_prediction: int = 0):
+        self.pending.append((file_path, None, tag, confidence, is_prediction))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_id(self, image_id: int, tag: str, confidence: float = 1.0, is_prediction: int = 0):
+        self.pending.append((None, image_id, tag, confidence, is_prediction))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _first_seen(self, image_ids) -> list:
+        """image_ids 中此前没有出现过的 id (并记为已出现)"""
+        new = []
+        cursor = self._seen.cursor()
+        for image_id in image_ids:
+            cursor.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (image_id,))
+            if cursor.rowcount:
+                new.append(image_id)
+        return new
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        paths = {p[0] for p in pending if p[1] is None}
+        ids = self.db.get_image_ids_by_paths(paths) if paths else {}
+        self.unknown_paths += len(paths - ids.keys())
+        entries = [(image_id if path is None else ids[path], tag, conf, pred)
+                   for path, image_id, tag, conf, pred in pending if path is None or path in ids]
+        new_ids = self._first_seen({e[0] for e in entries})
+        clear = new_ids if self.mode == 'overwrite' else []
+        self.tags_written += self.db.add_image_tags_bulk(
+            entries, 'unique' if self.mode == 'unique' else 'append', clear_image_ids=clear)
+        self.images += len(new_ids)
+
+    def close(self):
+        self._seen.close()
+
+def import_tags(db: ImageDB, fmt: str, path: str = None, filters: dict = None, mode: str = 'append',
+                progress=None) -> dict:
+    """
+    导入标签。fmt 为 txt 时读取库中 (filters 范围内) 每张图片旁边的 .txt，path 不使用。
+    返回 {'images': 写入标签的图片数, 'tags': 写入行数, 'unknown': 库中不存在的路径数}
+    """
+    if fmt != FORMAT_TXT and path is None:
+        raise ValueError(f"{fmt} 导入需要输入文件路径")
+    importer = _TagImporter(db, mode)
+    try:
+        if fmt == FORMAT_TXT:
+            _import_txt(db, importer, filters, progress)
+        elif fmt == FORMAT_JSONL:
+            _import_jsonl(importer, path, progress)
+        elif fmt == FORMAT_CSV:
+            _import_csv(importer, path, progress)
+        elif fmt == FORMAT_PARQUET:
+            _import_parquet(importer, path, progress)
+        else:
+            raise ValueError(f"未知格式: {fmt}")
+        importer.flush()
+    finally:
+        importer.close()
+    return {'images': importer.images, 'tags': importer.tags_written, 'unknown': importer.unknown_paths}
+
+def _import_txt(db, importer, filters, progress):
+    done = 0
+    for rows in db.iter_image_chunks(filters, BATCH_SIZE, "i.id, i.file_path"):
+        for row in rows:
+            try:
+                with open(sidecar_path(row[1]), encoding='utf-8') as f:
+                    tags = parse_caption(f.read())
+            except FileNotFoundError:
+                continue
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"[Import] {row[1]}: {e}")
+                continue
+            for tag in tags:
+                importer.add_id(row[0], tag)
+        done += len(rows)
+        if progress:
+            progress(done)
+
+def _import_jsonl(importer, path, progress):
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print(f"[Import] {path}:{line_no}: {e}")
+                continue
+            tags = record.get('tags') or []
+            # tags 可以是 ["a", "b"]、{"a": 0.9} 或 [{"name": "a", "confidence": 0.9, "prediction": true}]
+            if isinstance(tags, dict):
+                tags = [{'name': k, 'confidence': v} for k, v in tags.items()]
+            for tag in tags:
+                if isinstance(tag, str):
+                    importer.add(record['path'], tag)
+                else:
+                    importer.add(record['path'], tag['name'], float(tag.get('confidence', 1.0)),
+                                 int(bool(tag.get('prediction', False))))
+            if progress and line_no % BATCH_SIZE == 0:
+                progress(line_no)
+
+def _import_csv(importer, path, progress):
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        for row_no, row in enumerate(reader, 1):
+            if not row.get('file_path') or not row.get('tag'):
+                continue
+            importer.add(row['file_path'], row['tag'], float(row.get('confidence') or 1.0),
+                         int(row.get('is_prediction') or 0))
+            if progress and row_no % BATCH_SIZE == 0:
+                progress(row_no)
+
+def _import_parquet(importer, path, progress):
+    pa = _require_pyarrow()
+    parquet_file = pa.parquet.ParquetFile(path)
+    columns = [c for c in ('file_path', 'tag', 'confidence', 'is_prediction') if c in parquet_file.schema_arrow.names]
+    done = 0
+    for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=columns):
+        data = batch.to_pydict()
+        n = batch.num_rows
+        confidences = data.get('confidence') or [1.0] * n
+        predictions = data.get('is_prediction') or [0] * n
+        for file_path, tag, conf, pred in zip(data['file_path'], data['tag'], confidences, predictions):
+            if file_path and tag:
+                importer.add(file_path, tag, 1.0 if conf is None else float(conf), int(bool(pred)))
+        done += n
+        if progress:
+            progress(done)
+
+# ================= 命令行 =================
+
+def main(argv=None):
+    default_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "images.db")
+    parser = argparse.ArgumentParser(description="Export / import image tags")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("format", choices=FORMATS)
+    parser.add_argument("path", nargs="?", help="输出 / 输入文件 (txt 格式不需要)")
+    parser.add_argument("--db", default=default_db, help="数据库路径 (默认 images.db)")
+    parser.add_argument("--folder", help="只处理该目录 (含子目录) 下的图片")
+    parser.add_argument("--min-confidence", type=float, default=0.0, help="导出时忽略置信度更低的标签")
+    parser.add_argument("--mode", choices=IMPORT_MODES, default='append', help="导入模式")
+    args = parser.parse_args(argv)
+
+    if args.format != FORMAT_TXT and not args.path:
+        parser.error(f"{args.format} 需要文件路径")
+    db = ImageDB(args.db)
+    filters = None
+    if args.folder:
+        folder_id = db.get_folder_id(os.path.abspath(args.folder))
+        if folder_id is None:
+            print(f"Folder not in library: {args.folder}")
+            return 1
+        filters = {'folder_id': folder_id, 'include_subfolders': True}
+    report = lambda n: print(f"\r  {n} ...", end="", flush=True)
+    if args.action == "export":
+        count = export_tags(db, args.format, args.path, filters, args.min_confidence, report)
+        print(f"\r[Export] {count} images")
+    else:
+        result = import_tags(db, args.format, args.path, filters, args.mode, report)
+        print(f"\r[Import] {result['images']} images, {result['tags']} tags, {result['unknown']} unknown paths")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
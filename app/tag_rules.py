@@ -0,0 +1,174 @@
+"""
+基于规则的批量打标：文件名 / 所在文件夹 / 路径中的目录名 -> 标签
+
+规则每行一条 (# 开头为注释):
+    [名称 = ] 目标: 正则 [=> 标签]
+目标:
+    name    文件名 (含扩展名)
+    stem    文件名 (不含扩展名)
+    folder  所在文件夹名
+    path    路径中的每一级目录名 (任意一级匹配即可)
+标签中可用 \\1 / \\g<name> 引用分组；省略 "=> 标签" 时每个匹配 (有分组时为各个分组) 本身作为标签。
+没有写目标的行按 name 处理，因此原来的单个正则表达式仍可直接使用。
+
+    name: (.*?)_image
+    人像 = folder: ^(portrait|人像)$ => portrait
+    path: (?i)^screenshots?$ => screenshot
+
+规则只编译一次；folder / path 规则的结果按目录缓存 (同一目录下的文件只求值一次)。
+"""
+import os
+import re
+from typing import List, Tuple
+
+from instrumentation import metrics
+
+TARGET_NAME = 'name'
+TARGET_STEM = 'stem'
+TARGET_FOLDER = 'folder'
+TARGET_PATH = 'path'
+TARGETS = (TARGET_NAME, TARGET_STEM, TARGET_FOLDER, TARGET_PATH)
+DIR_TARGETS = (TARGET_FOLDER, TARGET_PATH)
+
+# 目录结果缓存的最大条目数，超过后清空重来
+DIR_CACHE_SIZE = 20000
+# 预览时每条规则展示的示例标签数
+PREVIEW_SAMPLES = 5
+
+_RULE_LINE = re.compile(r'^(?:(?P<name>\w[\w ]*?)\s+=\s+)?(?:(?P<target>' + '|'.join(TARGETS) + r'):\s*)?(?P<body>.+)$')
+
+class TagRule:
+    __slots__ = ('name', 'target', 'regex', 'tag')
+
+    def __init__(self, name: str, target: str, pattern: str, tag: str = None):
+        if target not in TARGETS:
+            raise ValueError(f"未知目标: {target}")
+        self.name = name
+        self.target = target
+        self.regex = re.compile(pattern)
+        self.tag = tag or None
+
+    def tags_for(self, text: str) -> List[str]:
+        if self.tag is None:
+            if not self.regex.groups:
+                return [m.group(0) for m in self.regex.finditer(text)]
+            return [g for m in self.regex.finditer(text) for g in m.groups() if g]
+        m = self.regex.search(text)
+        return [m.expand(self.tag)] if m else []
+
+class RuleSet:
+    def __init__(self, rules: List[TagRule]):
+        self.rules = rules
+        self._file_rules = [(i, r) for i, r in enumerate(rules) if r.target not in DIR_TARGETS]
+        self._dir_rules = [(i, r) for i, r in enumerate(rules) if r.target in DIR_TARGETS]
+        self._dir_cache = {}
+
+    @classmethod
+    def parse(cls, text: str) -> 'RuleSet':
+        """解析规则文本，正则有误时抛出 ValueError (带行号)"""
+        rules = []
+        for line_no, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            m = _RULE_LINE.match(line)
+            body = m.group('body')
+            pattern, arrow, tag = body.rpartition('=>') if '=>' in body else (body, '', '')
+            pattern = pattern.strip()
+            target = m.group('target') or TARGET_NAME
+            name = m.group('name') or f"{target}: {pattern}"
+            try:
+                rules.append(TagRule(name.strip(), target, pattern, tag.strip() if arrow else None))
+            except re.error as e:
+                raise ValueError(f"第 {line_no} 行正则有误: {e}")
+        return cls(rules)
+
+    def _dir_hits(self, dir_path: str) -> List[Tuple[int, List[str]]]:
+        hits = self._dir_cache.get(dir_path)
+        if hits is None:
+            folder = os.path.basename(dir_path)
+            segments = [s for s in dir_path.replace('\\', '/').split('/') if s]
+            hits = []
+            for i, rule in self._dir_rules:
+                if rule.target == TARGET_FOLDER:
+                    tags = rule.tags_for(folder)
+                else:
+                    tags = [t for segment in segments for t in rule.tags_for(segment)]
+                if tags:
+                    hits.append((i, tags))
+            if len(self._dir_cache) >= DIR_CACHE_SIZE:
+                self._dir_cache.clear()
+            self._dir_cache[dir_path] = hits
+        return hits
+
+    def match(self, file_path: str, file_name: str) -> List[Tuple[int, List[str]]]:
+        """[(规则序号, 标签列表)]，只包含命中的规则"""
+        hits = []
+        for i, rule in self._file_rules:
+            text = os.path.splitext(file_name)[0] if rule.target == TARGET_STEM else file_name
+            tags = rule.tags_for(text)
+            if tags:
+                hits.append((i, tags))
+        if self._dir_rules:
+            hits.extend(self._dir_hits(os.path.dirname(file_path)))
+        return hits
+
+    def entries(self, rows):
+        """rows: ImageRow (id, file_path, file_name) -> 产出 (image_id, 标签, 置信度, is_prediction)"""
+        for row in rows:
+            seen = set()
+            for _, tags in self.match(row[1], row[2]):
+                for tag in tags:
+                    tag = tag.strip()
+                    if tag and tag not in seen:
+                        seen.add(tag)
+                        yield (row[0], tag, 1.0, 0)
+
+    def preview(self, row_batches) -> dict:
+        """
+        试运行，不写库: 统计每条规则命中的图片数与示例标签。
+        返回 {'images': 总数, 'matched': 至少命中一条的图片数, 'tags': 将写入的标签数, 'rules': [(名称, 命中数, 示例)]}
+        """
+        hits_per_rule = [0] * len(self.rules)
+        samples = [[] for _ in self.rules]
+        images = matched = tag_count = 0
+        with metrics.timer('rules.preview'):
+            for rows in row_batches:
+                for row in rows:
+                    images += 1
+                    hits = self.match(row[1], row[2])
+                    if not hits:
+                        continue
+                    matched += 1
+                    tags = set()
+                    for i, rule_tags in hits:
+                        hits_per_rule[i] += 1
+                        for tag in rule_tags:
+                            tag = tag.strip()
+                            if tag:
+                                tags.add(tag)
+                                if len(samples[i]) < PREVIEW_SAMPLES and tag not in samples[i]:
+                                    samples[i].append(tag)
+                    tag_count += len(tags)
+        return {
+            'images': images,
+            'matched': matched,
+            'tags': tag_count,
+            'rules': [(rule.name, hits_per_rule[i], samples[i]) for i, rule in enumerate(self.rules)],
+        }
+
+def format_preview(result: dict) -> str:
+    lines = [f"共 {result['images']} 张，命中 {result['matched']} 张，将写入 {result['tags']} 个标签"]
+    for name, count, samples in result['rules']:
+        example = f"  例: {', '.join(samples)}" if samples else ""
+        lines.append(f"  {name}: {count} 张{example}")
+    return "\n".join(lines)
+
+def iter_rows(db, image_ids=None, filters=None, chunk_size: int = 5000):
+    """按批产出 ImageRow 列表：image_ids 与 filters 二选一 (filters 为 {} 表示整个图库)"""
+    if image_ids is not None:
+        for i in range(0, len(image_ids), chunk_size):
+            yield db.get_image_rows(image_ids[i:i + chunk_size])
+        return
+    for rows in db.iter_image_chunks(filters, chunk_size, "i.id, i.file_path, i.file_name"):
+        yield rows
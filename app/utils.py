@@ -1,5 +1,7 @@
 import os
 
+from instrumentation import metrics, LEVEL_DEBUG
+
 # 支持的图片格式 (确保包含点号，且全部小写)
 IMAGE_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.bmp', '.gif', 
@@ -15,9 +17,11 @@ def is_image_file(filename: str) -> bool:
 def scan_directory_generator(root_dir: str, recursive: bool = True):
     """
     生成器：扫描目录下的图片文件
+    逐文件日志只在调试级别输出 (见 instrumentation)，计数按目录汇总后再写入统计
     """
     root_dir = os.path.normpath(root_dir)
-    print(f"[DEBUG] Scanning Root: {root_dir} | Recursive: {recursive}")
+    debug = metrics.level >= LEVEL_DEBUG
+    metrics.debug(f"Scanning Root: {root_dir} | Recursive: {recursive}")
     
     if not os.path.exists(root_dir):
         print(f"[ERROR] Path does not exist: {root_dir}")
@@ -25,27 +29,37 @@ def scan_directory_generator(root_dir: str, recursive: bool = True):
 
     if recursive:
         for root, dirs, files in os.walk(root_dir):
-            print(f"[DEBUG] Walking: {root} | Found {len(files)} files")
+            if debug:
+                metrics.debug(f"Walking: {root} | Found {len(files)} files")
+            found = 0
             for file in files:
                 if is_image_file(file):
                     full_path = os.path.join(root, file)
                     try:
                         size = os.path.getsize(full_path)
-                        print(f"[DEBUG] YIELD: {file}")
-                        yield full_path, file, root, size
                     except OSError as e:
                         print(f"[ERROR] Cannot read size: {file} - {e}")
-                else:
-                    # print(f"[DEBUG] Skipped (ext): {file}") 
-                    pass
+                        continue
+                    if debug:
+                        metrics.debug(f"YIELD: {file}")
+                    found += 1
+                    yield full_path, file, root, size
+            metrics.count('scan.dirs')
+            metrics.count('scan.images', found)
+            metrics.count('scan.skipped', len(files) - found)
     else:
         # 仅当前目录
-        print(f"[DEBUG] Scanning single dir: {root_dir}")
+        found = skipped = 0
         for file in os.listdir(root_dir):
             full_path = os.path.join(root_dir, file)
             if os.path.isfile(full_path):
                 if is_image_file(file):
-                    print(f"[DEBUG] YIELD: {file}")
+                    if debug:
+                        metrics.debug(f"YIELD: {file}")
+                    found += 1
                     yield full_path, file, root_dir, os.path.getsize(full_path)
                 else:
-                    print(f"[DEBUG] Skipped (ext): {file}")
\ No newline at end of file
+                    skipped += 1
+        metrics.count('scan.dirs')
+        metrics.count('scan.images', found)
+        metrics.count('scan.skipped', skipped)
@@ -0,0 +1,336 @@
+"""
+监视已导入的根目录，把新增 / 修改 / 删除 / 移动同步到数据库，无需重新全量扫描。
+
+两种后端:
+- watchdog (可选依赖，pip install watchdog)：系统级文件事件 (inotify / ReadDirectoryChangesW / FSEvents)
+- 轮询：定期比较目录 mtime，只重新列出发生变化的目录
+
+事件先按路径合并，安静 DEBOUNCE_S 秒 (或积压超过 MAX_DELAY_S 秒) 后统一检查磁盘上的最终状态，
+再通过 ImageDB.apply_fs_changes 在一个事务内批量写入。
+"""
+import os
+import time
+import threading
+from PySide6.QtCore import QThread, Signal
+
+from database import ImageDB
+from utils import scan_directory_generator, is_image_file
+from instrumentation import metrics
+
+BACKEND_WATCHDOG = 'watchdog'
+BACKEND_POLLING = 'polling'
+
+# 最后一个事件之后等待多久再写库 (秒)
+DEBOUNCE_S = 1.0
+# 事件持续不断时，最多积压多久强制写一次 (秒)
+MAX_DELAY_S = 5.0
+# 轮询后端的扫描间隔 (秒)
+POLL_INTERVAL_S = 10.0
+# 写库失败后多久重试 (秒)
+RETRY_DELAY_S = 15.0
+
+def watchdog_available() -> bool:
+    try:
+        import watchdog.observers  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def effective_roots(roots):
+    """去掉已被其他递归根目录覆盖的根，避免重复监视"""
+    result = []
+    for path, recursive in sorted((os.path.normpath(p), r) for p, r in roots):
+        covered = any(r and (path == p or path.startswith(p.rstrip(os.sep) + os.sep)) for p, r in result)
+        if not covered and os.path.isdir(path):
+            result.append((path, recursive))
+    return result
+
+class _WatchdogHandler:
+    """watchdog 的事件处理器 (Observer 只调用 dispatch，不需要继承 FileSystemEventHandler)"""
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        kind = event.event_type
+        if kind in ('opened', 'closed_no_write'):
+            return
+        src = os.fsdecode(event.src_path)
+        if kind == 'moved':
+            self.watcher.record_move(src, os.fsdecode(event.dest_path), event.is_directory)
+        elif event.is_directory:
+            # 目录的 modified 事件只表示内容变化，具体文件会有各自的事件
+            if kind in ('created', 'deleted'):
+                self.watcher.record_dir(src)
+        else:
+            self.watcher.record_file(src)
+
+class LibraryWatcher(QThread):
+    # (新增, 删除, 移动, 打标任务 id 或 0)
+    changes_applied = Signal(int, int, int, int)
+    status_signal = Signal(str)
+
+    def __init__(self, db_path, backend=None, auto_tag=False):
+        """
+        backend: BACKEND_WATCHDOG / BACKEND_POLLING，None 表示有 watchdog 时优先使用
+        auto_tag: 新入库的图片放入打标队列 (由界面启动 TaggerWorker 消费)
+        """
+        super().__init__()
+        self.db_path = db_path
+        self.backend = backend or (BACKEND_WATCHDOG if watchdog_available() else BACKEND_POLLING)
+        self.auto_tag = auto_tag
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._is_running = True
+        self._files = set()
+        self._dirs = set()
+        self._moves = []
+        self._first_event = None
+        self._last_event = None
+        self._retry_at = 0.0
+        self._roots = []
+        self._new_roots = []
+        self._observer = None
+        self._dir_mtimes = {}
+
+    # ---------- 事件入口 (任意线程) ----------
+
+    def _mark(self):
+        now = time.monotonic()
+        if self._first_event is None:
+            self._first_event = now
+        self._last_event = now
+        self._wake.set()
+
+    def record_file(self, path: str):
+        if not is_image_file(path):
+            return
+        with self._lock:
+            self._files.add(path)
+            self._mark()
+
+    def record_dir(self, path: str):
+        with self._lock:
+            self._dirs.add(path)
+            self._mark()
+
+    def record_move(self, src: str, dst: str, is_dir: bool):
+        if not is_dir and not (is_image_file(src) or is_image_file(dst)):
+            return
+        with self._lock:
+            self._moves.append((src, dst, is_dir))
+            self._mark()
+
+    def add_root(self, path: str, recursive: bool = True):
+        """运行中追加监视目录 (例如刚导入的文件夹)"""
+        with self._lock:
+            self._new_roots.append((path, recursive))
+        self._wake.set()
+
+    # ---------- 线程主循环 ----------
+
+    def run(self):
+        db = ImageDB(self.db_path)
+        self._roots = effective_roots(db.get_watch_roots())
+        self._start_backend(self._roots)
+        self.status_signal.emit(f"正在监视 {len(self._roots)} 个目录 ({self.backend})")
+        next_poll = time.monotonic() + POLL_INTERVAL_S
+
+        try:
+            while self._is_running:
+                self._wake.wait(0.5)
+                self._wake.clear()
+                if not self._is_running:
+                    break
+
+                with self._lock:
+                    new_roots, self._new_roots = self._new_roots, []
+                if new_roots:
+                    self._add_roots(new_roots)
+
+                if self.backend == BACKEND_POLLING and time.monotonic() >= next_poll:
+                    self._poll()
+                    next_poll = time.monotonic() + POLL_INTERVAL_S
+
+                if self._due():
+                    self._flush(db)
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+    def _due(self) -> bool:
+        with self._lock:
+            if self._last_event is None:
+                return False
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            return now - self._last_event >= DEBOUNCE_S or now - self._first_event >= MAX_DELAY_S
+
+    def _start_backend(self, roots):
+        if self.backend == BACKEND_WATCHDOG:
+            try:
+                from watchdog.observers import Observer
+                self._observer = Observer()
+                handler = _WatchdogHandler(self)
+                for path, recursive in roots:
+                    self._observer.schedule(handler, path, recursive=recursive)
+                self._observer.start()
+                return
+            except Exception as e:
+                # 例如 inotify 监视数量达到上限
+                print(f"[Watcher] watchdog unavailable, falling back to polling: {e}")
+                self._observer = None
+                self.backend = BACKEND_POLLING
+        for path, recursive in roots:
+            self._dir_mtimes.update(self._snapshot(path, recursive))
+
+    def _add_roots(self, new_roots):
+        roots = effective_roots(self._roots + new_roots)
+        added = [r for r in roots if r not in self._roots]
+        self._roots = roots
+        if self._observer is not None:
+            handler = _WatchdogHandler(self)
+            for path, recursive in added:
+                self._observer.schedule(handler, path, recursive=recursive)
+        else:
+            for path, recursive in added:
+                self._dir_mtimes.update(self._snapshot(path, recursive))
+
+    # ---------- 轮询后端 ----------
+
+    def _snapshot(self, root: str, recursive: bool) -> dict:
+        """{目录: mtime_ns}；只 stat 目录，不 stat 文件"""
+        result = {}
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                result[path] = os.stat(path).st_mtime_ns
+                if recursive:
+                    with os.scandir(path) as it:
+                        stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+        return result
+
+    def _poll(self):
+        with metrics.timer('watch.poll'):
+            old = self._dir_mtimes
+            current = {}
+            for path, recursive in self._roots:
+                if not os.path.isdir(path):
+                    # 根目录不可访问 (移动硬盘拔出、网络盘断开)：保留旧快照，
+                    # 不把整棵树当作删除；文件是否真的丢失交给完整性检查判断
+                    prefix = path.rstrip(os.sep) + os.sep
+                    current.update((d, m) for d, m in old.items() if d == path or d.startswith(prefix))
+                    continue
+                current.update(self._snapshot(path, recursive))
+            self._dir_mtimes = current
+        changed = [d for d, mtime in current.items() if old.get(d) != mtime]
+        removed = [d for d in old if d not in current]
+        if not changed and not removed:
+            return
+        with self._lock:
+            # 变化的目录：重新列出后与数据库比较 (在 _flush 中)
+            # 轮询无法识别移动：改名的目录表现为删除 + 新增，原有标签不会保留
+            self._dirs.update(changed)
+            self._dirs.update(removed)
+            self._mark()
+
+    # ---------- 合并并写库 ----------
+
+    def _flush(self, db: ImageDB):
+        with self._lock:
+            files, self._files = self._files, set()
+            dirs, self._dirs = self._dirs, set()
+            moves, self._moves = self._moves, []
+            self._first_event = self._last_event = None
+
+        try:
+            with metrics.timer('watch.flush'):
+                result = self._apply(db, set(files), set(dirs), list(moves))
+        except Exception as e:
+            # 写库失败 (例如数据库被其他进程长时间锁住)：变化放回待处理集合，RETRY_DELAY_S 秒后重试
+            print(f"[Watcher Error] {e}")
+            metrics.count('watch.flush_failed')
+            self.status_signal.emit(f"目录变化写入失败，稍后重试: {e}")
+            with self._lock:
+                self._files |= files
+                self._dirs |= dirs
+                self._moves[:0] = moves
+                self._mark()
+                self._retry_at = time.monotonic() + RETRY_DELAY_S
+            return
+        if result is None:
+            return
+        counts, job_id = result
+
+        metrics.count('watch.added', counts['added'])
+        metrics.count('watch.deleted', counts['deleted'])
+        metrics.count('watch.moved', counts['moved'])
+        if counts['added'] or counts['deleted'] or counts['moved'] or counts['updated']:
+            self.status_signal.emit(f"目录变化: 新增 {counts['added']}，删除 {counts['deleted']}，移动 {counts['moved']}")
+            self.changes_applied.emit(counts['added'], counts['deleted'], counts['moved'], job_id or 0)
+
+    def _apply(self, db: ImageDB, files: set, dirs: set, moves: list):
+        """按磁盘上的最终状态整理事件并写库，返回 (counts, 打标任务 id 或 None)；没有需要写入的变化时返回 None"""
+        moved, moved_dirs = [], []
+        for src, dst, is_dir in moves:
+            # 以磁盘上的最终状态为准：源已不存在且目标存在才视为移动，否则按两端各自的变化处理
+            if not os.path.lexists(src) and os.path.exists(dst):
+                if is_dir:
+                    moved_dirs.append((src, dst))
+                elif is_image_file(dst):
+                    moved.append((src, dst))
+                else:
+                    files.add(src)
+                continue
+            (dirs if is_dir else files).update((src, dst))
+
+        upserts, deleted, deleted_dirs = [], [], []
+        for path in files:
+            if not is_image_file(path):
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                deleted.append(path)
+                continue
+            except OSError:
+                continue
+            upserts.append((path, os.path.basename(path), os.path.dirname(path), st.st_size))
+
+        for dir_path in dirs:
+            if not os.path.isdir(dir_path):
+                deleted_dirs.append(dir_path)
+                continue
+            # 新建 / 移入的目录 (watchdog，需要递归：其中的文件不一定有单独的事件)
+            # 或轮询发现 mtime 变化的目录 (只列本层，变化的子目录各自也在列表中)：
+            # 列出当前文件并与库中记录比较
+            known = db.get_dir_file_paths(dir_path)
+            recursive = self.backend == BACKEND_WATCHDOG
+            for full_path, file_name, parent, size in scan_directory_generator(dir_path, recursive):
+                known.discard(full_path)
+                upserts.append((full_path, file_name, parent, size))
+            deleted.extend(p for p in known if not os.path.exists(p))
+
+        if not (upserts or deleted or deleted_dirs or moved or moved_dirs):
+            return None
+
+        job_id = db.create_import_job() if self.auto_tag and upserts else None
+        try:
+            counts = db.apply_fs_changes(upserts, deleted, deleted_dirs, moved, moved_dirs, tag_job_id=job_id)
+        except Exception:
+            if job_id is not None:
+                db.cancel_import_job(job_id)
+            raise
+        if job_id is not None:
+            db.finish_import_job(job_id, counts['added'])
+            if not counts['added']:
+                job_id = None
+        return counts, job_id
+
+    def stop(self):
+        self._is_running = False
+        self._wake.set()
@@ -1,35 +1,55 @@
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from collections import OrderedDict
 from PySide6.QtCore import QThread, Signal
-from PySide6.QtGui import QImage, QPixmap
-from PIL import Image, ImageOps
+from PySide6.QtGui import QImage
 
 from database import ImageDB
 from utils import scan_directory_generator, is_image_file
+from instrumentation import metrics, profile_job
+from tag_rules import RuleSet, iter_rows as iter_rule_rows
 
 # ==========================================
 # 1. 导入图片工作线程 (高效版)
 # ==========================================
+# 每批交给写入线程的文件数
+IMPORT_BATCH = 50
+
 class ImportWorker(QThread):
+    """
+    流式导入：边扫描边写库，不在内存中累积 id 列表。
+    传入 tag_job_id 时，新图片在同一事务内写入 tag_queue，
+    打标线程可以同时从队列中分批消费 (导入与打标流水线并行)。
+    """
     progress_signal = Signal(int, int)
     status_signal = Signal(str)
-    finished_signal = Signal(list)
+    # (导入数量, tag_job_id 或 0)
+    finished_signal = Signal(int, int)
     
-    def __init__(self, db_path, target_paths, recursive=True):
+    def __init__(self, db_path, target_paths, recursive=True, tag_job_id=None):
         super().__init__()
         self.db_path = db_path
         self.target_paths = target_paths
         self.recursive = recursive
+        self.tag_job_id = tag_job_id
         self._is_running = True
 
     def run(self):
+        with profile_job('import'):
+            self._run()
+
+    def _run(self):
         db = ImageDB(self.db_path)
         count = 0
-        added_ids = []
         self.status_signal.emit("正在准备扫描...")
         
-        conn = db.get_connection_for_batch()
-        cursor = conn.cursor()
+        self._folder_cache = {}
+        self._db = db
+        self._pending = None
+        batch = []
         
         try:
             for path in self.target_paths:
@@ -37,97 +57,368 @@ class ImportWorker(QThread):
                 
                 if os.path.isfile(path):
                     if is_image_file(path):
-                        self._insert_one(cursor, path, added_ids)
+                        batch.append((path, os.path.basename(path), os.path.dirname(path), os.path.getsize(path)))
                         count += 1
                         
                 elif os.path.isdir(path):
+                    # 记录为导入根目录，供 LibraryWatcher 监视
+                    db.add_watch_root(path, self.recursive)
                     self.status_signal.emit(f"扫描目录: {path}")
-                    for full_path, file_name, dir_path, size in scan_directory_generator(path, self.recursive):
+                    for entry in scan_directory_generator(path, self.recursive):
                         if not self._is_running: break
                         
-                        self._insert_one(cursor, full_path, added_ids, file_name, dir_path, size)
+                        batch.append(entry)
                         count += 1
                         
-                        if count % 50 == 0:
-                            conn.commit()
+                        if len(batch) >= IMPORT_BATCH:
+                            self._flush(batch)
+                            batch = []
                             self.progress_signal.emit(count, 0)
                             self.status_signal.emit(f"已导入: {count} 张")
             
-            conn.commit()
+            self._flush(batch)
             
         except Exception as e:
             print(f"[Worker Error] {e}")
-            conn.rollback()
         finally:
-            conn.close()
+            self._wait_pending()
+            if self.tag_job_id is not None:
+                # 标记导入结束，打标线程清空队列后即可退出
+                db.finish_import_job(self.tag_job_id, count)
+        # 大批量导入后更新查询规划统计 (数量不够时直接跳过)
+        db.optimize(count)
 
-        self.finished_signal.emit(added_ids)
+        self.finished_signal.emit(count, self.tag_job_id or 0)
 
-    def _insert_one(self, cursor, full_path, added_ids, file_name=None, dir_path=None, size=None):
-        if file_name is None:
-            file_name = os.path.basename(full_path)
-        if dir_path is None:
-            dir_path = os.path.dirname(full_path)
-        if size is None:
-            size = os.path.getsize(full_path)
-            
+    def _flush(self, batch):
+        """
+        等上一批提交完成，再把这一批交给写入线程：扫描下一批与写入这一批重叠，
+        同时只有一批在排队，写入跟不上时扫描在这里等待
+        """
+        self._wait_pending()
+        if batch:
+            self._pending = self._db.submit_write(self._insert_batch, batch)
+
+    def _wait_pending(self):
+        if self._pending is None:
+            return
         try:
-            cursor.execute("INSERT OR IGNORE INTO images (file_path, file_name, dir_path, file_size) VALUES (?, ?, ?, ?)", 
-                           (full_path, file_name, dir_path, size))
-            
-            cursor.execute("SELECT id FROM images WHERE file_path = ?", (full_path,))
-            row = cursor.fetchone()
-            if row:
-                img_id = row['id']
-                added_ids.append(img_id)
+            with metrics.timer('db.commit'):
+                self._pending.result()
         except Exception as e:
-            print(f"[Insert Error] {e}")
+            print(f"[Worker Error] {e}")
+            # 整批回滚后缓存里可能有未提交的目录 id
+            self._folder_cache.clear()
+        self._pending = None
+
+    def _insert_batch(self, cursor, batch):
+        """在写入线程中执行：[(full_path, file_name, dir_path, size)]"""
+        for full_path, file_name, dir_path, size in batch:
+            try:
+                with metrics.timer('import.insert'):
+                    folder_id = self._db.ensure_folder(cursor, dir_path, self._folder_cache)
+                    cursor.execute("INSERT OR IGNORE INTO images (file_path, file_name, dir_path, file_size, folder_id) VALUES (?, ?, ?, ?, ?)", 
+                                   (full_path, file_name, dir_path, size, folder_id))
+                    if self.tag_job_id is not None:
+                        self._db.enqueue_for_tagging(cursor, self.tag_job_id, full_path)
+            except Exception as e:
+                print(f"[Insert Error] {e}")
+                metrics.count('import.errors')
 
     def stop(self):
         self._is_running = False
 
 # ==========================================
-# 2. 缩略图生成 + 自动清理线程 (保持不变)
+# 2. 缩略图生成 + 自动清理线程
 # ==========================================
+# 缩略图像素的进程内缓存上限 (字节)；200x200 RGB 约 120 KB 一张，可容纳十页左右
+THUMB_CACHE_BYTES = 64 * 1024 * 1024
+
+class ThumbnailCache:
+    """
+    已生成缩略图的 LRU 缓存 (线程安全)，按字节数淘汰。
+    缓存的是生成时已有的 RGB 字节 (width, height, buffer)，写入不需要额外编码；
+    再次翻到同一页时直接用这块缓冲区构造 QImage，不必重新打开原图，也不需要解码。
+    """
+    def __init__(self, max_bytes=THUMB_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(width, height, buffer) 或 None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, width: int, height: int, buffer: bytes):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old[2])
+            self._items[key] = (width, height, buffer)
+            self.current_bytes += len(buffer)
+            while self.current_bytes > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self.current_bytes -= len(old[2])
+
+thumbnail_cache = ThumbnailCache()
+
+def rgb_qimage(buffer: bytes, width: int, height: int) -> QImage:
+    """直接引用 buffer 的 QImage (不复制)，调用方需保证 buffer 存活到 QImage 不再使用"""
+    # 显式传入每行字节数：RGB888 行宽不是 4 的倍数时，默认的 32 位对齐会读错内存
+    return QImage(buffer, width, height, width * 3, QImage.Format_RGB888)
+
 class ThumbnailWorker(QThread):
-    thumbnail_ready = Signal(int, object) 
+    # (img_id, QImage, 底层缓冲区)
+    # 只传 QImage：QPixmap 只能在 GUI 线程创建。
+    # QImage 直接引用 tobytes 得到的字节缓冲区 (不再复制)，缓冲区随信号一起传递以保证其存活，
+    # GUI 线程转换为 QPixmap 后即可释放。
+    thumbnail_ready = Signal(int, object, object)
     finished_signal = Signal()
     file_missing_signal = Signal(str) 
 
-    def __init__(self, db_path, image_data_list, size=(256, 256)):
+    def __init__(self, db_path, image_data_list, size=(256, 256), use_cache=True):
         super().__init__()
         self.db_path = db_path 
         self.image_data_list = image_data_list
         self.size = size
+        self.use_cache = use_cache
         self._is_running = True
 
     def run(self):
-        db = ImageDB(self.db_path)
+        # 找不到的文件只在结束时批量标记为丢失 (不删除记录)，由 IntegrityCheckWorker 统一处理
+        missing_ids = []
         for img_data in self.image_data_list:
             if not self._is_running: break
             
-            file_path = img_data['file_path']
-            img_id = img_data['id']
+            file_path = img_data.file_path
+            img_id = img_data.id
             
-            if not os.path.exists(file_path):
-                db.delete_image_by_id(img_id)
+            try:
+                mtime = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                metrics.count('thumb.missing')
+                missing_ids.append(img_id)
                 self.file_missing_signal.emit(file_path)
                 continue
+            except OSError:
+                continue
+
+            cache_key = (file_path, mtime, self.size)
+            if self.use_cache:
+                cached = thumbnail_cache.get(cache_key)
+                if cached is not None:
+                    width, height, buffer = cached
+                    metrics.count('thumb.cache_hits')
+                    self.thumbnail_ready.emit(img_id, rgb_qimage(buffer, width, height), buffer)
+                    continue
 
             try:
-                with Image.open(file_path) as img:
-                    img = ImageOps.exif_transpose(img)
-                    if img.mode != "RGB":
-                        img = img.convert("RGB")
-                    img.thumbnail(self.size, Image.Resampling.LANCZOS)
-                    data = img.tobytes("raw", "RGB")
-                    qim = QImage(data, img.width, img.height, QImage.Format_RGB888)
-                    pixmap = QPixmap.fromImage(qim)
-                    self.thumbnail_ready.emit(img_id, pixmap)
+                with metrics.timer('thumb.render'):
+                    qim, buffer = self.render_thumbnail(file_path, cache_key)
+                self.thumbnail_ready.emit(img_id, qim, buffer)
             except Exception as e:
-                pass
+                metrics.count('thumb.errors')
+        if missing_ids:
+            ImageDB(self.db_path).mark_missing(missing_ids)
         self.finished_signal.emit()
 
+    def render_thumbnail(self, file_path, cache_key):
+        # PIL 只在生成缩略图时才需要，不放在模块顶部，缩短启动时间
+        from PIL import Image, ImageOps
+        with Image.open(file_path) as img:
+            # JPEG 可在解码时按 1/2、1/4、1/8 缩小，大图可以省掉大部分解码开销
+            img.draft("RGB", self.size)
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail(self.size, Image.Resampling.LANCZOS)
+
+            # 唯一的一次复制：PIL 内部按每像素 4 字节分行存放 RGB，不对外提供可共享的缓冲区，
+            # tobytes 把它打包成连续的 RGB888；之后 QImage 与缓存都直接引用这块缓冲区
+            buffer = img.tobytes("raw", "RGB")
+            if self.use_cache:
+                thumbnail_cache.put(cache_key, img.width, img.height, buffer)
+            return rgb_qimage(buffer, img.width, img.height), buffer
+
+    def stop(self):
+        self._is_running = False
+
+class SidebarLoadWorker(QThread):
+    """启动时在后台读取侧栏数据 (标签统计、目录树)，窗口先显示，数据到达后再填充"""
+    loaded_signal = Signal(object, object)  # (tag_stats, folder_tree)
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+
+    def run(self):
+        db = ImageDB(self.db_path)
+        with metrics.timer('startup.sidebar_query'):
+            tag_stats = db.get_tag_stats()
+            folder_tree = db.get_folder_tree()
+        self.loaded_signal.emit(tag_stats, folder_tree)
+
+# ==========================================
+# 2.5 文件完整性检查 / 重定位
+# ==========================================
+# 并行 stat 的线程数 (网络盘 / 机械盘上延迟远大于 CPU 开销)
+STAT_THREADS = 16
+# 判断 "同一批文件换了位置" 时抽样的文件数与需要匹配 (同名同大小) 的比例
+RELOCATE_SAMPLES = 20
+RELOCATE_MIN_MATCH = 0.9
+
+def file_exists(path):
+    """True / False；设备未就绪、无权限等无法判断的情况返回 None (不改变标记)"""
+    try:
+        os.stat(path)
+        return True
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+    except OSError:
+        return None
+
+def file_size_or_none(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+def default_search_roots():
+    """自动查找重定位目标时搜索的根：Windows 各盘符，其他系统的常见挂载点"""
+    if os.name == 'nt':
+        import string
+        return [f"{c}:\\" for c in string.ascii_uppercase if os.path.exists(f"{c}:\\")]
+    roots = []
+    for base in ('/media', '/mnt', '/Volumes'):
+        try:
+            with os.scandir(base) as it:
+                roots.extend(e.path for e in it if e.is_dir())
+        except OSError:
+            continue
+    return roots
+
+def split_path(path):
+    """'D:\\a\\b' -> ('D:\\', ['a', 'b'])"""
+    drive, rest = os.path.splitdrive(path)
+    anchor = drive + (os.sep if rest.startswith(os.sep) else '')
+    return anchor, [p for p in rest.split(os.sep) if p]
+
+def find_relocation(dir_path, samples, search_roots):
+    """
+    在 search_roots 下寻找丢失目录的新位置：依次尝试 根 + 目录路径的各级后缀 (最长的优先)，
+    抽样文件同名同大小的比例达到 RELOCATE_MIN_MATCH 即认为找到。
+    返回 (旧前缀, 新前缀)，例如 ('D:\\', 'E:\\') 或 ('/mnt/old', '/mnt/new')；找不到返回 None
+    """
+    if not samples:
+        return None
+    anchor, parts = split_path(dir_path)
+    need = max(1, int(len(samples) * RELOCATE_MIN_MATCH + 0.999))
+    for root in search_roots:
+        for k in range(len(parts)):
+            tail = parts[k:]
+            candidate = os.path.join(root, *tail)
+            if os.path.normcase(candidate) == os.path.normcase(dir_path) or not os.path.isdir(candidate):
+                continue
+            matched = sum(1 for name, size in samples
+                          if file_size_or_none(os.path.join(candidate, name)) == size)
+            if matched >= need:
+                old_prefix = os.path.join(anchor, *parts[:k]) if k else anchor
+                return old_prefix, os.path.normpath(root)
+    return None
+
+def rebase_path(path, old_prefix, new_prefix):
+    rel = path[len(old_prefix):].lstrip(os.sep)
+    return os.path.join(new_prefix, rel) if rel else new_prefix
+
+class IntegrityCheckWorker(QThread):
+    """
+    后台完整性检查：分批取出记录，线程池并行 stat，批量设置 / 清除丢失标记 (不删除记录)；
+    之后对仍丢失的目录尝试在其他位置找到同一批文件 (盘符变化、整个目录被移动)，批量改写路径，标签保留。
+    """
+    progress_signal = Signal(int, int)
+    status_signal = Signal(str)
+    # (仍丢失, 恢复, 重定位)
+    finished_signal = Signal(int, int, int)
+
+    CHUNK_SIZE = 2000
+
+    def __init__(self, db_path, folder_id=None, search_roots=None, relocate=True):
+        """
+        folder_id: 只检查该目录子树，None 表示整个图库
+        search_roots: 额外的重定位搜索根 (例如用户指定的新位置)，优先于自动搜索
+        """
+        super().__init__()
+        self.db_path = db_path
+        self.folder_id = folder_id
+        self.search_roots = list(search_roots or [])
+        self.relocate = relocate
+        self._is_running = True
+
+    def run(self):
+        with profile_job('integrity'):
+            self._run()
+
+    def _run(self):
+        db = ImageDB(self.db_path)
+        filters = {'folder_id': self.folder_id, 'include_subfolders': True} if self.folder_id else None
+        total = max(1, db.count_images(filters))
+        checked = restored = 0
+
+        with ThreadPoolExecutor(max_workers=STAT_THREADS) as pool:
+            for rows in db.iter_image_chunks(filters, self.CHUNK_SIZE):
+                if not self._is_running:
+                    break
+                with metrics.timer('integrity.stat_chunk'):
+                    states = list(pool.map(file_exists, [row['file_path'] for row in rows]))
+                newly_missing = [row['id'] for row, ok in zip(rows, states) if ok is False and row['missing_since'] is None]
+                back = [row['id'] for row, ok in zip(rows, states) if ok and row['missing_since'] is not None]
+                db.mark_missing(newly_missing)
+                db.mark_missing(back, missing=False)
+                restored += len(back)
+                checked += len(rows)
+                self.progress_signal.emit(checked, total)
+                self.status_signal.emit(f"检查文件: {checked}/{total}")
+
+            relocated = self._relocate(db, pool) if self.relocate and self._is_running else 0
+
+        missing = db.count_missing(self.folder_id)
+        metrics.count('integrity.restored', restored)
+        metrics.count('integrity.relocated', relocated)
+        self.finished_signal.emit(missing, restored, relocated)
+
+    def _relocate(self, db, pool):
+        search_roots = self.search_roots + [r for r in default_search_roots() if r not in self.search_roots]
+        relocated = 0
+        tried = set()
+        while self._is_running:
+            # 每次重定位一个前缀后重新统计：一个前缀通常能同时修复很多目录
+            pending = [(d, n) for d, n in db.get_missing_dirs() if d not in tried]
+            if not pending:
+                break
+            dir_path, _ = pending[0]
+            tried.add(dir_path)
+            self.status_signal.emit(f"查找新位置: {dir_path}")
+            found = find_relocation(dir_path, db.get_missing_samples(dir_path, RELOCATE_SAMPLES), search_roots)
+            if found is None:
+                continue
+            old_prefix, new_prefix = found
+            rows = db.get_missing_under(old_prefix)
+            new_paths = [rebase_path(path, old_prefix, new_prefix) for _, path in rows]
+            # 只改写新位置确实存在的文件
+            states = pool.map(file_exists, new_paths)
+            updates = [(img_id, new_path) for (img_id, _), new_path, ok in zip(rows, new_paths, states) if ok]
+            moved = db.relocate_images(updates)
+            if moved:
+                db.relocate_watch_roots(old_prefix, new_prefix)
+                print(f"[Integrity] Relocated {moved} files: {old_prefix} -> {new_prefix}")
+                relocated += moved
+        return relocated
+
     def stop(self):
         self._is_running = False
 
@@ -138,108 +429,174 @@ class TaggerWorker(QThread):
     progress_signal = Signal(int, int)
     status_signal = Signal(str)
     finished_signal = Signal()
+
+    CHUNK_SIZE = 500
+    # 规则打标不做推理，每批可以大得多
+    RULE_CHUNK_SIZE = 5000
+    # AI 打标每处理这么多张图片写入一次标签
+    TAG_WRITE_BATCH = 32
+    # 队列暂时为空但导入仍在进行时的轮询间隔 (秒)
+    QUEUE_POLL_INTERVAL = 0.5
     
-    def __init__(self, db_path, image_ids, mode='ai', ai_engine=None, regex_pattern=None, tag_action='append'):
+    def __init__(self, db_path, image_ids=None, mode='ai', ai_engine=None, regex_pattern=None, tag_action='append',
+                 queue_job_id=None, filters=None):
         """
         tag_action: 'overwrite', 'append', 'unique', 'skip'
+        regex_pattern: mode='regex' 时的规则文本 (见 tag_rules，单个正则表达式也是合法规则)
+        要处理的图片三选一:
+        image_ids: 要打标的 id 列表
+        queue_job_id: 从导入任务的 tag_queue 中分批消费
+        filters: 筛选条件 (同 ImageDB.get_images_paginated，{} 表示整个图库)，在数据库中按批取 id；
+                 另支持 'older_model': True，只处理由其他模型打过标的图片 (相对本次使用的模型)
         """
         super().__init__()
         self.db_path = db_path
-        self.image_ids = image_ids
+        # 紧凑存储：每个 id 8 字节 (list 中每个 int 对象约 36 字节)
+        self.image_ids = array('q', image_ids or ())
+        self.queue_job_id = queue_job_id
+        self.filters = filters
+        self._query_filters = None
+        self._filter_total = 0
         self.mode = mode
         self.ai_engine = ai_engine
         self.regex_pattern = regex_pattern
         self.tag_action = tag_action
         self._is_running = True
 
+    def _iter_id_chunks(self, db, chunk_size=None):
+        """按批产出待处理的 id；队列模式下导入未结束时会等待新数据"""
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        if self._query_filters is not None:
+            yield from db.iter_image_id_chunks(self._query_filters, chunk_size)
+            return
+
+        if self.queue_job_id is None:
+            for i in range(0, len(self.image_ids), chunk_size):
+                yield self.image_ids[i : i + chunk_size]
+            return
+
+        while self._is_running:
+            chunk_ids = db.fetch_tag_queue(self.queue_job_id, chunk_size)
+            if chunk_ids:
+                # 处理完整批后由 run() 出队；中途停止的批次留在队列里，下次可继续
+                yield chunk_ids
+            elif db.get_import_job_status(self.queue_job_id) == 'running':
+                self.status_signal.emit("等待导入新图片...")
+                time.sleep(self.QUEUE_POLL_INTERVAL)
+            else:
+                break
+
+    def _resolve_filters(self, model_id):
+        """把 GUI 传来的筛选条件转换为数据库查询条件 ('older_model' 需要本次的 model_id)"""
+        filters = dict(self.filters)
+        if filters.pop('older_model', False) and model_id is not None:
+            filters['tagged_by_other_model'] = model_id
+        return filters
+
+    def _total_estimate(self, db, processed_count):
+        if self._query_filters is not None:
+            return self._filter_total
+        if self.queue_job_id is None:
+            return len(self.image_ids)
+        return processed_count + db.count_tag_queue(self.queue_job_id)
+
     def run(self):
+        with profile_job(f'tagging-{self.mode}'):
+            self._run()
+
+    def _run(self):
         db = ImageDB(self.db_path)
-        total = len(self.image_ids)
         
-        if not self.image_ids:
+        if not self.image_ids and self.queue_job_id is None and self.filters is None:
             self.finished_signal.emit()
             return
 
-        # 1. 覆盖模式：先清空
-        if self.tag_action == 'overwrite':
-            self.status_signal.emit("正在清理旧标签...")
-            for idx, img_id in enumerate(self.image_ids):
-                if not self._is_running: break
-                db.clear_tags_for_image(img_id)
-                if idx % 100 == 0:
-                     self.status_signal.emit(f"正在清理旧标签... {idx}/{total}")
+        # 登记模型，写入的每条预测标签都记录 model_id
+        model_id = None
+        if self.mode == 'ai' and self.ai_engine and getattr(self.ai_engine, 'file_hash', None):
+            model_id = db.register_model(self.ai_engine.model_name, self.ai_engine.file_hash,
+                                         self.ai_engine.model_path)
+
+        if self.filters is not None:
+            self._query_filters = self._resolve_filters(model_id)
+            self.status_signal.emit("正在统计待打标图片...")
+            self._filter_total = db.count_images(self._query_filters)
+
+        if self.mode == 'regex':
+            self._run_rules(db)
+            self.finished_signal.emit()
+            return
 
         conn = db.get_connection()
         cursor = conn.cursor()
         
-        CHUNK_SIZE = 500 
         processed_count = 0
+        reported_count = 0
         
         try:
-            for i in range(0, total, CHUNK_SIZE):
+            for chunk_ids in self._iter_id_chunks(db):
                 if not self._is_running: break
-                
-                chunk_ids = self.image_ids[i : i + CHUNK_SIZE]
-                
+                total = max(1, self._total_estimate(db, processed_count))
+
                 placeholders = ','.join(['?'] * len(chunk_ids))
+                # 'skip' 模式下，对于没跳过的图片，行为等同于 append
+                db_mode = 'unique' if self.tag_action == 'unique' else 'append'
+                # 预测结果每 TAG_WRITE_BATCH 张图片交给写入线程一次；覆盖模式在同一个事务里先清空这些图片的旧标签
+                entries = []
+                pending_ids = []
+                
                 query = f"SELECT id, file_path, file_name FROM images WHERE id IN ({placeholders})"
                 
                 cursor.execute(query, chunk_ids)
                 rows = cursor.fetchall()
-                
-                for row in rows:
+
+                # Skip 模式：整批一次查出已有标签的图片并跳过
+                if self.tag_action == 'skip':
+                    tagged = db.get_tagged_image_ids(chunk_ids)
+                    if tagged:
+                        metrics.count('tagging.skipped', len(tagged))
+                        processed_count += len(tagged)
+                        rows = [row for row in rows if row['id'] not in tagged]
+                        self.progress_signal.emit(processed_count, total)
+                        self.status_signal.emit(f"跳过已有标签: {processed_count}/{total}")
+
+                # 每次凑满模型的 batch_size 张图片一起推理 (固定 batch 维的模型本来就要喂满整个缓冲区)
+                step = max(1, self.ai_engine.batch_size) if self.ai_engine else len(rows) or 1
+                for start in range(0, len(rows), step):
                     if not self._is_running: break
-                    
-                    img_id = row['id']
-                    file_path = row['file_path']
-                    file_name = row['file_name']
-                    
-                    # [NEW] Skip 模式逻辑检查
-                    if self.tag_action == 'skip':
-                        # 检查是否有任何 Tag
-                        cursor.execute("SELECT 1 FROM image_tags WHERE image_id = ? LIMIT 1", (img_id,))
-                        if cursor.fetchone():
-                            # 如果有结果，说明有 Tag，直接跳过
-                            processed_count += 1
-                            if processed_count % 5 == 0:
-                                self.progress_signal.emit(processed_count, total)
-                                self.status_signal.emit(f"跳过已有标签: {processed_count}/{total}")
-                            continue
-
-                    tags_to_add = []
-                    
+                    group = rows[start:start + step]
+
+                    results = [[] for _ in group]
                     if self.mode == 'ai' and self.ai_engine:
                         try:
-                            tags = self.ai_engine.predict(file_path)
-                            tags_to_add = tags 
+                            with metrics.timer('tagging.predict'):
+                                results = self.ai_engine.predict_batch([row['file_path'] for row in group])
                         except Exception as e:
                             print(f"[ERROR] AI: {e}")
 
-                    elif self.mode == 'regex' and self.regex_pattern:
-                        import re
-                        try:
-                            matches = re.findall(self.regex_pattern, file_name)
-                            matches = list(set(matches))
-                            tags_to_add = [(m, 1.0) for m in matches if m]
-                        except Exception as e:
-                            print(f"[ERROR] Regex: {e}")
+                    is_prediction = 1 if self.mode == 'ai' else 0
+                    for row, tags_to_add in zip(group, results):
+                        img_id = row['id']
+                        if tags_to_add:
+                            entries.extend((img_id, tag_name, conf, is_prediction) for tag_name, conf in tags_to_add)
+                            metrics.count('tagging.tags_written', len(tags_to_add))
+                        pending_ids.append(img_id)
+                    if len(pending_ids) >= self.TAG_WRITE_BATCH:
+                        self._write_tags(db, entries, pending_ids, db_mode, model_id)
+                        entries, pending_ids = [], []
 
-                    if tags_to_add:
-                        # 转换模式给 DB
-                        # 'skip' 模式下，对于没跳过的图片，行为等同于 append
-                        db_mode = 'unique' if self.tag_action == 'unique' else 'append'
-                        
-                        for tag_name, conf in tags_to_add:
-                            db.add_image_tag(img_id, tag_name, conf, 
-                                             is_prediction=(1 if self.mode=='ai' else 0), 
-                                             mode=db_mode)
-                    
-                    processed_count += 1
-                    
-                    if processed_count % 5 == 0:
+                    metrics.count('tagging.images', len(group))
+                    processed_count += len(group)
+                    # 与逐张处理时一样，大约每 5 张更新一次界面
+                    if processed_count - reported_count >= 5:
+                        reported_count = processed_count
                         self.progress_signal.emit(processed_count, total)
                         self.status_signal.emit(f"正在打标: {processed_count}/{total}")
 
+                self._write_tags(db, entries, pending_ids, db_mode, model_id)
+                if self._is_running and self.queue_job_id is not None:
+                    db.ack_tag_queue(self.queue_job_id, chunk_ids)
+
         except Exception as e:
             print(f"[Tagger Error] {e}")
         finally:
@@ -247,5 +604,157 @@ class TaggerWorker(QThread):
 
         self.finished_signal.emit()
 
+    def _write_tags(self, db, entries, image_ids, db_mode, model_id):
+        """写入一组图片的预测结果 (单个事务)；覆盖模式下先清空这些图片的旧标签，中途停止时未处理的图片不受影响"""
+        clear = image_ids if self.tag_action == 'overwrite' else ()
+        with metrics.timer('db.write_tags'):
+            db.add_image_tags_bulk(entries, db_mode, model_id, clear_image_ids=clear)
+
+    def _run_rules(self, db):
+        """规则打标：每批只取 id / 路径，规则在内存中求值，结果经 add_image_tags_bulk 一次写入"""
+        try:
+            rules = RuleSet.parse(self.regex_pattern or '')
+        except ValueError as e:
+            print(f"[ERROR] Rules: {e}")
+            self.status_signal.emit(str(e))
+            return
+        if not rules.rules:
+            return
+        db_mode = 'unique' if self.tag_action == 'unique' else 'append'
+        processed_count = 0
+        written = 0
+
+        for chunk_ids in self._iter_id_chunks(db, self.RULE_CHUNK_SIZE):
+            if not self._is_running:
+                break
+            total = max(1, self._total_estimate(db, processed_count))
+            rows = db.get_image_rows(chunk_ids)
+            if self.tag_action == 'skip':
+                tagged = db.get_tagged_image_ids(chunk_ids)
+                metrics.count('tagging.skipped', len(tagged))
+                rows = [row for row in rows if row.id not in tagged]
+
+            with metrics.timer('rules.evaluate'):
+                entries = list(rules.entries(rows))
+            # 覆盖模式与 AI 打标一致：本批图片先清空旧标签，即使没有命中任何规则
+            clear = [row.id for row in rows] if self.tag_action == 'overwrite' else ()
+            with metrics.timer('db.write_tags'):
+                db.add_image_tags_bulk(entries, db_mode, clear_image_ids=clear)
+            metrics.count('tagging.tags_written', len(entries))
+            written += len(entries)
+            metrics.count('tagging.images', len(rows))
+
+            processed_count += len(chunk_ids)
+            self.progress_signal.emit(processed_count, total)
+            self.status_signal.emit(f"规则打标: {processed_count}/{total}")
+            if self.queue_job_id is not None:
+                db.ack_tag_queue(self.queue_job_id, chunk_ids)
+        db.optimize(written)
+
+    def stop(self):
+        self._is_running = False
+
+# ==========================================
+# 4. 模型后台加载线程
+# ==========================================
+class ModelLoadWorker(QThread):
+    """在后台线程中通过 ModelRegistry 加载 (或从缓存取) 模型，避免冻结界面"""
+    loaded_signal = Signal(object)   # TaggerEngine
+    failed_signal = Signal(str)
+
+    def __init__(self, registry, model_name=None):
+        super().__init__()
+        self.registry = registry
+        self.model_name = model_name
+
+    def run(self):
+        try:
+            with metrics.timer('model.load'):
+                engine = self.registry.load(self.model_name)
+        except Exception as e:
+            print(f"[Model Error] {e}")
+            self.failed_signal.emit(str(e))
+            return
+        self.loaded_signal.emit(engine)
+
+# ==========================================
+# 5. 标签导出 / 导入线程
+# ==========================================
+class TagTransferWorker(QThread):
+    """在后台执行 tag_io 的导出 / 导入，避免大图库时冻结界面"""
+    progress_signal = Signal(int)
+    # 导出: 处理的图片数；导入: 写入标签的图片数
+    finished_signal = Signal(int, str)
+    failed_signal = Signal(str)
+
+    def __init__(self, db_path, action, fmt, path=None, filters=None, mode='append', min_confidence=0.0):
+        super().__init__()
+        self.db_path = db_path
+        self.action = action
+        self.fmt = fmt
+        self.path = path
+        self.filters = filters
+        self.mode = mode
+        self.min_confidence = min_confidence
+
+    def run(self):
+        import tag_io
+        db = ImageDB(self.db_path)
+        try:
+            with profile_job(f'tag_{self.action}'), metrics.timer(f'tag_io.{self.action}'):
+                if self.action == 'export':
+                    count = tag_io.export_tags(db, self.fmt, self.path, self.filters, self.min_confidence,
+                                               self.progress_signal.emit)
+                    message = f"已导出 {count} 张图片的标签"
+                else:
+                    result = tag_io.import_tags(db, self.fmt, self.path, self.filters, self.mode,
+                                                self.progress_signal.emit)
+                    count = result['images']
+                    message = f"已导入 {result['images']} 张图片的 {result['tags']} 个标签"
+                    if result['unknown']:
+                        message += f"，{result['unknown']} 个路径不在库中"
+                    db.optimize(result['tags'])
+        except Exception as e:
+            print(f"[Tag IO Error] {e}")
+            self.failed_signal.emit(str(e))
+            return
+        self.finished_signal.emit(count, message)
+
+# ==========================================
+# 6. 规则预览线程
+# ==========================================
+class RulePreviewWorker(QThread):
+    """在后台对打标范围试运行规则 (只读)，大图库时不冻结界面"""
+    progress_signal = Signal(int)     # 已检查的图片数
+    finished_signal = Signal(dict)    # RuleSet.preview 的结果
+    failed_signal = Signal(str)
+
+    def __init__(self, db_path, rules, image_ids=None, filters=None):
+        super().__init__()
+        self.db_path = db_path
+        self.rules = rules
+        self.image_ids = image_ids
+        self.filters = filters
+        self._is_running = True
+
+    def _batches(self, db):
+        seen = 0
+        for rows in iter_rule_rows(db, self.image_ids, self.filters):
+            if not self._is_running:
+                return
+            yield rows
+            seen += len(rows)
+            self.progress_signal.emit(seen)
+
+    def run(self):
+        try:
+            result = self.rules.preview(self._batches(ImageDB(self.db_path)))
+        except Exception as e:
+            print(f"[Rule Preview Error] {e}")
+            self.failed_signal.emit(str(e))
+            return
+        if self._is_running:
+            self.finished_signal.emit(result)
+
     def stop(self):
-        self._is_running = False
\ No newline at end of file
+        self._is_running = False
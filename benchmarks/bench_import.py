@@ -0,0 +1,40 @@
+"""导入基准：ImportWorker.run() 写入速率 (同步调用，不启动线程)"""
+import os
+import time
+
+from common import make_image_tree, run_standalone, BenchResults
+
+def run(args, workdir, results: BenchResults):
+    print("[import]")
+    root = os.path.join(workdir, "scan_tree")
+    if not os.path.isdir(root):
+        make_image_tree(root, args.files)
+
+    from database import ImageDB
+    from workers import ImportWorker
+
+    db_path = os.path.join(workdir, "import_bench.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    db = ImageDB(db_path)
+
+    counts = []
+    worker = ImportWorker(db_path, [root], recursive=True)
+    worker.finished_signal.connect(lambda count, _job: counts.append(count))
+    start = time.perf_counter()
+    worker.run()
+    results.record("import.fresh", time.perf_counter() - start, counts[0] if counts else None, files=args.files)
+
+    # 再导入一次：全部命中 INSERT OR IGNORE，测重复导入开销
+    counts.clear()
+    job_id = db.create_import_job()
+    worker = ImportWorker(db_path, [root], recursive=True, tag_job_id=job_id)
+    worker.finished_signal.connect(lambda count, _job: counts.append(count))
+    start = time.perf_counter()
+    worker.run()
+    results.record("import.reimport_with_tag_queue", time.perf_counter() - start,
+                   counts[0] if counts else None, files=args.files)
+
+if __name__ == "__main__":
+    run_standalone("Import benchmark", run)
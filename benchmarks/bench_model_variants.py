@@ -0,0 +1,107 @@
+"""
+模型变体基准：速度 (images/sec) 与标签一致性 (以 fp32 基础模型的输出为参照的 precision / recall)
+
+用法:
+    python benchmarks/bench_model_variants.py --folder 本地样本目录 [--base model] [--limit 200] [--json out.json]
+
+先用 app/model_tools.py 生成 <base>.int8.onnx / <base>.opt.onnx，
+本脚本会测试 models 目录中基础模型及其所有变体。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+from model_registry import ModelRegistry
+from utils import is_image_file
+
+def list_images(folder, limit):
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if is_image_file(name):
+                paths.append(os.path.join(root, name))
+                if len(paths) >= limit:
+                    return paths
+    return paths
+
+def run_model(engine, paths, threshold, warmup=3):
+    for path in paths[:warmup]:
+        engine.predict(path, threshold)
+    start = time.perf_counter()
+    outputs = [set(tag for tag, _ in engine.predict(path, threshold)) for path in paths]
+    elapsed = time.perf_counter() - start
+    return outputs, len(paths) / elapsed if elapsed > 0 else 0.0
+
+def agreement(reference, candidate):
+    """按标签计数的 micro precision / recall，以及完全一致的图片比例"""
+    tp = fp = fn = exact = 0
+    for ref, got in zip(reference, candidate):
+        tp += len(ref & got)
+        fp += len(got - ref)
+        fn += len(ref - got)
+        exact += ref == got
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, exact / max(1, len(reference))
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX model variant benchmark")
+    parser.add_argument("--folder", required=True, help="样本图片目录")
+    parser.add_argument("--models-dir", default=os.path.join(APP_DIR, "models"))
+    parser.add_argument("--base", help="基础模型名 (默认取注册表默认模型)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.models_dir)
+    base = args.base or registry.default_name()
+    if base is None or registry.get(base) is None:
+        print(f"Base model not found in {args.models_dir}")
+        return 1
+    variants = [info.name for info in registry.list_models() if info.base_name == base and info.name != base]
+
+    paths = list_images(args.folder, args.limit)
+    if not paths:
+        print(f"No images in {args.folder}")
+        return 1
+
+    results = []
+    reference = None
+    for name in [base] + variants:
+        load_start = time.perf_counter()
+        engine = registry.load(name)
+        load_s = time.perf_counter() - load_start
+        outputs, ips = run_model(engine, paths, args.threshold)
+        entry = {
+            'model': name,
+            'file_mb': round(os.path.getsize(registry.get(name).model_path) / 1e6, 1),
+            'load_s': round(load_s, 2),
+            'images_per_sec': round(ips, 2),
+        }
+        if reference is None:
+            reference = outputs
+            entry.update(precision=1.0, recall=1.0, exact_match=1.0)
+        else:
+            p, r, exact = agreement(reference, outputs)
+            entry.update(precision=round(p, 4), recall=round(r, 4), exact_match=round(exact, 4))
+        results.append(entry)
+        registry.unload(name)
+
+    print(f"Images: {len(paths)}  Reference: {base}")
+    print(f"{'model':<20}{'MB':>8}{'load s':>8}{'img/s':>9}{'prec':>8}{'recall':>8}{'exact':>8}")
+    for e in results:
+        print(f"{e['model']:<20}{e['file_mb']:>8}{e['load_s']:>8}{e['images_per_sec']:>9}"
+              f"{e['precision']:>8}{e['recall']:>8}{e['exact_match']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'images': len(paths), 'reference': base, 'results': results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+预处理微基准：对比旧版逐图分配数组的实现与 Preprocessor (预分配缓冲区) 的单张耗时
+
+用法:
+    python benchmarks/bench_preprocess.py [--count 50] [--folder 本地图片目录]
+不指定 --folder 时在临时目录生成随机噪声图片 (几种常见尺寸)
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from ai_tagger import Preprocessor, MODEL_INPUT_SIZE, RESIZE_STRETCH, RESIZE_LETTERBOX
+from utils import is_image_file
+
+SYNTHETIC_SIZES = [(1024, 1024), (1920, 1080), (832, 1216), (3000, 4000)]
+
+def legacy_preprocess(image_path):
+    """旧版 preprocess_image 的实现，作为基线"""
+    image = Image.open(image_path).convert('RGB')
+    image = ImageOps.exif_transpose(image)
+    image = image.resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), Image.Resampling.LANCZOS)
+    img_np = np.array(image).astype(np.float32)
+    img_np = img_np / 255.0
+    img_np = img_np.transpose((2, 0, 1))
+    return np.expand_dims(img_np, axis=0)
+
+def make_synthetic_images(folder, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        w, h = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        ext = ".jpg" if i % 2 == 0 else ".png"
+        path = os.path.join(folder, f"synthetic_{i:04d}{ext}")
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+def time_per_image(func, paths):
+    start = time.perf_counter()
+    for path in paths:
+        func(path)
+    return (time.perf_counter() - start) / len(paths) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess micro-benchmark")
+    parser.add_argument("--count", type=int, default=24)
+    parser.add_argument("--folder", help="使用本地图片目录代替合成图片")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.folder:
+            paths = [os.path.join(args.folder, f) for f in sorted(os.listdir(args.folder)) if is_image_file(f)]
+            paths = paths[:args.count]
+        else:
+            paths = make_synthetic_images(tmp, args.count)
+        if not paths:
+            print("No images found.")
+            return
+
+        # 预热文件缓存，避免第一次读取磁盘影响结果
+        for path in paths:
+            with open(path, 'rb') as f:
+                f.read()
+
+        print(f"Images: {len(paths)}  Input: {MODEL_INPUT_SIZE}x{MODEL_INPUT_SIZE}")
+        print(f"{'variant':<28}{'ms/image':>10}")
+        print(f"{'legacy':<28}{time_per_image(legacy_preprocess, paths):>10.2f}")
+        for mode in (RESIZE_STRETCH, RESIZE_LETTERBOX):
+            for dtype in (np.float32, np.float16):
+                pre = Preprocessor(MODEL_INPUT_SIZE, mode, dtype)
+                name = f"{mode}/{np.dtype(dtype).name}"
+                print(f"{name:<28}{time_per_image(pre.process, paths):>10.2f}")
+
+        # 只测 "写入缓冲区" 这一步 (不含解码/缩放)
+        pre = Preprocessor(MODEL_INPUT_SIZE)
+        resized = pre.load_image(paths[0])
+        loops = 200
+        start = time.perf_counter()
+        for _ in range(loops):
+            pre.write(resized)
+        write_ms = (time.perf_counter() - start) / loops * 1000
+        start = time.perf_counter()
+        for _ in range(loops):
+            np.expand_dims((np.array(resized).astype(np.float32) / 255.0).transpose((2, 0, 1)), axis=0)
+        legacy_ms = (time.perf_counter() - start) / loops * 1000
+        print(f"\nnormalize+layout only: legacy {legacy_ms:.3f} ms, buffered {write_ms:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""查询基准：get_images_paginated 深分页 / 多标签筛选，ImageResultCursor 顺序遍历，单图标签与整库标签解码"""
+import os
+import time
+
+from common import make_synthetic_db, best_of, run_standalone, BenchResults
+
+def run(args, workdir, results: BenchResults):
+    print("[query]")
+    db_path = os.path.join(workdir, f"query_bench_{args.images}.db")
+    start = time.perf_counter()
+    db, tag_names = make_synthetic_db(db_path, args.images)
+    results.record("query.build_synthetic_db", time.perf_counter() - start, args.images)
+
+    page_size = 50
+    last_page = max(1, (args.images + page_size - 1) // page_size)
+    for label, page in (("first", 1), ("middle", last_page // 2), ("last", last_page)):
+        seconds = best_of(lambda: db.get_images_paginated(page, page_size, None))
+        results.record(f"query.page.{label}", seconds, images=args.images, page=page)
+
+    # 热门 / 中等 / 长尾标签组合 (tag_names 按热度降序)
+    n = len(tag_names)
+    tag_sets = {
+        'hot1': [tag_names[0]],
+        'hot2': tag_names[:2],
+        'hot_rare': [tag_names[0], tag_names[n // 2]],
+        'mid3': [tag_names[10], tag_names[20], tag_names[40]],
+        'rare1': [tag_names[-1]],
+    }
+    for label, tags in tag_sets.items():
+        filters = {'tags': tags}
+        seconds = best_of(lambda: db.get_images_paginated(1, page_size, filters))
+        results.record(f"query.tags.{label}.first_page", seconds, images=args.images)
+        _, total = db.get_images_paginated(1, 1, filters)
+        deep = max(1, (total + page_size - 1) // page_size)
+        seconds = best_of(lambda: db.get_images_paginated(deep, page_size, filters))
+        results.record(f"query.tags.{label}.last_page", seconds, images=args.images, matches=total)
+
+    # 结果缓存：首次查询 (COUNT + 取 id 列表) 与之后翻页 (切片 + WHERE id IN) 的对比
+    from database import result_cache
+    filters = {'tags': tag_sets['hot1']}
+    def cold():
+        result_cache.clear()
+        db.get_images_paginated(2, page_size, filters)
+    results.record("query.result_cache.cold", best_of(cold), images=args.images)
+    results.record("query.result_cache.warm_page", best_of(lambda: db.get_images_paginated(3, page_size, filters)),
+                   images=args.images)
+
+    seconds = best_of(lambda: db.get_tag_stats())
+    results.record("query.tag_stats", seconds, images=args.images)
+
+    # 单图标签：tag_blob 解码 vs JOIN image_tags；整库标签解码为 NumPy 数组
+    db.refresh_tag_blobs()
+    sample_ids = range(1, args.images + 1, max(1, args.images // 1000))
+    results.record("query.image_tags.blob", best_of(lambda: [db.get_tags_for_image(i) for i in sample_ids]),
+                   len(sample_ids), images=args.images)
+    def join():
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        for i in sample_ids:
+            db._get_tags_for_image_join(cursor, i)
+        conn.close()
+    results.record("query.image_tags.join", best_of(join), len(sample_ids), images=args.images)
+    start = time.perf_counter()
+    vectors = db.load_tag_vectors()
+    results.record("query.tag_vectors.load", time.perf_counter() - start, len(vectors['tag_id']), images=args.images)
+
+    # 查看器游标：从头顺序走完前 N 项 (窗口之间走键集分页)
+    from database import ImageResultCursor
+    steps = min(args.images, 20_000)
+    def walk():
+        cursor = ImageResultCursor(db, None)
+        for i in range(steps):
+            cursor[i]
+    results.record("query.cursor.walk", best_of(walk, 1), steps, images=args.images)
+
+if __name__ == "__main__":
+    run_standalone("Query benchmark", run)
@@ -0,0 +1,33 @@
+"""规则打标基准：规则求值 (试运行) 与经 add_image_tags_bulk 批量写入的吞吐"""
+import os
+import time
+
+from common import make_synthetic_db, run_standalone, BenchResults
+
+RULES = """
+name: ^img_(\\d)
+folder: ^(\\d*7)$ => folder_\\1
+path: ^d(\\d)$ => d\\1
+stem: (?i)^IMG_\\d+5$ => five
+"""
+
+def run(args, workdir, results: BenchResults):
+    print("[rules]")
+    from tag_rules import RuleSet, iter_rows
+
+    db_path = os.path.join(workdir, f"rules_bench_{args.images}.db")
+    db, _ = make_synthetic_db(db_path, args.images, mean_tags=0)
+    rules = RuleSet.parse(RULES)
+
+    start = time.perf_counter()
+    preview = rules.preview(iter_rows(db, filters={}))
+    results.record("rules.preview", time.perf_counter() - start, preview['images'], tags=preview['tags'])
+
+    start = time.perf_counter()
+    written = 0
+    for rows in iter_rows(db, filters={}):
+        written += db.add_image_tags_bulk(rules.entries(rows))
+    results.record("rules.apply", time.perf_counter() - start, args.images, tags=written)
+
+if __name__ == "__main__":
+    run_standalone("Rule tagging benchmark", run)
@@ -0,0 +1,19 @@
+"""扫描基准：utils.scan_directory_generator 遍历合成目录树"""
+import os
+import time
+
+from common import make_image_tree, run_standalone, BenchResults
+
+def run(args, workdir, results: BenchResults):
+    print("[scan]")
+    root = os.path.join(workdir, "scan_tree")
+    if not os.path.isdir(root):
+        make_image_tree(root, args.files)
+
+    from utils import scan_directory_generator
+    start = time.perf_counter()
+    count = sum(1 for _ in scan_directory_generator(root, True))
+    results.record("scan.recursive", time.perf_counter() - start, count, files=args.files)
+
+if __name__ == "__main__":
+    run_standalone("Directory scan benchmark", run)
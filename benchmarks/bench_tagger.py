@@ -0,0 +1,93 @@
+"""
+打标基准：用 onnx.helper 生成一个极小的模型 (全局平均池化 -> 线性层 -> Sigmoid)，
+测 Preprocessor 与 TaggerEngine 推理的吞吐。模型本身几乎不耗时，结果主要反映解码/预处理/调度开销。
+需要 onnx 和 onnxruntime。
+"""
+import os
+import json
+import time
+
+from common import make_real_image, run_standalone, BenchResults
+
+N_TAGS = 1000
+
+def make_tiny_model(model_path: str, tags_path: str, n_tags: int = N_TAGS, channels_last: bool = True):
+    import numpy as np
+    import onnx
+    from onnx import helper, TensorProto, numpy_helper
+
+    from ai_tagger import MODEL_INPUT_SIZE
+    size = MODEL_INPUT_SIZE
+    if channels_last:
+        input_shape, axes = ['N', size, size, 3], [1, 2]
+    else:
+        input_shape, axes = ['N', 3, size, size], [2, 3]
+    weights = np.random.default_rng(0).standard_normal((3, n_tags)).astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["input"], ["pooled"], axes=axes, keepdims=0),
+            helper.make_node("MatMul", ["pooled", "weights"], ["logits"]),
+            helper.make_node("Sigmoid", ["logits"], ["output"]),
+        ],
+        "tiny_tagger",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, input_shape)],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ['N', n_tags])],
+        [numpy_helper.from_array(weights, "weights")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    onnx.save(model, model_path)
+    with open(tags_path, 'w', encoding='utf-8') as f:
+        json.dump([f"tag_{i}" for i in range(n_tags)], f)
+    return model_path, tags_path
+
+def run(args, workdir, results: BenchResults):
+    print("[tagger]")
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        print(f"  skipped: {e}")
+        return
+
+    from ai_tagger import Preprocessor, TaggerEngine, MODEL_INPUT_SIZE, RESIZE_STRETCH, RESIZE_LETTERBOX
+
+    image_dir = os.path.join(workdir, "tagger_images")
+    os.makedirs(image_dir, exist_ok=True)
+    n_images = max(8, args.thumbs // 2)
+    paths = []
+    for i in range(n_images):
+        path = os.path.join(image_dir, f"img_{i}.jpg")
+        if not os.path.exists(path):
+            make_real_image(path)
+        paths.append(path)
+
+    for mode in (RESIZE_STRETCH, RESIZE_LETTERBOX):
+        pre = Preprocessor(MODEL_INPUT_SIZE, mode)
+        start = time.perf_counter()
+        for path in paths:
+            pre.process(path)
+        results.record(f"tagger.preprocess.{mode}", time.perf_counter() - start, len(paths))
+
+    model_path, tags_path = make_tiny_model(os.path.join(workdir, "tiny.onnx"), os.path.join(workdir, "tiny.json"))
+    for batch_size in (1, 4, 8):
+        engine = TaggerEngine(model_path, tags_path, batch_size=batch_size, providers=['CPUExecutionProvider'])
+        engine.predict_batch(paths[:batch_size])  # 预热
+        start = time.perf_counter()
+        engine.predict_batch(paths)
+        results.record(f"tagger.predict_batch.bs{batch_size}", time.perf_counter() - start, len(paths))
+
+    # 只测推理 + 后处理 (缓冲区已填好)，不含解码
+    engine = TaggerEngine(model_path, tags_path, batch_size=8, providers=['CPUExecutionProvider'])
+    for i, path in enumerate(paths[:8]):
+        engine.preprocessor.process(path, i)
+    feed = {engine.input_name: engine.preprocessor.buffer(8)}
+    loops = 50
+    start = time.perf_counter()
+    for _ in range(loops):
+        probs = engine.session.run(None, feed)[0]
+        for row in probs:
+            engine.postprocess(row, engine.threshold)
+    results.record("tagger.inference_only.bs8", time.perf_counter() - start, loops * 8)
+
+if __name__ == "__main__":
+    run_standalone("Tagger benchmark", run)
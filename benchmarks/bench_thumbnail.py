@@ -0,0 +1,46 @@
+"""缩略图基准：ThumbnailWorker.run() 冷缓存 (解码 + 缩放 + 写入缓存) 与热缓存"""
+import os
+import time
+
+from common import make_real_image, run_standalone, BenchResults
+
+def run(args, workdir, results: BenchResults):
+    print("[thumbnail]")
+    try:
+        from PySide6.QtGui import QImage  # noqa: F401
+    except ImportError as e:
+        print(f"  skipped: {e}")
+        return
+
+    from database import ImageDB, ImageRow
+    from workers import ThumbnailWorker
+
+    image_dir = os.path.join(workdir, "thumb_images")
+    os.makedirs(image_dir, exist_ok=True)
+    db = ImageDB(os.path.join(workdir, "thumb_bench.db"))
+    rows = []
+    for i in range(args.thumbs):
+        path = os.path.join(image_dir, f"img_{i}.jpg" if i % 4 else f"img_{i}.png")
+        if not os.path.exists(path):
+            make_real_image(path)
+        img_id = db.add_image(path, os.path.basename(path), image_dir, os.path.getsize(path))
+        rows.append(ImageRow(img_id, path, os.path.basename(path)))
+
+    def run_worker(use_cache):
+        ready = []
+        worker = ThumbnailWorker(db.db_path, rows, use_cache=use_cache)
+        worker.thumbnail_ready.connect(lambda img_id, _qim, _buf: ready.append(img_id))
+        start = time.perf_counter()
+        worker.run()
+        return time.perf_counter() - start, len(ready)
+
+    # use_cache=False 不写缓存，之后第一次 use_cache=True 的运行即为冷缓存
+    seconds, count = run_worker(use_cache=False)
+    results.record("thumbnail.no_cache", seconds, count)
+    seconds, count = run_worker(use_cache=True)
+    results.record("thumbnail.cold_cache", seconds, count)
+    seconds, count = run_worker(use_cache=True)
+    results.record("thumbnail.warm_cache", seconds, count)
+
+if __name__ == "__main__":
+    run_standalone("Thumbnail benchmark", run)
@@ -0,0 +1,179 @@
+"""
+单写入线程 (app/db_writer.py) 的回归检查：并发写入、出错隔离、外部连接长时间持有写锁、独占操作 (VACUUM / 检查点)。
+
+用法:
+    python benchmarks/check_db_writer.py [--threads 8] [--ops 300] [--skip-lock]
+
+每项检查打印 ok / FAIL，有失败时返回非零。外部写锁的两项检查要等满 SQLite 的 busy timeout (5 秒)，
+共需约 15 秒；--skip-lock 跳过。所有等待都带超时，写线程卡死会表现为 FAIL 而不是检查本身挂起。
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import wait
+
+import common  # noqa: F401  (把 app/ 加入 sys.path)
+import db_writer
+from database import ImageDB
+
+# 单个写入在检查中最多等待的时间 (秒)
+WAIT_S = 60.0
+
+def hold_write_lock(db_path: str, seconds: float, started: threading.Event):
+    """另一条连接 (相当于另一个进程) 持有写锁 seconds 秒"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT INTO tags (name) VALUES ('external-lock')")
+    started.set()
+    time.sleep(seconds)
+    conn.execute("ROLLBACK")
+    conn.close()
+
+def check_concurrent(db: ImageDB, threads: int, ops: int) -> list:
+    errors = []
+    def worker(k):
+        try:
+            own = ImageDB(db.db_path) if k % 2 else db
+            for i in range(ops):
+                img = own.add_image(f"/lib/w{k}/img{i}.jpg", f"img{i}.jpg", f"/lib/w{k}", i)
+                own.add_image_tag(img, f"tag{i % 17}", 0.9, 1)
+                if i % 50 == 0:
+                    own.add_image_tags_bulk([(img, f"bulk{j}", 0.5, 1) for j in range(20)])
+        except Exception as e:
+            errors.append(f"worker {k}: {e!r}")
+    pool = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join(WAIT_S)
+    if any(t.is_alive() for t in pool):
+        return errors + ["workers did not finish"]
+    images = db.count_images({'path_keyword': '/lib/w'})
+    if images != threads * ops:
+        errors.append(f"expected {threads * ops} images, found {images}")
+    stats = db_writer.writer_stats()[db.db_path]
+    print(f"    {stats['ops']:,} ops in {stats['batches']:,} transactions, peak queue {stats['max_depth']}")
+    return errors
+
+def check_isolation(db: ImageDB) -> list:
+    writer = db_writer.get_writer(db.db_path, db.get_connection)
+    def good(cursor):
+        cursor.execute("INSERT INTO tags (name) VALUES ('isolation-ok')")
+    def bad(cursor):
+        cursor.execute("INSERT INTO tags (name) VALUES ('isolation-bad')")
+        raise ValueError("boom")
+    first, second = writer.submit(good), writer.submit(bad)
+    errors = []
+    first.result(WAIT_S)
+    try:
+        second.result(WAIT_S)
+        errors.append("failing operation did not raise")
+    except ValueError:
+        pass
+    tags = set(db.get_all_tags())
+    if 'isolation-ok' not in tags or 'isolation-bad' in tags:
+        errors.append(f"savepoint isolation broken: {sorted(t for t in tags if t.startswith('isolation'))}")
+    return errors
+
+def check_lock_retry(db: ImageDB) -> list:
+    """外部写锁比 busy timeout 长、但在重试预算之内：写入等锁释放后成功"""
+    started = threading.Event()
+    holder = threading.Thread(target=hold_write_lock, args=(db.db_path, 6.5, started))
+    holder.start()
+    started.wait()
+    try:
+        db.submit_write(lambda cursor: cursor.execute("INSERT INTO tags (name) VALUES ('after-retry')")).result(WAIT_S)
+    except Exception as e:
+        return [f"write behind an external lock failed: {e!r}"]
+    finally:
+        holder.join()
+    return [] if 'after-retry' in db.get_all_tags() else ["write after retry not committed"]
+
+def check_lock_failure(db: ImageDB) -> list:
+    """重试用尽：这一批收到异常 (不挂起)，写线程继续处理之后的写入"""
+    errors = []
+    saved = db_writer.LOCK_RETRIES
+    db_writer.LOCK_RETRIES = 0
+    started = threading.Event()
+    holder = threading.Thread(target=hold_write_lock, args=(db.db_path, 7.0, started))
+    holder.start()
+    started.wait()
+    try:
+        db.submit_write(lambda cursor: cursor.execute("INSERT INTO tags (name) VALUES ('lost')")).result(WAIT_S)
+        errors.append("write succeeded while another connection held the lock")
+    except sqlite3.OperationalError:
+        pass
+    except Exception as e:
+        errors.append(f"unexpected error: {e!r}")
+    finally:
+        db_writer.LOCK_RETRIES = saved
+        holder.join()
+    try:
+        db.submit_write(lambda cursor: cursor.execute("INSERT INTO tags (name) VALUES ('writer-alive')")).result(WAIT_S)
+    except Exception as e:
+        errors.append(f"writer unusable after a failed batch: {e!r}")
+    return errors
+
+def check_exclusive(db: ImageDB) -> list:
+    """VACUUM / 检查点在写线程上执行时，同时提交的写入排队完成"""
+    futures = [db.submit_write(lambda cursor, i=i: cursor.execute("INSERT INTO tags (name) VALUES (?)", (f"ex{i}",)))
+               for i in range(50)]
+    db.vacuum()
+    busy, _, _ = db.checkpoint('TRUNCATE')
+    futures += [db.submit_write(lambda cursor, i=i: cursor.execute("INSERT INTO tags (name) VALUES (?)", (f"ex{i}",)))
+                for i in range(50, 100)]
+    errors = []
+    _, not_done = wait(futures, WAIT_S)
+    if not_done:
+        return [f"{len(not_done)} queued writes still pending after {WAIT_S:.0f}s"]
+    errors += [f"queued write failed: {f.exception()!r}" for f in futures if f.exception()]
+    count = sum(1 for t in db.get_all_tags() if t.startswith('ex'))
+    if count != 100:
+        errors.append(f"expected 100 tags written around VACUUM, found {count}")
+    return errors
+
+def check_shutdown(db: ImageDB) -> list:
+    db_writer.shutdown_writers(WAIT_S)
+    try:
+        db.submit_write(lambda cursor: None).result(WAIT_S)
+        return ["write accepted after shutdown_writers"]
+    except RuntimeError:
+        return []
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Single-writer regression check")
+    parser.add_argument("--threads", type=int, default=8, help="并发写入线程数")
+    parser.add_argument("--ops", type=int, default=300, help="每个线程写入的图片数")
+    parser.add_argument("--skip-lock", action="store_true", help="跳过外部写锁检查 (各需等待 5 秒以上)")
+    args = parser.parse_args(argv)
+
+    checks = [
+        ("concurrent writes", lambda db: check_concurrent(db, args.threads, args.ops)),
+        ("failure isolation", check_isolation),
+    ]
+    if not args.skip_lock:
+        checks += [("external lock, retry", check_lock_retry), ("external lock, give up", check_lock_failure)]
+    checks += [("vacuum / checkpoint", check_exclusive), ("shutdown", check_shutdown)]
+
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db = ImageDB(os.path.join(workdir, "writer.db"))
+        for name, check in checks:
+            start = time.perf_counter()
+            try:
+                found = check(db)
+            except Exception as e:
+                found = [f"crashed: {e!r}"]
+            print(f"  {name:<24}{'ok' if not found else 'FAIL'}  {time.perf_counter() - start:.1f}s")
+            problems.extend(f"[{name}] {p}" for p in found)
+    for p in problems:
+        print(p)
+    print(f"{len(problems)} problem(s)")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+查询规划回归检查：记录 ImageDB 每个读取方法实际执行的 SQL，逐条 EXPLAIN QUERY PLAN，
+确认使用了预期的索引，且没有意外的全表扫描 (SCAN 表 不带 USING) 或额外排序 (USE TEMP B-TREE)。
+
+用法:
+    python benchmarks/check_query_plans.py [--images 20000] [--verbose]
+
+在小型合成库上分别检查 ANALYZE 之前 (新库 / 刚迁移) 与之后的规划，有不符合预期的查询时返回非零。
+新增或修改 ImageDB 的查询时在 make_cases 中登记：expect 为必须出现的规划片段，
+allow 为允许的规划片段 (包含其中任意一个的 SCAN / 临时 B 树不算问题)。
+"""
+import os
+import re
+import sys
+import random
+import argparse
+import tempfile
+
+import common  # noqa: F401  (把 app/ 加入 sys.path)
+from database import ImageDB, result_cache
+
+TAG_INDEX = 'idx_image_tags_tag_image'
+# SCAN 是整表 / 整个索引的遍历 (SEARCH 才是按条件定位)；临时 B 树是额外的排序 / 分组 / 去重
+FULL_SCAN = re.compile(r'^SCAN (\w+)')
+TEMP_BTREE = re.compile(r'USE TEMP B-TREE FOR ')
+# 只包含丢失文件的部分索引，遍历它不是整表扫描
+MISSING_INDEX = 'idx_images_missing_id'
+
+class TracingDB(ImageDB):
+    """记录每个连接上执行的语句 (参数已展开)，只用于规划检查"""
+    def __init__(self, db_path):
+        self.statements = None
+        super().__init__(db_path)
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, sql):
+        if self.statements is not None and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append(sql)
+
+    def capture(self, func):
+        # 结果缓存命中时不会执行筛选查询
+        result_cache.clear()
+        self.statements = []
+        try:
+            result = func(self)
+            if hasattr(result, '__next__'):
+                for _ in result:
+                    pass
+        finally:
+            statements, self.statements = self.statements, None
+        return statements
+
+def build_db(path: str, n_images: int, n_tags: int = 500, images_per_dir: int = 200, seed: int = 0) -> TracingDB:
+    """合成库：标签按 1/rank 分布，两级目录，少量丢失文件 / 未重建的 tag_blob / 打标队列"""
+    if os.path.exists(path):
+        os.remove(path)
+    db = TracingDB(path)
+    rng = random.Random(seed)
+    tag_names = [f"tag_{i:04d}" for i in range(n_tags)]
+    weights = [1.0 / (i + 1) for i in range(n_tags)]
+
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO tags (name) VALUES (?)", [(n,) for n in tag_names])
+    cursor.execute("INSERT INTO models (name, file_hash) VALUES ('bench', 'hash')")
+    cursor.execute("INSERT INTO import_jobs (status) VALUES ('running')")
+    cursor.execute("INSERT INTO watch_roots (path) VALUES ('/plans')")
+    folder_cache = {}
+    image_rows = []
+    tag_rows = []
+    for img_id in range(1, n_images + 1):
+        dir_path = f"/plans/d{img_id // images_per_dir // 10}/{img_id // images_per_dir}"
+        folder_id = db.ensure_folder(cursor, dir_path, folder_cache)
+        name = f"img_{img_id}.jpg"
+        image_rows.append((img_id, f"{dir_path}/{name}", name, dir_path, 1000, folder_id))
+        for tag_id in {rng.choices(range(1, n_tags + 1), weights)[0] for _ in range(rng.randint(0, 12))}:
+            tag_rows.append((img_id, tag_id, rng.uniform(0.35, 1.0), 1, 1 if img_id % 3 else None))
+    cursor.executemany("INSERT INTO images (id, file_path, file_name, dir_path, file_size, folder_id) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", image_rows)
+    cursor.executemany("INSERT INTO image_tags (image_id, tag_id, confidence, is_prediction, model_id) "
+                       "VALUES (?, ?, ?, ?, ?)", tag_rows)
+    cursor.execute("UPDATE images SET missing_since = CURRENT_TIMESTAMP WHERE id % 97 = 0")
+    cursor.execute("INSERT INTO tag_queue (job_id, image_id) SELECT 1, id FROM images WHERE id % 5 = 0")
+    conn.commit()
+    conn.close()
+    db.refresh_tag_blobs()
+    # 留一部分未重建的 tag_blob，覆盖回退路径
+    conn = db.get_connection()
+    conn.execute("UPDATE images SET tag_blob = NULL WHERE id % 50 = 0")
+    conn.commit()
+    conn.close()
+    return db
+
+def make_cases(n_images: int):
+    """
+    (名称, 调用, expect, allow)。列出整张表的查询 (标签 / 模型 / 目录 / 监视目录) 允许 SCAN 对应的表；
+    LIKE '%关键词%'、untagged、tagged_by_other_model 无法用索引定位，只能按 id 扫描逐行检查
+    """
+    last = n_images
+    hot, mid, rare = "tag_0000", "tag_0040", "tag_0400"
+    folder = {'folder_id': 3}
+    sub = {'folder_id': 2, 'include_subfolders': True}
+    return [
+        # 不筛选：COUNT(*) 遍历最小的索引，分页按 id 倒序扫描到 LIMIT 为止
+        ("page.all", lambda db: db.get_images_paginated(1, 50, None), [], ['SCAN i', 'SCAN images']),
+        ("page.tag_hot", lambda db: db.get_images_paginated(1, 50, {'tags': [hot]}), [TAG_INDEX], []),
+        ("page.tags_rare_hot", lambda db: db.get_images_paginated(1, 50, {'tags': [hot, rare]}), [TAG_INDEX], []),
+        ("page.tags_mid3", lambda db: db.get_images_paginated(1, 50, {'tags': [hot, mid, rare]}), [TAG_INDEX], []),
+        ("page.folder", lambda db: db.get_images_paginated(1, 50, folder), ['idx_images_folder_id'], []),
+        # 子目录：子树小时从 folder_id 索引取出再排序，子树占比大时 (有统计信息后) 按 id 扫描检查成员
+        ("page.subfolders", lambda db: db.get_images_paginated(1, 50, sub), [], ['ORDER BY', 'SCAN i']),
+        ("page.exact_dir", lambda db: db.get_images_paginated(1, 50, {'exact_dir': '/plans/d0/1'}),
+         ['idx_images_dir_path'], []),
+        ("page.keyword", lambda db: db.get_images_paginated(1, 50, {'path_keyword': 'img_1'}), [], ['SCAN i']),
+        ("page.untagged", lambda db: db.get_images_paginated(1, 50, {'untagged': True}), [], ['SCAN i']),
+        ("page.missing", lambda db: db.get_images_paginated(1, 50, {'missing': True}), [MISSING_INDEX], [MISSING_INDEX]),
+        ("page.other_model", lambda db: db.get_images_paginated(1, 50, {'tagged_by_other_model': 1}), [], ['SCAN i']),
+        ("refs.before", lambda db: db.get_image_refs({'tags': [hot]}, 200, before_id=last // 2), [TAG_INDEX], []),
+        ("refs.after", lambda db: db.get_image_refs(folder, 200, after_id=10), [], []),
+        ("count.tags", lambda db: db.count_images({'tags': [mid, rare]}), [TAG_INDEX], []),
+        ("chunks.subfolders", lambda db: db.iter_image_chunks(sub, 500), [], ['ORDER BY', 'SCAN i']),
+        ("rows.by_ids", lambda db: db.get_image_rows(list(range(1, 600))), [], []),
+        ("ids.by_paths", lambda db: db.get_image_ids_by_paths([f"/plans/d0/0/img_{i}.jpg" for i in range(1, 50)]),
+         ['sqlite_autoindex_images_1'], []),
+        ("dir.file_paths", lambda db: db.get_dir_file_paths('/plans/d0/1'), ['idx_images_dir_path'], []),
+        ("image.tags", lambda db: db.get_tags_for_image(7), [], []),
+        # 单张图片的十几行标签按置信度排序；models 只有几行
+        ("image.tags_stale", lambda db: db.get_tags_for_image(50), [], ['ORDER BY', 'SCAN m']),
+        ("tagged_ids", lambda db: db.get_tagged_image_ids(list(range(1, 600))), [], []),
+        ("tag.all", lambda db: db.get_all_tags(), [], ['SCAN tags']),
+        ("tag.stats", lambda db: db.get_tag_stats(), [], ['SCAN t']),
+        ("tag.counts", lambda db: db.get_tag_counts([hot, mid, rare]), [], []),
+        ("tag.names", lambda db: db._tag_names.clear() or db.get_tag_names([1, 2, 3]), [], []),
+        ("tagged_rows", lambda db: db.iter_tagged_rows(folder, 500), [], []),
+        ("models", lambda db: db.get_models(), ['idx_image_tags_model_id'], ['SCAN m']),
+        ("queue.fetch", lambda db: db.fetch_tag_queue(1, 500), [], []),
+        ("queue.count", lambda db: db.count_tag_queue(1), [], []),
+        ("job.status", lambda db: db.get_import_job_status(1), [], []),
+        ("watch_roots", lambda db: db.get_watch_roots(), [], ['SCAN watch_roots']),
+        ("missing.count", lambda db: db.count_missing(2), [], []),
+        ("missing.dirs", lambda db: db.get_missing_dirs(), [MISSING_INDEX], [MISSING_INDEX, 'GROUP BY', 'ORDER BY']),
+        ("missing.samples", lambda db: db.get_missing_samples('/plans/d0/1'), [], []),
+        ("missing.under", lambda db: db.get_missing_under('/plans/d0'), [], []),
+        ("folder.id", lambda db: db.get_folder_id('/plans/d0/1'), [], []),
+        ("folder.tree", lambda db: db.get_folder_tree(), [], ['SCAN f']),
+        ("folder.all", lambda db: db.get_all_folders(), [], ['SCAN folder_stats']),
+        ("folder.stats", lambda db: db.get_folder_stats(), [], ['SCAN folder_stats']),
+    ]
+
+def explain(db, sql: str):
+    conn = db.get_connection()
+    try:
+        return [row['detail'] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    finally:
+        conn.close()
+
+def check_case(db, name, func, expect, allow, verbose=False) -> list:
+    """返回问题列表 (空列表表示通过)"""
+    problems = []
+    plans = [(sql, explain(db, sql)) for sql in db.capture(func)]
+    if not plans:
+        return [f"{name}: 没有执行任何查询"]
+    details = [detail for _, plan in plans for detail in plan]
+    for sql, plan in plans:
+        if verbose:
+            print(f"  -- {name}: {' '.join(sql.split())[:160]}")
+            for detail in plan:
+                print(f"       {detail}")
+        for detail in plan:
+            if any(fragment in detail for fragment in allow):
+                continue
+            if FULL_SCAN.match(detail):
+                problems.append(f"{name}: 整表扫描 '{detail}' <- {' '.join(sql.split())[:120]}")
+            if TEMP_BTREE.search(detail):
+                problems.append(f"{name}: 额外排序 '{detail}' <- {' '.join(sql.split())[:120]}")
+    for fragment in expect:
+        if not any(fragment in detail for detail in details):
+            problems.append(f"{name}: 规划中没有 '{fragment}'")
+    return problems
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN regression check")
+    parser.add_argument("--images", type=int, default=20000, help="合成库图片数")
+    parser.add_argument("--verbose", action="store_true", help="打印每条语句的规划")
+    args = parser.parse_args(argv)
+
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db = build_db(os.path.join(workdir, "plans.db"), args.images)
+        for stage in ("fresh", "analyzed"):
+            if stage == "analyzed":
+                db.optimize()
+            print(f"[plans:{stage}]")
+            for name, func, expect, allow in make_cases(args.images):
+                found = check_case(db, name, func, expect, allow, args.verbose)
+                print(f"  {name:<24}{'ok' if not found else 'FAIL'}")
+                problems.extend(f"[{stage}] {p}" for p in found)
+    for p in problems:
+        print(p)
+    print(f"{len(problems)} problem(s)")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+标签导入 (app/tag_io.py) 的回归检查：外部文件中同一图片的行不连续、跨批分布时，
+覆盖模式只在第一次出现时清空旧标签，之后各批的标签都保留；图片数按 id 去重。
+
+用法:
+    python benchmarks/check_tag_import.py
+
+每项检查打印 ok / FAIL，有失败时返回非零。
+"""
+import os
+import sys
+import tempfile
+
+import common  # noqa: F401  (把 app/ 加入 sys.path)
+import tag_io
+from database import ImageDB
+
+def make_db(workdir: str, name: str, n_images: int) -> ImageDB:
+    """n_images 张图片，每张带一个旧的人工标签 old"""
+    db = ImageDB(os.path.join(workdir, name))
+    for i in range(n_images):
+        image_id = db.add_image(f"/lib/img{i}.jpg", f"img{i}.jpg", "/lib", i)
+        db.add_image_tag(image_id, "old", 1.0, 0)
+    return db
+
+def tags_of(db: ImageDB, file_path: str) -> set:
+    image_id = db.get_image_ids_by_paths([file_path])[file_path]
+    return {t['name'] for t in db.get_tags_for_image(image_id)}
+
+def check_interleaved_overwrite(workdir: str) -> list:
+    """批大小 2，行 a:x1, b:y1, a:x2 —— a 的两行分在两批，第二批不能再清空 a"""
+    db = make_db(workdir, "interleaved.db", 2)
+    importer = tag_io._TagImporter(db, 'overwrite', batch_size=2)
+    for file_path, tag in [("/lib/img0.jpg", "x1"), ("/lib/img1.jpg", "y1"), ("/lib/img0.jpg", "x2")]:
+        importer.add(file_path, tag)
+    importer.flush()
+    importer.close()
+    errors = []
+    if tags_of(db, "/lib/img0.jpg") != {"x1", "x2"}:
+        errors.append(f"img0 tags {sorted(tags_of(db, '/lib/img0.jpg'))}, expected ['x1', 'x2']")
+    if tags_of(db, "/lib/img1.jpg") != {"y1"}:
+        errors.append(f"img1 tags {sorted(tags_of(db, '/lib/img1.jpg'))}, expected ['y1']")
+    if importer.images != 2 or importer.tags_written != 3:
+        errors.append(f"counted {importer.images} images / {importer.tags_written} tags, expected 2 / 3")
+    return errors
+
+def check_shuffled_csv(workdir: str) -> list:
+    """导出的 CSV 打乱行序后以覆盖模式导入 (小批量)，每张图片的标签与导出前一致，旧标签被清空"""
+    source = make_db(workdir, "source.db", 40)
+    ids = source.get_image_ids_by_paths([f"/lib/img{i}.jpg" for i in range(40)])
+    source.add_image_tags_bulk([(image_id, f"t{j}", 0.9, 1) for image_id in ids.values() for j in range(5)],
+                               clear_image_ids=list(ids.values()))
+    csv_path = os.path.join(workdir, "tags.csv")
+    tag_io.export_tags(source, tag_io.FORMAT_CSV, csv_path)
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        header, *rows = f.readlines()
+    # 固定的交错顺序：同一图片的 5 行分散在整个文件中
+    rows = rows[::2] + rows[1::2]
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        f.writelines([header] + rows)
+
+    target = make_db(workdir, "target.db", 40)
+    importer = tag_io._TagImporter(target, 'overwrite', batch_size=7)
+    tag_io._import_csv(importer, csv_path, None)
+    importer.flush()
+    importer.close()
+    errors = []
+    expected = {f"t{j}" for j in range(5)}
+    wrong = [i for i in range(40) if tags_of(target, f"/lib/img{i}.jpg") != expected]
+    if wrong:
+        errors.append(f"{len(wrong)} images lost tags, e.g. img{wrong[0]}: {sorted(tags_of(target, f'/lib/img{wrong[0]}.jpg'))}")
+    if importer.images != 40 or importer.tags_written != 200:
+        errors.append(f"counted {importer.images} images / {importer.tags_written} tags, expected 40 / 200")
+    return errors
+
+def main(argv=None) -> int:
+    checks = [
+        ("interleaved overwrite", check_interleaved_overwrite),
+        ("shuffled csv overwrite", check_shuffled_csv),
+    ]
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, check in checks:
+            try:
+                found = check(workdir)
+            except Exception as e:
+                found = [f"crashed: {e!r}"]
+            print(f"  {name:<24}{'ok' if not found else 'FAIL'}")
+            problems.extend(f"[{name}] {p}" for p in found)
+    for p in problems:
+        print(p)
+    print(f"{len(problems)} problem(s)")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+基准测试公共工具：计时、结果记录 (JSON)、合成图片目录与合成数据库
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+class BenchResults:
+    """收集一组基准结果：每条包含名称、耗时、处理数量及其他参数"""
+    def __init__(self):
+        self.results = []
+
+    def record(self, name: str, seconds: float, count: int = None, **params):
+        entry = {'name': name, 'seconds': round(seconds, 6)}
+        if count:
+            entry['count'] = count
+            entry['per_sec'] = round(count / seconds, 2) if seconds > 0 else None
+        entry.update(params)
+        self.results.append(entry)
+        rate = f"  {entry['per_sec']:>12,.1f}/s" if count and entry['per_sec'] else ""
+        print(f"  {name:<40}{seconds * 1000:>12.2f} ms{rate}")
+        return entry
+
+    def extend(self, other):
+        self.results.extend(other.results)
+
+def best_of(func, repeat: int = 3) -> float:
+    """多次执行取最短耗时 (秒)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def write_results(results: BenchResults, path: str = None, args: dict = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    data = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'git': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': args or {},
+        },
+        'results': results.results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return path
+
+def make_parser(description: str):
+    """各基准脚本共用的命令行参数"""
+    import argparse
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--workdir", help="合成数据目录 (默认临时目录，结束后删除)")
+    parser.add_argument("--images", type=int, default=100_000, help="合成数据库的图片数 (建议 100k ~ 5M)")
+    parser.add_argument("--files", type=int, default=20_000, help="合成目录树的文件数")
+    parser.add_argument("--thumbs", type=int, default=100, help="缩略图基准使用的真实图片数")
+    parser.add_argument("--json", help="结果输出路径 (默认 benchmarks/results/<时间>.json)")
+    return parser
+
+def run_standalone(description: str, run):
+    """单独运行某个基准脚本：解析参数、准备工作目录、写出 JSON"""
+    import tempfile
+    args = make_parser(description).parse_args()
+    results = BenchResults()
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        run(args, args.workdir, results)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            run(args, workdir, results)
+    print(f"Results: {write_results(results, args.json, vars(args))}")
+
+# ================= 合成数据 =================
+
+def make_image_tree(root: str, n_files: int, files_per_dir: int = 500, fanout: int = 8,
+                    noise_ratio: float = 0.1, real_images: bool = False, seed: int = 0):
+    """
+    生成图片目录树：每个目录 files_per_dir 个文件，目录按 fanout 分层。
+    real_images=False 时只创建空文件 (测扫描/导入足够)；noise_ratio 比例的文件为非图片后缀。
+    """
+    rng = random.Random(seed)
+    exts = ['.jpg', '.png', '.webp', '.jpeg']
+    n_dirs = max(1, (n_files + files_per_dir - 1) // files_per_dir)
+    written = 0
+    for d in range(n_dirs):
+        # 目录编号转为多级路径，例如 d=19, fanout=8 -> 2/3
+        parts = []
+        x = d
+        while True:
+            parts.append(str(x % fanout))
+            x //= fanout
+            if x == 0:
+                break
+        dir_path = os.path.join(root, *reversed(parts), f"dir_{d}")
+        os.makedirs(dir_path, exist_ok=True)
+        for i in range(min(files_per_dir, n_files - written)):
+            if rng.random() < noise_ratio:
+                name = f"note_{i}.txt"
+            else:
+                name = f"img_{d}_{i}{rng.choice(exts)}"
+            path = os.path.join(dir_path, name)
+            if real_images and not name.endswith('.txt'):
+                make_real_image(path, rng)
+            else:
+                open(path, 'wb').close()
+        written += files_per_dir
+    return root
+
+def make_real_image(path: str, rng: random.Random = None, size=None):
+    import numpy as np
+    from PIL import Image
+    rng = rng or random.Random(0)
+    w, h = size or rng.choice([(1024, 768), (1920, 1080), (833, 1217), (512, 512)])
+    arr = np.random.default_rng(rng.randrange(1 << 30)).integers(0, 256, (h, w, 3), dtype=np.uint8)
+    ext = os.path.splitext(path)[1].lower()
+    fmt = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}.get(ext, 'PNG')
+    Image.fromarray(arr).save(path, fmt)
+
+def make_synthetic_db(db_path: str, n_images: int, n_tags: int = 5000, mean_tags: int = 12,
+                      zipf_a: float = 1.1, images_per_dir: int = 1000, seed: int = 0, batch: int = 20000):
+    """
+    生成合成数据库：标签按 Zipf 分布 (少数标签覆盖大量图片，长尾标签很稀有)，
+    每张图片的标签数在 mean_tags 附近波动。返回 (ImageDB, 标签名列表 按热度降序)
+    """
+    import numpy as np
+    from database import ImageDB
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db = ImageDB(db_path)
+    rng = np.random.default_rng(seed)
+    tag_names = [f"tag_{i:05d}" for i in range(n_tags)]
+    weights = 1.0 / np.arange(1, n_tags + 1) ** zipf_a
+    weights /= weights.sum()
+
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.executemany("INSERT INTO tags (name) VALUES (?)", [(n,) for n in tag_names])
+    cursor.execute("SELECT id FROM tags ORDER BY id")
+    tag_ids = np.array([row[0] for row in cursor.fetchall()])
+
+    folder_cache = {}
+    for start in range(0, n_images, batch):
+        end = min(n_images, start + batch)
+        image_rows = []
+        tag_rows = []
+        for img_id in range(start + 1, end + 1):
+            dir_path = os.path.join("/bench", f"d{img_id // images_per_dir // 100}", f"{img_id // images_per_dir}")
+            folder_id = db.ensure_folder(cursor, dir_path, folder_cache)
+            name = f"img_{img_id}.jpg"
+            image_rows.append((img_id, os.path.join(dir_path, name), name, dir_path, 100000, folder_id))
+        counts = rng.poisson(mean_tags, end - start)
+        for offset, k in enumerate(counts):
+            if k == 0:
+                continue
+            chosen = np.unique(rng.choice(n_tags, size=int(k), p=weights))
+            conf = rng.uniform(0.35, 1.0, len(chosen))
+            img_id = start + offset + 1
+            tag_rows.extend((img_id, int(tag_ids[t]), float(c), 1) for t, c in zip(chosen, conf))
+        cursor.executemany("INSERT INTO images (id, file_path, file_name, dir_path, file_size, folder_id) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", image_rows)
+        cursor.executemany("INSERT INTO image_tags (image_id, tag_id, confidence, is_prediction) "
+                           "VALUES (?, ?, ?, ?)", tag_rows)
+        conn.commit()
+    conn.close()
+    return db, tag_names
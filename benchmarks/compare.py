@@ -0,0 +1,51 @@
+"""
+对比两次基准结果，耗时增加超过容差的项视为回归 (退出码 1)
+
+用法:
+    python benchmarks/compare.py results/old.json results/new.json [--tolerance 0.15]
+"""
+import sys
+import json
+import argparse
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('meta', {}), {entry['name']: entry for entry in data['results']}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="允许的相对变慢比例 (默认 15%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="两边都低于此耗时的项不判定回归 (计时噪声)")
+    args = parser.parse_args()
+
+    base_meta, base = load(args.baseline)
+    cur_meta, cur = load(args.current)
+    print(f"baseline: {base_meta.get('git')} {base_meta.get('timestamp')}")
+    print(f"current:  {cur_meta.get('git')} {cur_meta.get('timestamp')}")
+    print(f"{'benchmark':<40}{'base ms':>12}{'cur ms':>12}{'change':>10}")
+
+    regressions = []
+    for name in sorted(set(base) | set(cur)):
+        if name not in base or name not in cur:
+            side = "new" if name not in base else "removed"
+            print(f"{name:<40}{'':>12}{'':>12}{side:>10}")
+            continue
+        b, c = base[name]['seconds'], cur[name]['seconds']
+        change = (c - b) / b if b > 0 else 0.0
+        flag = ""
+        if change > args.tolerance and max(b, c) * 1000 >= args.min_ms:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<40}{b * 1000:>12.2f}{c * 1000:>12.2f}{change:>+10.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+运行全部基准并把结果写入 JSON，便于不同版本之间对比 (见 compare.py)
+
+用法:
+    python benchmarks/run_all.py [--images 100000] [--files 20000] [--thumbs 100] [--only scan,query]
+    python benchmarks/run_all.py --images 5000000 --workdir D:/bench   # 大规模，合成数据保留复用
+
+--images 建议 100k ~ 5M；合成数据库的生成时间随规模线性增长。
+"""
+import os
+import sys
+import tempfile
+
+from common import make_parser, write_results, BenchResults
+import bench_scan
+import bench_import
+import bench_query
+import bench_tagger
+import bench_rules
+import bench_thumbnail
+
+SUITES = {
+    'scan': bench_scan.run,
+    'import': bench_import.run,
+    'query': bench_query.run,
+    'tagger': bench_tagger.run,
+    'rules': bench_rules.run,
+    'thumbnail': bench_thumbnail.run,
+}
+
+def main():
+    parser = make_parser("Run all benchmarks")
+    parser.add_argument("--only", help="逗号分隔的子集: " + ",".join(SUITES))
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SUITES)
+    unknown = [n for n in names if n not in SUITES]
+    if unknown:
+        print(f"Unknown suites: {', '.join(unknown)}")
+        return 1
+
+    results = BenchResults()
+    def run_suites(workdir):
+        for name in names:
+            SUITES[name](args, workdir, results)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        run_suites(args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            run_suites(workdir)
+
+    print(f"Results: {write_results(results, args.json, vars(args))}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())